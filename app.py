@@ -1,5 +1,5 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, g, abort
-import os, sqlite3, datetime
+from flask import Flask, render_template, stream_template, Response, request, redirect, url_for, session, flash, g, abort, jsonify, before_render_template, template_rendered
+import os, sqlite3, datetime, time, uuid, hmac
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 from sqlite3 import IntegrityError
@@ -7,38 +7,104 @@ import re
 
 from src.init_db import setup 
 from src.seed import seed
-from src.logg import logger
-from src.gem import gemini_chat
+from src.logg import logger, REQUEST_ID_KEY
+from src.db import get_db, close_db, start_checkpointer, connection
+from src.search import search_doctors, DOCTOR_COLUMNS
+from src.availability import NEXT_AVAILABLE_SQL
+from src.ratings import rating_histogram
+from src.pagination import doctors_page, page_size_arg
+from src import cache, chat_memory, response_cache, metrics
+from src.schedules import materialize, start_materializer, add_template, deactivate_template, add_exception, WEEKDAY_NAMES
+from src.booking import book_slot, cancel_appointment as cancel_appointment_booking, FULL, DUPLICATE, NOT_FOUND, CANCELLED
+from src.gem import gemini_chat, gemini_chat_stream, usage_stats, preload_model
+from src.concurrency import llm_stats
+from src.tools import tool_stats
 
 BASE = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE, 'data', 'clinicBook.db') 
 
+# features list for the home page template (static)
+HOME_FEATURES = [
+    {'icon': 'bi-calendar-check', 'title': 'Instant Booking', 'desc': 'Book in seconds with instant confirmation', 'color': 'primary'},
+    {'icon': 'bi-geo-alt', 'title': 'Nearby Clinics', 'desc': 'Find trusted clinics in your city', 'color': 'danger'},
+    {'icon': 'bi-people', 'title': 'Patient Friendly', 'desc': 'Easy for all ages, no tech skills needed', 'color': 'success'},
+    {'icon': 'bi-shield-lock', 'title': '100% Secure', 'desc': 'Your data is always safe and private', 'color': 'info'},
+    {'icon': 'bi-clock', 'title': '24/7 Availability', 'desc': 'Book anytime, anywhere', 'color': 'warning'},
+    {'icon': 'bi-star', 'title': 'Top Rated', 'desc': 'Verified doctors with patient reviews', 'color': 'purple'}
+]
+
 def create_app():
+    started = time.perf_counter()
     app = Flask(__name__)
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')
     app.config['DATABASE'] = DB_PATH
+    app.config['STREAM_DIRECTORY'] = os.environ.get('STREAM_DIRECTORY', '0') == '1'
+    # Bearer token for /metrics and the stats endpoints; without one they only answer localhost
+    app.config['STATS_TOKEN'] = os.environ.get('STATS_TOKEN', '')
 
     try:
         setup() 
         logger.info("Database setup completed successfully.")
         seed() 
+        # Roll every doctor's recurring schedule forward (SCHEDULE_WINDOW_DAYS)
+        with connection(app.config['DATABASE']) as conn:
+            materialize(conn)
     except Exception as e:
         logger.error(f"Error setting up database: {e}")
 
-    logger.info("\nApp and DB connected.")
+    # Periodic WAL checkpoint for this worker (DB_CHECKPOINT_INTERVAL, 0 disables)
+    start_checkpointer(app.config['DATABASE'])
+    # Keeps the schedule window rolling in long-running workers (SCHEDULE_MATERIALIZE_INTERVAL)
+    start_materializer(app.config['DATABASE'])
 
-    
-    def get_db():
-        if 'db' not in g:
-            g.db = sqlite3.connect(app.config['DATABASE'])
-            g.db.row_factory = sqlite3.Row
-        return g.db
-
-    @app.teardown_appcontext
-    def close_db(exc):
-        db = g.pop('db', None)
-        if db:
-            db.close()
+    # The Gemini SDK is imported on the first chat; CHAT_PRELOAD=1 loads it in the background instead
+    if os.environ.get('CHAT_PRELOAD', '0') == '1':
+        preload_model()
+
+    logger.info(f"\nApp and DB connected in {(time.perf_counter() - started) * 1000:.0f} ms.")
+
+
+    # Pooled, request-scoped connection (see src/db.py)
+    app.teardown_appcontext(close_db)
+
+    # Every log line of a request carries its id (src/logg.py); a proxy's X-Request-ID is kept
+    @app.before_request
+    def assign_request_id():
+        g.request_started = time.perf_counter()
+        request.environ[REQUEST_ID_KEY] = request.headers.get('X-Request-ID', '')[:64] or uuid.uuid4().hex
+
+    # Per-route latency for /metrics (src/metrics.py); streamed bodies count until the headers
+    def record_request(status):
+        started = g.pop('request_started', None)
+        if started is None or not metrics.METRICS:
+            return
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe('http_request_duration_seconds', time.perf_counter() - started, route=route, method=request.method)
+        metrics.inc('http_requests_total', route=route, method=request.method, status=status)
+
+    @app.after_request
+    def send_request_id(response):
+        response.headers['X-Request-ID'] = request.environ.get(REQUEST_ID_KEY, '')
+        record_request(response.status_code)
+        return response
+
+    @app.teardown_request
+    def record_failed_request(exc=None):
+        # after_request does not run for unhandled errors
+        if exc is not None:
+            record_request(500)
+
+    def template_started(sender, template, context, **extra):
+        g.setdefault('template_starts', []).append(time.perf_counter())
+
+    def template_finished(sender, template, context, **extra):
+        starts = g.get('template_starts')
+        if starts:
+            metrics.observe('template_render_seconds', time.perf_counter() - starts.pop(), template=template.name)
+
+    # Local functions: keep strong references or blinker drops them
+    before_render_template.connect(template_started, app, weak=False)
+    template_rendered.connect(template_finished, app, weak=False)
 
     #defining login required function
     def login_required(f):
@@ -52,15 +118,36 @@ def create_app():
         return decorated_function
     
 
-    # Helper function: update average rating
-    def update_avg_rating(db, doctor_id=None, clinic_id=None):
-        if doctor_id:
-            avg = db.execute("SELECT AVG(rating) FROM reviews WHERE doctor_id=?", (doctor_id,)).fetchone()[0]
-            db.execute("UPDATE doctors SET average_rating=? WHERE id=?", (avg or 0, doctor_id))
-        if clinic_id:
-            avg = db.execute("SELECT AVG(rating) FROM reviews WHERE clinic_id=?", (clinic_id,)).fetchone()[0]
-            db.execute("UPDATE clinics SET average_rating=? WHERE id=?", (avg or 0, clinic_id))
-        db.commit()
+    # Operational endpoints: SQL text, timings and counters are not for the public
+    def internal_only(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            token = app.config['STATS_TOKEN']
+            if token:
+                given = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+                allowed = hmac.compare_digest(given.encode(), token.encode())
+            else:
+                allowed = request.remote_addr in ('127.0.0.1', '::1')
+            if not allowed:
+                abort(403)
+            return f(*args, **kwargs)
+
+        return decorated_function
+
+    # Directory helpers: one keyset page per request (see src/pagination.py)
+    def directory_page(db):
+        return doctors_page(
+            db,
+            after=request.args.get('after'),
+            before=request.args.get('before'),
+            page_size=page_size_arg(request.args.get('per_page'))
+        )
+
+    def render_directory(**context):
+        # Stream the rendered page in chunks when ?stream=1 or STREAM_DIRECTORY is set
+        if request.args.get('stream') == '1' or app.config['STREAM_DIRECTORY']:
+            return Response(stream_template('doctors.html', **context))
+        return render_template('doctors.html', **context)
 
     # Injecting current user for templates
     @app.context_processor
@@ -78,21 +165,19 @@ def create_app():
     @app.route('/')
     def index():
         db = get_db()
-        clinics = db.execute(
-            'SELECT id, name, city, address, phone, average_rating FROM clinics ORDER BY name LIMIT 6'
-        ).fetchall()
-
-        # added: features list to send to template
-        features = [
-            {'icon': 'bi-calendar-check', 'title': 'Instant Booking', 'desc': 'Book in seconds with instant confirmation', 'color': 'primary'},
-            {'icon': 'bi-geo-alt', 'title': 'Nearby Clinics', 'desc': 'Find trusted clinics in your city', 'color': 'danger'},
-            {'icon': 'bi-people', 'title': 'Patient Friendly', 'desc': 'Easy for all ages, no tech skills needed', 'color': 'success'},
-            {'icon': 'bi-shield-lock', 'title': '100% Secure', 'desc': 'Your data is always safe and private', 'color': 'info'},
-            {'icon': 'bi-clock', 'title': '24/7 Availability', 'desc': 'Book anytime, anywhere', 'color': 'warning'},
-            {'icon': 'bi-star', 'title': 'Top Rated', 'desc': 'Verified doctors with patient reviews', 'color': 'purple'}
-        ]
+        # Which clinics are listed changes only with a new clinic ('clinics'),
+        # their ratings with a review of one of them ('clinic:<id>')
+        ids = cache.get_or_set('index:clinic_ids', ['clinics'], lambda: [
+            r['id'] for r in db.execute('SELECT id FROM clinics ORDER BY name LIMIT 6')
+        ])
+        clinics = cache.get_or_set('index:clinics', ['clinics'] + [f'clinic:{i}' for i in ids], lambda: [
+            dict(r) for r in db.execute(
+                'SELECT id, name, city, address, phone, average_rating FROM clinics '
+                f'WHERE id IN ({", ".join("?" * len(ids))}) ORDER BY name', ids
+            )
+        ])
 
-        return render_template('home.html', clinics=clinics, features=features)
+        return render_template('home.html', clinics=clinics, features=HOME_FEATURES)
 
     @app.route('/doctors', methods=['GET'])
     def doctors():
@@ -101,28 +186,19 @@ def create_app():
         specialization = request.args.get('specialization', '').strip()
 
         db = get_db()
-        base = '''
-            SELECT d.*, c.name as clinic_name, c.city as clinic_city, c.address as address
-            FROM doctors d
-            LEFT JOIN clinics c ON d.clinic_id = c.id
-            WHERE 1=1
-        '''
-        params = []
-
-        if q:
-            base += ' AND (d.name LIKE ? OR d.specialization LIKE ? OR c.name LIKE ?)'
-            params += [f'%{q}%'] * 3
-        if city:
-            base += ' AND c.city LIKE ?'
-            params.append(f'%{city}%')
-        if specialization:
-            base += ' AND d.specialization LIKE ?'
-            params.append(f'%{specialization}%')
-
-        rows = db.execute(base + ' ORDER BY d.name', params).fetchall()
-        return render_template(
-            'doctors.html',
+        if q or city or specialization:
+            # FTS5 trigram index, BM25-ranked and capped at SEARCH_LIMIT (see src/search.py)
+            rows = search_doctors(
+                db, q=q, city=city, specialization=specialization,
+                columns=f'{DOCTOR_COLUMNS}, {NEXT_AVAILABLE_SQL}'
+            )
+            page = None
+        else:
+            page = directory_page(db)
+            rows = page['rows']
+        return render_directory(
             doctors=rows,
+            page=page,
             q=q,
             city=city,
             specialization=specialization
@@ -180,7 +256,13 @@ def create_app():
             "INSERT INTO reviews (patient_id, doctor_id, clinic_id, rating, comment) VALUES (?, ?, ?, ?, ?)",
             (patient_id, doctor_id if doctor_id else None, clinic_id if clinic_id else None, rating, comment)
         )
-        update_avg_rating(db, doctor_id=doctor_id, clinic_id=clinic_id)
+        # average_rating/review_count/histogram are updated by the reviews triggers
+        db.commit()
+        if clinic_id:
+            # Only this clinic's page and home row; cached chat replies list ratings too
+            cache.invalidate(f'clinic:{clinic_id}', 'chat')
+        elif doctor_id:
+            cache.invalidate('doctors')
 
         flash("Thank you for your review!", "success")
         logger.info(f"New review submitted.")
@@ -210,24 +292,18 @@ def create_app():
             abort(404)
 
         if request.method == 'POST':
-            if slot['booked_count'] >= slot['capacity']:
+            # Atomic capacity check + increment (see src/booking.py)
+            result = book_slot(db, session['patient_id'], slot_id)
+
+            if result.status == FULL:
                 flash('Slot full', 'danger')
                 return redirect(url_for('doctor_detail', doc_id=slot['doctor_id']))
+            if result.status == DUPLICATE:
+                flash('You have already booked this slot.', 'info')
+                return redirect(url_for('dashboard'))
+            if result.status == NOT_FOUND:
+                abort(404)
 
-            # Incrementing booked count
-            db.execute(
-                'UPDATE slots SET booked_count = booked_count + 1 WHERE id = ?',
-                (slot_id,)
-            )
-
-            # Inserting appointment
-            db.execute(
-                '''INSERT INTO appointments (doctor_id, patient_id, slot_id, date, status)
-                VALUES (?, ?, ?, ?, ?)''',
-                (slot['doctor_id'], session['patient_id'], slot_id, slot['date'], 'booked')
-            )
-
-            db.commit()
             flash('Appointment booked successfully!', 'success')
             return redirect(url_for('dashboard'))
 
@@ -300,20 +376,15 @@ def create_app():
             (doctor_id,)
         ).fetchall()
 
-        # Calculate average rating
-        avg_rating = db.execute(
-            "SELECT AVG(rating) as avg FROM reviews WHERE doctor_id=?",
-            (doctor_id,)
-        ).fetchone()
-        if avg_rating and avg_rating['avg']:
-            doctor = dict(doctor)
-            doctor['average_rating'] = round(avg_rating['avg'], 1)
+        # Average rating is maintained incrementally on the doctors row
+        histogram = rating_histogram(db, 'doctor', doctor_id)
 
         return render_template(
             'dashboard_doctor.html',
             doctor=doctor,
             appointments=appointments,
-            reviews=reviews
+            reviews=reviews,
+            histogram=histogram
         )
 
 
@@ -338,9 +409,8 @@ def create_app():
 
     @app.route("/all_doctors")
     def all_doctors():
-        db = get_db()
-        doctors = db.execute("SELECT * FROM doctors").fetchall()
-        return render_template("doctors.html", doctors=doctors)
+        page = directory_page(get_db())
+        return render_directory(doctors=page['rows'], page=page)
 
 
     # User profile
@@ -462,6 +532,7 @@ def create_app():
                 (clinic, city)
             ).fetchone()
 
+            new_clinic = False
             if cur:
                 clinic_id = cur['id']
             else:
@@ -470,6 +541,7 @@ def create_app():
                     (clinic, city, address, phone)
                 )
                 clinic_id = r.lastrowid
+                new_clinic = True
 
             try:
                 db.execute(
@@ -479,6 +551,8 @@ def create_app():
                     (clinic_id, name, specialization, fees, email, password, phone, '')
                 )
                 db.commit()
+                # New doctor shows up in cached chat replies; a new clinic on the home page
+                cache.invalidate('doctors', *(['clinics'] if new_clinic else []))
                 flash('Doctor registered successfully ✅ Please login.', 'success')
                 return redirect(url_for('login'))
             except IntegrityError:
@@ -518,18 +592,27 @@ def create_app():
     @app.route('/clinic/<int:clinic_id>')
     def clinic_detail(clinic_id):
         db = get_db()
-        clinic = db.execute(
-            "SELECT * FROM clinics WHERE id=?", (clinic_id,)
-        ).fetchone()
-        if not clinic:
+
+        def load():
+            clinic = db.execute(
+                "SELECT * FROM clinics WHERE id=?", (clinic_id,)
+            ).fetchone()
+            if not clinic:
+                return None
+            reviews = db.execute(
+                '''SELECT r.rating, r.comment, p.name as patient_name, r.created_at
+                FROM reviews r
+                JOIN patients p ON r.patient_id = p.id
+                WHERE r.clinic_id=? ORDER BY r.created_at DESC''',
+                (clinic_id,)
+            ).fetchall()
+            return dict(clinic), [dict(r) for r in reviews]
+
+        # Cached until a review for this clinic bumps 'clinic:<id>'
+        data = cache.get_or_set(f'clinic_detail:{clinic_id}', [f'clinic:{clinic_id}'], load)
+        if not data:
             abort(404)
-        reviews = db.execute(
-            '''SELECT r.rating, r.comment, p.name as patient_name, r.created_at
-            FROM reviews r
-            JOIN patients p ON r.patient_id = p.id
-            WHERE r.clinic_id=? ORDER BY r.created_at DESC''',
-            (clinic_id,)
-        ).fetchall()
+        clinic, reviews = data
         return render_template("clinic_detail.html", clinic=clinic, reviews=reviews)
 
 
@@ -561,12 +644,12 @@ def create_app():
                 return redirect(url_for('dashboard'))
             return redirect(url_for('doctors_dashboard'))
 
-        # Instead of DELETE, just mark as cancelled
-        db.execute('UPDATE appointments SET status=? WHERE id=?', ('cancelled', appointment_id))
-        db.commit()
-
-        logger.info(f"An appointment cancelled. Unfortunately")
-        flash('Appointment cancelled.', 'success')
+        # Instead of DELETE, mark as cancelled and give the seat back to the slot
+        if cancel_appointment_booking(db, appointment_id) == CANCELLED:
+            logger.info(f"An appointment cancelled. Unfortunately")
+            flash('Appointment cancelled.', 'success')
+        else:
+            flash('Only booked appointments can be cancelled.', 'warning')
         if 'patient_id' in session:
             return redirect(url_for('dashboard'))
         return redirect(url_for('doctors_dashboard'))
@@ -613,8 +696,74 @@ def create_app():
             "SELECT * FROM slots WHERE doctor_id=? ORDER BY date, time",
             (session["doctor_id"],)
         ).fetchall()
+        templates = db.execute(
+            "SELECT * FROM schedule_templates WHERE doctor_id=? AND active=1 ORDER BY start_time",
+            (session["doctor_id"],)
+        ).fetchall()
+
+        return render_template("doctor_slots.html", slots=slots, templates=templates, weekday_names=WEEKDAY_NAMES)
+
+
+    # Add weekly recurring schedule and generate its slots
+    @app.route("/doctor/schedule/add", methods=["POST"])
+    def add_schedule():
+        if "doctor_id" not in session:
+            return redirect(url_for("doctor_login"))
 
-        return render_template("doctor_slots.html", slots=slots)
+        db = get_db()
+        try:
+            add_template(
+                db,
+                session["doctor_id"],
+                request.form.getlist("weekdays"),
+                request.form["start_time"],
+                request.form["end_time"],
+                slot_minutes=int(request.form.get("slot_minutes") or 30),
+                capacity=int(request.form.get("capacity") or 5),
+                valid_from=request.form.get("valid_from"),
+                valid_until=request.form.get("valid_until"),
+            )
+        except (KeyError, ValueError) as e:
+            flash(f"Invalid schedule: {e}", "danger")
+            return redirect(url_for("doctor_slots"))
+
+        created = materialize(db, doctor_id=session["doctor_id"])
+        flash(f"Weekly schedule saved. {created} slots created.", "success")
+        logger.info(f"Schedule template added, {created} slots materialized.")
+        return redirect(url_for("doctor_slots"))
+
+
+    # Stop a weekly schedule (existing slots stay)
+    @app.route("/doctor/schedule/delete/<int:template_id>")
+    def delete_schedule(template_id):
+        if "doctor_id" not in session:
+            return redirect(url_for("doctor_login"))
+
+        if deactivate_template(get_db(), template_id, session["doctor_id"]):
+            flash("Weekly schedule stopped. Existing slots were kept.", "info")
+        return redirect(url_for("doctor_slots"))
+
+
+    # Day off / blocked hours
+    @app.route("/doctor/schedule/exception", methods=["POST"])
+    def add_schedule_exception():
+        if "doctor_id" not in session:
+            return redirect(url_for("doctor_login"))
+
+        try:
+            removed = add_exception(
+                get_db(),
+                session["doctor_id"],
+                request.form["date"],
+                request.form.get("start_time"),
+                request.form.get("end_time"),
+                request.form.get("reason", ""),
+            )
+        except (KeyError, ValueError) as e:
+            flash(f"Invalid time off: {e}", "danger")
+            return redirect(url_for("doctor_slots"))
+        flash(f"Time off saved. {removed} open slots removed.", "info")
+        return redirect(url_for("doctor_slots"))
 
 
     # Add new slot
@@ -650,10 +799,36 @@ def create_app():
         flash("Slot deleted.", "info")
         return redirect(url_for("doctor_slots"))
         
+    # Cache hit/miss counters for this worker
+    @app.route("/cache_stats")
+    @internal_only
+    def cache_stats():
+        return jsonify(cache.stats())
+
+    # Prometheus metrics of every worker (src/metrics.py)
+    @app.route("/metrics")
+    @internal_only
+    def prometheus_metrics():
+        if not metrics.METRICS:
+            abort(404)
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    # Model slot usage, token counts and tool timings for this worker
+    @app.route("/chat_stats")
+    @internal_only
+    def chat_stats():
+        return jsonify(llm=llm_stats(), tokens=usage_stats(), tools=tool_stats(),
+                       memory=chat_memory.stats(), replies=response_cache.stats())
+
     @app.route("/chat_with_gemini", methods=["POST"])
     def chat_with_gemini_route():
         return gemini_chat(request)
 
+    # Same chat as Server-Sent Events (tool progress + text as it is generated)
+    @app.route("/chat_with_gemini/stream", methods=["POST"])
+    def chat_with_gemini_stream_route():
+        return gemini_chat_stream(request)
+
     # Logout
     @app.route('/logout')
     def logout():
@@ -667,6 +842,7 @@ def create_app():
 app = create_app()
 
 if __name__ == '__main__':
+    metrics.reset_dir()
     with app.app_context():
         setup()
         seed()
@@ -0,0 +1,37 @@
+import itertools
+import os
+
+# Threaded workers: a chat waiting on Gemini holds one thread, not the whole
+# worker, so /book and page requests keep being served alongside it.
+# GUNICORN_WORKER_CLASS=gevent works too (pip install gevent).
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '5000')}")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "200"))  # gevent only
+# Streamed chat replies can stay open for a while
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+# One log file per worker slot (app.worker<N>.log), as JSON lines; see src/logg.py
+os.environ.setdefault("LOG_PER_WORKER", "1")
+os.environ.setdefault("LOG_FORMAT", "json")
+
+# Worker metrics snapshots merged by /metrics (src/metrics.py)
+os.environ.setdefault("METRICS_DIR", os.path.join("./data", "metrics"))
+
+
+def on_starting(server):
+    # /metrics starts from zero with the server, not with each worker
+    metrics_dir = os.environ["METRICS_DIR"]
+    if os.path.isdir(metrics_dir):
+        for name in os.listdir(metrics_dir):
+            if name.endswith((".json", ".tmp")):
+                os.remove(os.path.join(metrics_dir, name))
+
+
+def pre_fork(server, worker):
+    # A replacement worker takes the lowest free slot, so restarts keep
+    # writing (and rotating) the same log files instead of adding new ones
+    used = {getattr(w, "log_slot", None) for w in server.WORKERS.values()}
+    worker.log_slot = next(n for n in itertools.count(1) if n not in used)
+    os.environ["LOG_WORKER_ID"] = str(worker.log_slot)
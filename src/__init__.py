@@ -1,12 +1,50 @@
 from .logg import logger
 from .init_db import setup
 from .seed import seed
-from .gem import get_db_connection, run_query, save_chat_log, get_chat_history_for_gemini, search_doctor_by_specialization, search_appointments_by_patient, search_clinic_by_city, search_doctor_by_name, gemini_chat, cancel_appointment_by_patient, get_response_text, complete_appointment_by_doctor, clean_text_for_display, generate_slots_by_doctor, get_doctor_schedule, book_appointment_by_patient, get_available_slots
+from .db import get_db, close_db, connection, get_pool
+from .booking import book_slot, cancel_appointment
+
+# The chat helpers live in src/gem.py, which is only imported when one of them
+# is first used, so `import src` (init_db, seed, CLI scripts) stays light.
+_GEM_EXPORTS = {
+    'get_db_connection',
+    'run_query',
+    'save_chat_log',
+    'get_chat_history_for_gemini',
+    'search_doctor_by_specialization',
+    'search_appointments_by_patient',
+    'search_clinic_by_city',
+    'search_doctor_by_name',
+    'gemini_chat',
+    'cancel_appointment_by_patient',
+    'get_response_text',
+    'complete_appointment_by_doctor',
+    'clean_text_for_display',
+    'generate_slots_by_doctor',
+    'get_doctor_schedule',
+    'book_appointment_by_patient',
+    'get_available_slots',
+    'search_available_doctors',
+}
+
+
+def __getattr__(name):
+    if name in _GEM_EXPORTS:
+        from . import gem
+        return getattr(gem, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = [
     'setup',
     'seed',
     'logger',
+    'get_db',
+    'close_db',
+    'connection',
+    'get_pool',
+    'book_slot',
+    'cancel_appointment',
     'get_db_connection',
     'run_query',
     'save_chat_log',
@@ -23,5 +61,6 @@ __all__ = [
     'get_doctor_schedule',
     'book_appointment_by_patient',
     'get_available_slots',
+    'search_available_doctors',
     'gemini_chat',
 ]
@@ -0,0 +1,121 @@
+import datetime
+import sqlite3
+
+from .logg import logger
+from .search import build_match
+
+# Queries over doctor_availability (AVAILABILITY_V6 in src/migrations.py):
+# one row per doctor per day with the seats still free, kept current by the
+# slots triggers on add/delete slot, booking and cancellation.
+
+# Correlated lookup used by the directory and search lists; one PK range seek per row
+NEXT_AVAILABLE_SQL = '''(
+    SELECT MIN(av.date) FROM doctor_availability av
+    WHERE av.doctor_id = d.id AND av.date >= date('now', 'localtime') AND av.free_capacity > 0
+) AS next_available'''
+
+REBUILD_SQL = '''
+    DELETE FROM doctor_availability;
+    INSERT INTO doctor_availability (doctor_id, date, free_capacity, slot_count)
+        SELECT doctor_id, date, SUM(MAX(COALESCE(capacity, 0) - COALESCE(booked_count, 0), 0)), COUNT(*)
+        FROM slots WHERE doctor_id IS NOT NULL AND date IS NOT NULL
+        GROUP BY doctor_id, date;
+'''
+
+
+def normalize_date(value):
+    """Accepts YYYY-MM-DD or DD-MM-YYYY (the chat tools' format); returns ISO or None."""
+    if not value:
+        return None
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    for fmt in ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y"):
+        try:
+            return datetime.datetime.strptime(str(value).strip(), fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def next_available(conn, doctor_id, from_date=None):
+    """Returns (date, time, slot_id) of the doctor's next slot with a free seat, or None."""
+    from_date = normalize_date(from_date) or datetime.date.today().isoformat()
+    day = conn.execute(
+        '''SELECT MIN(date) FROM doctor_availability
+        WHERE doctor_id = ? AND date >= ? AND free_capacity > 0''',
+        (doctor_id, from_date)
+    ).fetchone()[0]
+    if day is None:
+        return None
+    row = conn.execute(
+        '''SELECT id, date, time FROM slots
+        WHERE doctor_id = ? AND date = ? AND booked_count < capacity
+        ORDER BY time LIMIT 1''',
+        (doctor_id, day)
+    ).fetchone()
+    return (row["date"], row["time"], row["id"]) if row else None
+
+
+def free_days(conn, doctor_id, from_date=None, limit=14):
+    """Upcoming days with free capacity for one doctor: [(date, free_capacity), ...]."""
+    from_date = normalize_date(from_date) or datetime.date.today().isoformat()
+    return [tuple(r) for r in conn.execute(
+        '''SELECT date, free_capacity FROM doctor_availability
+        WHERE doctor_id = ? AND date >= ? AND free_capacity > 0
+        ORDER BY date LIMIT ?''',
+        (doctor_id, from_date, limit)
+    )]
+
+
+def find_available_doctors(conn, date=None, date_to=None, specialization="", city="", limit=50):
+    """
+    Doctors with at least one free seat between `date` and `date_to` (inclusive,
+    default: just `date`, which defaults to today), optionally filtered by
+    specialization and city through the FTS index.
+    """
+    date = normalize_date(date) or datetime.date.today().isoformat()
+    date_to = normalize_date(date_to) or date
+
+    query = '''
+        SELECT d.id, d.name, d.specialization, d.fees, c.name AS clinic_name, c.city AS clinic_city,
+               MIN(av.date) AS next_available, SUM(av.free_capacity) AS free_capacity
+        FROM doctor_availability av
+        JOIN doctors d ON d.id = av.doctor_id
+        LEFT JOIN clinics c ON c.id = d.clinic_id
+        WHERE av.date BETWEEN ? AND ? AND av.free_capacity > 0
+    '''
+    params = [date, date_to]
+
+    filters = {cols: text for cols, text in ((("specialization",), specialization), (("city",), city)) if text}
+    if filters:
+        match = build_match(filters)
+        if match is not None:
+            query += " AND d.id IN (SELECT rowid FROM doctors_fts WHERE doctors_fts MATCH ?)"
+            params.append(match)
+        else:
+            # Too short for the trigram index
+            if specialization:
+                query += " AND d.specialization LIKE ?"
+                params.append(f"{specialization}%")
+            if city:
+                query += " AND c.city LIKE ?"
+                params.append(f"{city}%")
+
+    query += " GROUP BY d.id ORDER BY next_available, d.name LIMIT ?"
+    params.append(limit)
+    return conn.execute(query, params).fetchall()
+
+
+def rebuild(conn):
+    """Recomputes doctor_availability from slots in one transaction."""
+    conn.executescript(f"BEGIN;\n{REBUILD_SQL}\nCOMMIT;")
+    logger.info("[Availability] Rebuilt from slots.")
+
+
+if __name__ == '__main__':
+    import sys
+    from .init_db import DB
+    conn = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else DB)
+    rebuild(conn)
+    conn.close()
+    print("Doctor availability rebuilt.")
@@ -0,0 +1,108 @@
+import sqlite3
+import threading
+from collections import namedtuple
+
+from .logg import logger
+from .db import begin_immediate
+
+# Booking outcomes
+BOOKED = "booked"
+FULL = "full"
+DUPLICATE = "duplicate"
+NOT_FOUND = "not_found"
+CANCELLED = "cancelled"
+
+BookingResult = namedtuple("BookingResult", ["status", "appointment_id", "slot"])
+
+# SQLite allows one writer at a time anyway. Queueing this process's writers on a
+# lock keeps them from spinning in SQLite's busy handler against each other;
+# busy_timeout still covers contention with the other gunicorn workers.
+_write_lock = threading.Lock()
+
+
+def book_slot(conn, patient_id, slot_id):
+    """
+    Books `slot_id` for `patient_id` without ever exceeding the slot capacity.
+    Returns a BookingResult whose status is BOOKED, FULL, DUPLICATE or NOT_FOUND.
+    """
+    slot = conn.execute(
+        "SELECT id, doctor_id, date, time, capacity, booked_count FROM slots WHERE id = ?",
+        (slot_id,)
+    ).fetchone()
+    if not slot:
+        return BookingResult(NOT_FOUND, None, None)
+
+    # Cheap early exit without touching the write lock
+    if slot["booked_count"] >= slot["capacity"]:
+        return BookingResult(FULL, None, slot)
+
+    with _write_lock:
+        try:
+            # Take the write lock up front so the capacity check and increment are atomic
+            begin_immediate(conn)
+
+            duplicate = conn.execute(
+                "SELECT id FROM appointments WHERE patient_id = ? AND slot_id = ? AND status = 'booked'",
+                (patient_id, slot_id)
+            ).fetchone()
+            if duplicate:
+                conn.rollback()
+                return BookingResult(DUPLICATE, duplicate["id"], slot)
+
+            # Conditional increment: only succeeds while there is capacity left
+            cur = conn.execute(
+                "UPDATE slots SET booked_count = booked_count + 1 WHERE id = ? AND booked_count < capacity",
+                (slot_id,)
+            )
+            if cur.rowcount == 0:
+                conn.rollback()
+                return BookingResult(FULL, None, slot)
+
+            cur = conn.execute(
+                """INSERT INTO appointments (doctor_id, patient_id, slot_id, date, status)
+                VALUES (?, ?, ?, ?, 'booked')""",
+                (slot["doctor_id"], patient_id, slot_id, slot["date"])
+            )
+            conn.commit()
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+
+    logger.info(f"Slot {slot_id} booked (appointment {cur.lastrowid}).")
+    return BookingResult(BOOKED, cur.lastrowid, slot)
+
+
+def cancel_appointment(conn, appointment_id, patient_id=None, doctor_id=None):
+    """
+    Cancels a booked appointment and gives its seat back to the slot.
+    Pass `patient_id` or `doctor_id` to restrict the cancel to that owner.
+    Returns CANCELLED or NOT_FOUND (missing, not owned, or not 'booked').
+    """
+    query = "UPDATE appointments SET status = 'cancelled' WHERE id = ? AND status = 'booked'"
+    params = [appointment_id]
+    if patient_id is not None:
+        query += " AND patient_id = ?"
+        params.append(patient_id)
+    if doctor_id is not None:
+        query += " AND doctor_id = ?"
+        params.append(doctor_id)
+
+    with _write_lock:
+        try:
+            begin_immediate(conn)
+            cur = conn.execute(query, params)
+            if cur.rowcount == 0:
+                conn.rollback()
+                return NOT_FOUND
+            conn.execute(
+                """UPDATE slots SET booked_count = booked_count - 1
+                WHERE id = (SELECT slot_id FROM appointments WHERE id = ?) AND booked_count > 0""",
+                (appointment_id,)
+            )
+            conn.commit()
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+    return CANCELLED
@@ -0,0 +1,244 @@
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from .logg import logger
+from .db import connection
+
+# Read-through cache for rarely changing page data (home clinics, clinic pages).
+#
+# Entries are tagged with namespaces ("clinics", "clinic:7", ...). Each namespace
+# has a version number kept in a small shared SQLite file, and the versions are
+# part of every cache key, so bumping a version from any gunicorn worker (or a
+# CLI script) makes the old entries unreachable everywhere. Workers keep the
+# versions they read for CACHE_VERSION_TTL seconds, so a lookup normally costs
+# no query; other workers see a bump within that time, the bumping one at once.
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")   # memory | sqlite | none
+CACHE_TTL = float(os.getenv("CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "512"))
+CACHE_PATH = os.getenv("CACHE_PATH", os.path.join("./data", "cache.db"))
+CACHE_VERSION_TTL = float(os.getenv("CACHE_VERSION_TTL", "2"))
+
+
+class MemoryBackend:
+    """Per-process LRU with a TTL on every entry."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return item
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteBackend:
+    """Key-value entries in the shared cache file, visible to every worker."""
+
+    def get(self, key):
+        with connection(CACHE_PATH) as conn:
+            row = conn.execute(
+                "SELECT value, expires FROM cache_entries WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row["expires"] < time.time():
+            return None
+        return pickle.loads(row["value"]), row["expires"]
+
+    def set(self, key, value, ttl):
+        with connection(CACHE_PATH) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires) VALUES (?, ?, ?)",
+                (key, pickle.dumps(value), time.time() + ttl)
+            )
+            conn.execute("DELETE FROM cache_entries WHERE expires < ?", (time.time(),))
+            conn.commit()
+
+    def clear(self):
+        with connection(CACHE_PATH) as conn:
+            conn.execute("DELETE FROM cache_entries")
+            conn.commit()
+
+
+_backend = None
+_ready_pid = None
+_counters = {"hits": 0, "misses": 0, "invalidations": 0, "errors": 0}
+_counters_lock = threading.Lock()
+_known_versions = {}        # namespace -> (version, read at)
+_versions_lock = threading.Lock()
+
+
+def _count(name, amount=1):
+    with _counters_lock:
+        _counters[name] += amount
+
+
+def _init():
+    global _backend, _ready_pid
+    if _ready_pid == os.getpid():
+        return _backend
+    os.makedirs(os.path.dirname(CACHE_PATH) or ".", exist_ok=True)
+    with connection(CACHE_PATH) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS cache_versions (
+                namespace TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                value BLOB,
+                expires REAL
+            ) WITHOUT ROWID;
+        ''')
+    if CACHE_BACKEND == "sqlite":
+        _backend = SQLiteBackend()
+    elif CACHE_BACKEND == "none":
+        _backend = None
+    else:
+        _backend = MemoryBackend()
+    _ready_pid = os.getpid()
+    return _backend
+
+
+def _versions(namespaces):
+    now = time.monotonic()
+    with _versions_lock:
+        found = {
+            ns: _known_versions[ns][0] for ns in namespaces
+            if ns in _known_versions and now - _known_versions[ns][1] < CACHE_VERSION_TTL
+        }
+    missing = [ns for ns in namespaces if ns not in found]
+    if missing:
+        placeholders = ", ".join("?" * len(missing))
+        with connection(CACHE_PATH) as conn:
+            rows = conn.execute(
+                f"SELECT namespace, version FROM cache_versions WHERE namespace IN ({placeholders})",
+                missing
+            ).fetchall()
+        read = dict.fromkeys(missing, 0)
+        read.update((r["namespace"], r["version"]) for r in rows)
+        with _versions_lock:
+            for ns, version in read.items():
+                _known_versions[ns] = (version, now)
+        found.update(read)
+    return "|".join(f"{ns}={found[ns]}" for ns in namespaces)
+
+
+def get_or_set(key, namespaces, loader, ttl=CACHE_TTL):
+    """
+    Returns the cached value for `key`, calling `loader()` on a miss.
+    `namespaces` lists what the value depends on; see invalidate().
+    Values must be picklable (convert sqlite3.Row to dict first).
+    """
+    try:
+        backend = _init()
+        if backend is None:
+            return loader()
+        full_key = f"{key}#{_versions(namespaces)}"
+        item = backend.get(full_key)
+    except Exception as e:
+        # The cache must never take a page down
+        _count("errors")
+        logger.error(f"[Cache] lookup failed for {key}: {e}")
+        return loader()
+
+    if item is not None:
+        _count("hits")
+        return item[0]
+
+    _count("misses")
+    value = loader()
+    try:
+        backend.set(full_key, value, ttl)
+    except Exception as e:
+        _count("errors")
+        logger.error(f"[Cache] store failed for {key}: {e}")
+    return value
+
+
+def lookup(key, namespaces):
+    """Cached value for `key`, or None. For callers that decide per value whether to store()."""
+    try:
+        backend = _init()
+        if backend is None:
+            return None
+        item = backend.get(f"{key}#{_versions(namespaces)}")
+    except Exception as e:
+        _count("errors")
+        logger.error(f"[Cache] lookup failed for {key}: {e}")
+        return None
+    _count("hits" if item is not None else "misses")
+    return item[0] if item is not None else None
+
+
+def store(key, namespaces, value, ttl=CACHE_TTL):
+    try:
+        backend = _init()
+        if backend is not None:
+            backend.set(f"{key}#{_versions(namespaces)}", value, ttl)
+    except Exception as e:
+        _count("errors")
+        logger.error(f"[Cache] store failed for {key}: {e}")
+
+
+def invalidate(*namespaces):
+    """Bumps the namespace versions so every worker stops serving dependent entries."""
+    if not namespaces:
+        return
+    try:
+        _init()
+        with connection(CACHE_PATH) as conn:
+            conn.executemany(
+                '''INSERT INTO cache_versions (namespace, version) VALUES (?, 1)
+                ON CONFLICT (namespace) DO UPDATE SET version = version + 1''',
+                [(ns,) for ns in namespaces]
+            )
+            conn.commit()
+        # This worker sees the new versions on its next lookup
+        with _versions_lock:
+            for ns in namespaces:
+                _known_versions.pop(ns, None)
+        _count("invalidations", len(namespaces))
+    except Exception as e:
+        _count("errors")
+        logger.error(f"[Cache] invalidation of {namespaces} failed: {e}")
+
+
+def clear():
+    backend = _init()
+    if backend is not None:
+        backend.clear()
+
+
+def stats():
+    with _counters_lock:
+        counters = dict(_counters)
+    lookups = counters["hits"] + counters["misses"]
+    return dict(
+        counters,
+        backend=CACHE_BACKEND,
+        hit_ratio=round(counters["hits"] / lookups, 3) if lookups else 0.0,
+    )
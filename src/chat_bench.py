@@ -0,0 +1,139 @@
+import argparse
+import cProfile
+import json
+import os
+import pstats
+import statistics
+import sys
+import threading
+import time
+
+# Offline load test of the chat pipeline (tool loop, DB helpers, history,
+# text cleaning) against the replay backend in src/llm_backends.py:
+#
+#   python -m src.chat_bench --requests 200 --concurrency 8 --latency-ms 50
+#   python -m src.chat_bench --stream --profile
+#   python -m src.chat_bench --max-p95-ms 400     # exit 1 above the budget (CI)
+#
+# Run from the project root; it uses the app's database like `python app.py`.
+
+DEFAULT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "replay_chats.jsonl")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark /chat_with_gemini with a scripted model.")
+    parser.add_argument("--script", default=DEFAULT_SCRIPT, help="replay file (JSON lines)")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=50, help="scripted model latency per turn")
+    parser.add_argument("--stream", action="store_true", help="use /chat_with_gemini/stream")
+    parser.add_argument("--guest-only", action="store_true", help="no logged-in patient chats")
+    parser.add_argument("--reply-cache", action="store_true", help="keep the guest reply cache on")
+    parser.add_argument("--profile", action="store_true", help="cProfile the run, print the top functions")
+    parser.add_argument("--max-p95-ms", type=float, default=0, help="fail when p95 latency is higher")
+    return parser.parse_args(argv)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    os.environ.setdefault("SECRET_KEY", "chat-bench")
+
+    from app import app
+    from src import gem, llm_backends, tools, chat_memory, response_cache
+    from src.concurrency import llm_stats
+
+    gem.set_model(llm_backends.ReplayModel.from_path(args.script, args.latency_ms))
+    if not args.reply_cache:
+        response_cache.CHAT_CACHE_TTL = 0
+
+    conversations = llm_backends.load_script(args.script)
+    questions = [c.get("sample") or c.get("match") for c in conversations] or ["hello"]
+    endpoint = "/chat_with_gemini/stream" if args.stream else "/chat_with_gemini"
+
+    latencies, errors, profiles = [], [], []
+    lock = threading.Lock()
+    counter = iter(range(args.requests))
+
+    def worker():
+        client = app.test_client()
+        if args.profile:
+            # cProfile only sees the thread that enabled it; merged below
+            profiler = cProfile.Profile()
+            profiles.append(profiler)
+            profiler.enable()
+        try:
+            run(client)
+        finally:
+            if args.profile:
+                profiler.disable()
+
+    def run(client):
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            patient = not args.guest_only and n % 2 == 1
+            with client.session_transaction() as sess:
+                sess.clear()
+                if patient:
+                    sess["patient_id"] = 1
+            start = time.perf_counter()
+            resp = client.post(endpoint, json={"message": questions[n % len(questions)]})
+            body = resp.get_data(as_text=True)
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                if resp.status_code != 200 or "event: error" in body or '"error"' in body:
+                    errors.append((resp.status_code, body[:200]))
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(max(1, args.concurrency))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+    chat_memory.flush()
+
+    report = {
+        "endpoint": endpoint,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "concurrency": args.concurrency,
+        "model_latency_ms": args.latency_ms,
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "max_ms": round(max(latencies, default=0.0), 1),
+        "mean_ms": round(statistics.fmean(latencies), 1) if latencies else 0.0,
+        "llm": llm_stats(),
+        "tokens": gem.usage_stats(),
+        "tools": tools.tool_stats(),
+    }
+    print(json.dumps(report, indent=2))
+    for status, body in errors[:5]:
+        print(f"error {status}: {body}", file=sys.stderr)
+
+    if profiles:
+        stats = pstats.Stats(profiles[0])
+        for profiler in profiles[1:]:
+            stats.add(profiler)
+        stats.sort_stats("cumulative").print_stats(25)
+
+    if errors or (args.max_p95_ms and report["p95_ms"] > args.max_p95_ms):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
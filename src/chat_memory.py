@@ -0,0 +1,323 @@
+import atexit
+import os
+import re
+import threading
+from collections import OrderedDict, deque
+
+from .logg import logger
+from .db import connection, begin_immediate
+
+# Conversation memory for the chat assistant.
+#
+# Each worker keeps the last CHAT_WINDOW messages of recently active users in
+# memory, so building a turn's history needs no table read. New messages are added
+# to the window at once and written to chat_history by a background flusher
+# in batches (write-behind). Messages that slide out of the window are folded
+# into a short rolling summary (the chat_memory table), which is sent ahead of
+# the window so long conversations keep their context at a bounded size.
+#
+# Windows remember the newest chat_history id they have seen; a cache hit
+# still costs one query, comparing it with MAX(id) (an index seek), and
+# reloads when another worker has written for the same user.
+
+CHAT_WINDOW = int(os.getenv("CHAT_WINDOW", "10"))
+CHAT_MEMORY_USERS = int(os.getenv("CHAT_MEMORY_USERS", "1000"))
+CHAT_FLUSH_INTERVAL = float(os.getenv("CHAT_FLUSH_INTERVAL", "1.0"))
+CHAT_FLUSH_BATCH = int(os.getenv("CHAT_FLUSH_BATCH", "200"))
+CHAT_SUMMARY_CHARS = int(os.getenv("CHAT_SUMMARY_CHARS", "1500"))
+
+MAX_ID_SQL = "SELECT MAX(id) FROM chat_history WHERE user_id = ? AND user_type = ?"
+
+
+class Window:
+    __slots__ = ("messages", "summary", "max_id", "overflow")
+
+    def __init__(self, messages, summary, max_id):
+        self.messages = deque(messages)
+        self.summary = summary
+        self.max_id = max_id
+        self.overflow = []
+
+
+_windows = OrderedDict()    # (path, user_id, user_type) -> Window
+_pending = []               # (path, user_id, user_type, role, message) not yet written
+_inflight = []              # rows being written by the flusher right now
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_wake = threading.Event()
+_committed = threading.Event()  # cleared while _write is committing
+_committed.set()
+_flusher_pid = None
+_writes = 0                 # odd while a flush commits; _load retries when it moves
+_counters = {"hits": 0, "loads": 0, "reloads": 0, "flushed": 0, "compactions": 0, "errors": 0}
+
+
+def _count(name, amount=1):
+    # Request threads and the flusher update these concurrently
+    with _lock:
+        _counters[name] += amount
+
+
+def extractive_summary(summary, messages):
+    """
+    Default summarizer: one line per user question and per assistant reply
+    that listed items (keeping their [ID: n] tags, which later turns refer to),
+    trimmed to the newest CHAT_SUMMARY_CHARS characters.
+    """
+    lines = summary.splitlines() if summary else []
+    for role, message in messages:
+        text = " ".join((message or "").split())
+        if role == "user":
+            lines.append(f"- User: {text[:160]}")
+        else:
+            ids = list(dict.fromkeys(re.findall(r"\[ID: \d+\]", text)))
+            if ids:
+                lines.append(f"- Assistant listed: {', '.join(ids)}")
+    kept, size = [], 0
+    for line in reversed(lines):
+        if size + len(line) + 1 > CHAT_SUMMARY_CHARS:
+            break
+        kept.append(line)
+        size += len(line) + 1
+    return "\n".join(reversed(kept))
+
+
+_summarizer = extractive_summary
+
+
+def set_summarizer(func):
+    """func(previous_summary, [(role, message), ...]) -> new summary text."""
+    global _summarizer
+    _summarizer = func
+
+
+def _whole_pairs(messages, limit):
+    # The last `limit` messages, starting with a user turn: an odd limit must
+    # not leave a model turn right after the summary's "Understood."
+    messages = list(messages)[-limit:] if limit > 0 else []
+    while messages and messages[0][0] != "user":
+        messages.pop(0)
+    return messages
+
+
+def _local_rows(path, user_id, user_type):
+    return [
+        (role, message)
+        for p, uid, utype, role, message in _inflight + _pending
+        if (p, uid, utype) == (path, user_id, user_type)
+    ]
+
+
+def _load(conn, path, user_id, user_type):
+    while True:
+        _committed.wait()
+        writes = _writes
+        max_id = conn.execute(MAX_ID_SQL, (user_id, user_type)).fetchone()[0] or 0
+        rows = conn.execute(
+            "SELECT role, message FROM chat_history WHERE user_id = ? AND user_type = ? ORDER BY id DESC LIMIT ?",
+            (user_id, user_type, CHAT_WINDOW)
+        ).fetchall()
+        memory = conn.execute(
+            "SELECT summary FROM chat_memory WHERE user_id = ? AND user_type = ?", (user_id, user_type)
+        ).fetchone()
+        messages = [(r["role"], r["message"]) for r in reversed(rows)]
+        with _lock:
+            if writes != _writes or writes % 2:
+                # A flush committed while we were reading: its rows may be in
+                # both or neither of the result and _inflight, so read again
+                continue
+            # Messages still waiting for the flusher are newer than anything in the
+            # table; _write drops them from _inflight once they are committed
+            messages = _whole_pairs(messages + _local_rows(path, user_id, user_type), CHAT_WINDOW)
+            window = Window(messages, memory["summary"] if memory else "", max_id)
+            _windows[(path, user_id, user_type)] = window
+            _windows.move_to_end((path, user_id, user_type))
+            while len(_windows) > CHAT_MEMORY_USERS:
+                _windows.popitem(last=False)
+        return window
+
+
+def _window(path, user_id, user_type):
+    key = (path, user_id, user_type)
+    with connection(path) as conn:
+        with _lock:
+            window = _windows.get(key)
+        if window is not None:
+            max_id = conn.execute(MAX_ID_SQL, (user_id, user_type)).fetchone()[0] or 0
+            if max_id == window.max_id:
+                with _lock:
+                    # A flush may have dropped it meanwhile; this turn can still use it
+                    if key in _windows:
+                        _windows.move_to_end(key)
+                    _counters["hits"] += 1
+                return window
+            _count("reloads")
+        else:
+            _count("loads")
+        return _load(conn, path, user_id, user_type)
+
+
+def history(path, user_id, user_type, limit=CHAT_WINDOW):
+    """Gemini chat history for a user: the rolling summary, then the last `limit` messages (whole pairs)."""
+    window = _window(path, user_id, user_type)
+    with _lock:
+        messages = _whole_pairs(window.messages, limit)
+        summary = window.summary
+    turns = []
+    if summary:
+        turns.append({"role": "user", "parts": [f"Summary of our earlier conversation:\n{summary}"]})
+        turns.append({"role": "model", "parts": ["Understood."]})
+    turns += [{"role": role, "parts": [message]} for role, message in messages]
+    return turns
+
+
+def append(path, user_id, user_type, messages):
+    """Adds [(role, message), ...] to the user's window and queues them for chat_history."""
+    _start_flusher()
+    key = (path, user_id, user_type)
+    with _lock:
+        window = _windows.get(key)
+        if window is not None:
+            window.messages.extend(messages)
+            # Whole user/model pairs slide out into the summary
+            while window.messages and (len(window.messages) > CHAT_WINDOW or window.messages[0][0] != "user"):
+                window.overflow.append(window.messages.popleft())
+        _pending.extend((path, user_id, user_type, role, message) for role, message in messages)
+        if len(_pending) >= CHAT_FLUSH_BATCH or (window is not None and window.overflow):
+            _wake.set()
+
+
+def _write(path, rows):
+    global _writes
+    users = list(dict.fromkeys((uid, utype) for uid, utype, _, _ in rows))
+    with connection(path) as conn:
+        begin_immediate(conn)
+        try:
+            before = {u: conn.execute(MAX_ID_SQL, u).fetchone()[0] or 0 for u in users}
+            conn.executemany(
+                "INSERT INTO chat_history (user_id, user_type, role, message) VALUES (?, ?, ?, ?)", rows
+            )
+            after = {u: conn.execute(MAX_ID_SQL, u).fetchone()[0] or 0 for u in users}
+            # _load waits while the commit runs outside the lock, so it never
+            # sees the rows both in the table and in _inflight
+            with _lock:
+                _writes += 1
+                _committed.clear()
+            try:
+                conn.commit()
+            except Exception:
+                with _lock:
+                    _writes += 1
+                    _committed.set()
+                raise
+            with _lock:
+                _inflight[:] = [r for r in _inflight if r[0] != path]
+                _writes += 1
+                _committed.set()
+                for u in users:
+                    window = _windows.get((path,) + u)
+                    if window is None:
+                        continue
+                    if window.max_id == before[u]:
+                        window.max_id = after[u]
+                    else:
+                        # Another worker wrote in between; reload on next use
+                        del _windows[(path,) + u]
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def _compact():
+    with _lock:
+        work = [(key, w, w.summary, w.overflow) for key, w in _windows.items() if w.overflow]
+        for _, w, _, _ in work:
+            w.overflow = []
+
+    for (path, user_id, user_type), window, summary, overflow in work:
+        try:
+            summary = _summarizer(summary, overflow)
+        except Exception as e:
+            logger.error(f"[ChatMemory] Summarizer failed, using extractive summary: {e}")
+            summary = extractive_summary(summary, overflow)
+        with _lock:
+            window.summary = summary
+        with connection(path) as conn:
+            conn.execute(
+                '''INSERT INTO chat_memory (user_id, user_type, summary, updated_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (user_id, user_type) DO UPDATE SET
+                    summary = excluded.summary, updated_at = excluded.updated_at''',
+                (user_id, user_type, summary)
+            )
+            conn.commit()
+        _count("compactions")
+
+
+def flush():
+    """Writes queued messages and folds overflowed turns into summaries."""
+    global _inflight
+    with _flush_lock:
+        with _lock:
+            if not _pending and not any(w.overflow for w in _windows.values()):
+                return 0
+            _inflight = list(_pending)
+            _pending.clear()
+
+        by_path = OrderedDict()
+        for path, uid, utype, role, message in _inflight:
+            by_path.setdefault(path, []).append((uid, utype, role, message))
+
+        done = set()
+        try:
+            for path, rows in by_path.items():
+                _write(path, rows)
+                done.add(path)
+        except Exception as e:
+            logger.error(f"[ChatMemory] Writing chat history failed, will retry: {e}")
+            with _lock:
+                _counters["errors"] += 1
+                # Unwritten rows go back to the front of the queue
+                _pending[:0] = [r for r in _inflight if r[0] not in done]
+        finally:
+            with _lock:
+                _inflight = []
+        written = sum(len(by_path[p]) for p in done)
+        _count("flushed", written)
+
+        try:
+            _compact()
+        except Exception as e:
+            _count("errors")
+            logger.error(f"[ChatMemory] Compaction failed: {e}")
+        return written
+
+
+def _start_flusher():
+    global _flusher_pid
+    if _flusher_pid == os.getpid():
+        return
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+
+    def run():
+        while True:
+            _wake.wait(CHAT_FLUSH_INTERVAL)
+            _wake.clear()
+            try:
+                flush()
+            except Exception as e:
+                logger.error(f"[ChatMemory] Flusher error: {e}")
+
+    threading.Thread(target=run, name="chat-history-flusher", daemon=True).start()
+
+
+# Do not lose the last batch on a clean shutdown
+atexit.register(flush)
+
+
+def stats():
+    with _lock:
+        return dict(_counters, windows=len(_windows), pending=len(_pending))
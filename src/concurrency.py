@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import copy_current_request_context, has_request_context
+
+from .logg import logger
+
+# Keeps slow Gemini calls from taking over a worker. Gunicorn runs threaded
+# (or gevent) workers (see gunicorn.conf.py), and at most LLM_MAX_CONCURRENCY
+# threads per process may wait on the model at once; the rest of the threads
+# stay free for booking and page traffic.
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+# How long a chat waits for a free model slot before getting a "busy" reply
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "15"))
+
+
+class LLMBusy(RuntimeError):
+    pass
+
+
+_llm_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+_counters = {"in_flight": 0, "calls": 0, "rejected": 0, "wait_ms": 0.0}
+_counters_lock = threading.Lock()
+
+
+@contextmanager
+def llm_slot(timeout=LLM_QUEUE_TIMEOUT):
+    """Holds one of the LLM_MAX_CONCURRENCY model slots; raises LLMBusy on timeout."""
+    start = time.perf_counter()
+    if not _llm_slots.acquire(timeout=timeout):
+        with _counters_lock:
+            _counters["rejected"] += 1
+        logger.warning(f"[LLM] No model slot free within {timeout}s")
+        raise LLMBusy("Too many chats in progress")
+    with _counters_lock:
+        _counters["in_flight"] += 1
+        _counters["calls"] += 1
+        _counters["wait_ms"] += (time.perf_counter() - start) * 1000
+    try:
+        yield
+    finally:
+        with _counters_lock:
+            _counters["in_flight"] -= 1
+        _llm_slots.release()
+
+
+def _gevent_patched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("threading")
+
+
+def offload(func, *args, **kwargs):
+    """
+    Runs blocking DB work off the event loop. Under gevent the call goes to the
+    hub's native thread pool (sqlite3 would otherwise block every greenlet);
+    on threaded workers the request already has its own thread, so it runs inline.
+    """
+    if not _gevent_patched():
+        return func(*args, **kwargs)
+    import gevent
+    if has_request_context():
+        func = copy_current_request_context(func)
+    return gevent.get_hub().threadpool.apply(func, args, kwargs)
+
+
+def llm_stats():
+    with _counters_lock:
+        calls = _counters["calls"]
+        return dict(
+            _counters,
+            limit=LLM_MAX_CONCURRENCY,
+            avg_wait_ms=round(_counters["wait_ms"] / calls, 2) if calls else 0.0,
+        )
@@ -0,0 +1,418 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from queue import LifoQueue, Empty
+
+from flask import current_app, g, has_app_context
+from .logg import logger
+from . import metrics
+
+# Pool tuning (per worker process). A request holds its connection until
+# teardown and each parallel tool call (CHAT_TOOL_WORKERS in src/gem.py) checks
+# out another one, so the default covers every gunicorn thread, the tool pool
+# and the background checkpointer/materializer.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE") or (
+    int(os.getenv("GUNICORN_THREADS", "8")) + int(os.getenv("CHAT_TOOL_WORKERS", "3")) + 2
+))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "256"))
+DB_HEALTHCHECK_INTERVAL = float(os.getenv("DB_HEALTHCHECK_INTERVAL", "30"))
+# Statements slower than this go to the slow-query log (src/slow_queries.py); 0 = off
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+
+
+def parse_pragmas(raw):
+    """Parses 'name=value;name=value' into an ordered dict of PRAGMAs."""
+    pragmas = {}
+    for item in (raw or "").split(";"):
+        if "=" not in item:
+            continue
+        name, value = item.split("=", 1)
+        name = name.strip().lower()
+        if name.isidentifier():
+            pragmas[name] = value.strip()
+    return pragmas
+
+
+# Storage profiles, selected with DB_PROFILE. WAL lets readers keep going while
+# a booking commits; busy_timeout makes writers queue instead of failing with
+# "database is locked".
+STORAGE_PROFILES = {
+    "production": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": "5000",
+        "cache_size": "-16000",        # ~16 MB page cache per connection
+        "mmap_size": "268435456",      # 256 MB
+        "temp_store": "MEMORY",
+        "journal_size_limit": "67108864",
+    },
+    "development": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": "5000",
+        "cache_size": "-4000",
+        "mmap_size": "0",
+        "temp_store": "MEMORY",
+    },
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "busy_timeout": "10000",
+        "cache_size": "-16000",
+        "mmap_size": "0",
+        "temp_store": "DEFAULT",
+    },
+    "legacy": {
+        "journal_mode": "DELETE",
+        "busy_timeout": "5000",
+    },
+}
+
+DB_PROFILE = os.getenv("DB_PROFILE", "production")
+DB_CHECKPOINT_INTERVAL = float(os.getenv("DB_CHECKPOINT_INTERVAL", "60"))
+
+# journal_mode is stored in the database file itself, so it is applied once at
+# startup rather than on every connection.
+DATABASE_PRAGMAS = ("journal_mode",)
+
+
+def get_storage_profile(name=None):
+    name = name or DB_PROFILE
+    if name not in STORAGE_PROFILES:
+        logger.warning(f"[DB] Unknown DB_PROFILE '{name}', using 'production'")
+        name = "production"
+    return dict(STORAGE_PROFILES[name])
+
+
+# Extra PRAGMAs applied on top of the profile, e.g. DB_PRAGMAS="foreign_keys=ON"
+DB_PRAGMAS = parse_pragmas(os.getenv("DB_PRAGMAS", ""))
+
+
+def connection_pragmas():
+    """Per-connection PRAGMAs: the active profile plus DB_PRAGMAS overrides."""
+    pragmas = get_storage_profile()
+    pragmas.update(DB_PRAGMAS)
+    for name in DATABASE_PRAGMAS:
+        pragmas.pop(name, None)
+    return pragmas
+
+
+def apply_storage_profile(conn, profile=None):
+    """Applies the storage profile to an open connection, including the journal mode."""
+    pragmas = get_storage_profile(profile)
+    pragmas.update(DB_PRAGMAS)
+    # Journal mode first so the remaining settings apply to the final mode
+    mode = pragmas.pop("journal_mode", None)
+    if mode:
+        active = conn.execute(f"PRAGMA journal_mode={mode}").fetchone()[0]
+        if active.lower() != mode.lower():
+            logger.warning(f"[DB] journal_mode={mode} requested but database is in {active} mode")
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name}={value}")
+    return pragmas
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """
+    Adds up the time spent executing a statement and fetching its rows, and
+    reports it with the row count (src/metrics.py) once the result is used up
+    or the cursor is dropped.
+    """
+
+    _sql = None
+
+    def _begin(self, sql, params, elapsed):
+        self._sql, self._params, self._elapsed, self._rows = sql, params, elapsed, 0
+        if self.description is None:
+            # Not a query: nothing to fetch
+            self._rows = max(self.rowcount, 0)
+            self._report()
+
+    def _report(self):
+        if self._sql is not None:
+            sql, self._sql = self._sql, None
+            metrics.observe_sql(sql, self._elapsed, self._rows)
+            if SLOW_QUERY_MS and self._elapsed * 1000 >= SLOW_QUERY_MS:
+                from . import slow_queries
+                slow_queries.record(self.connection.path, sql, self._params, self._elapsed, self._rows)
+
+    def _timed(self, fetch, *args):
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            self._elapsed += time.perf_counter() - start
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._report()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, self.arraysize if size is None else size)
+        self._rows += len(rows)
+        if not rows:
+            self._report()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._rows += len(rows)
+        self._report()
+        return rows
+
+    def __next__(self):
+        try:
+            row = self._timed(super().__next__)
+        except StopIteration:
+            self._report()
+            raise
+        self._rows += 1
+        return row
+
+    def close(self):
+        self._report()
+        super().close()
+
+    def __del__(self):
+        self._report()
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """
+    Connection whose execute()/executemany() report to src/metrics.py
+    (METRICS=1) and to the slow-query log (SLOW_QUERY_MS, src/slow_queries.py).
+    """
+
+    path = None
+
+    def _run(self, method, sql, params, logged_params):
+        cur = self.cursor(ProfiledCursor)
+        start = time.perf_counter()
+        try:
+            getattr(cur, method)(sql, params)
+        finally:
+            cur._begin(sql, logged_params, time.perf_counter() - start)
+        return cur
+
+    def execute(self, sql, params=()):
+        return self._run("execute", sql, params, params)
+
+    def executemany(self, sql, params):
+        # The parameter rows may be a one-shot iterator: never kept
+        return self._run("executemany", sql, params, None)
+
+
+class ConnectionPool:
+    """
+    Bounded pool of SQLite connections for one database file.
+    Connections are opened lazily up to `size`, re-used across requests and
+    threads, and health-checked when they have been idle for a while.
+    """
+
+    def __init__(self, path, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT, pragmas=None):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = connection_pragmas() if pragmas is None else dict(pragmas)
+        self.pid = os.getpid()
+        self._idle = LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+
+    def _connect(self):
+        profiled = metrics.METRICS or SLOW_QUERY_MS
+        conn = sqlite3.connect(
+            self.path,
+            timeout=int(self.pragmas.get("busy_timeout", 5000)) / 1000,
+            check_same_thread=False,
+            cached_statements=DB_STATEMENT_CACHE,
+            factory=ProfiledConnection if profiled else sqlite3.Connection,
+        )
+        if profiled:
+            conn.path = self.path
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+    def _healthy(self, conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._opened -= 1
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                conn, idle_since = self._idle.get_nowait()
+            except Empty:
+                conn = None
+
+            if conn is not None:
+                if time.monotonic() - idle_since < DB_HEALTHCHECK_INTERVAL or self._healthy(conn):
+                    return conn
+                logger.warning(f"[DB] Dropping unhealthy pooled connection to {self.path}")
+                self._discard(conn)
+                continue
+
+            with self._lock:
+                can_open = self._opened < self.size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"No database connection available within {self.timeout}s")
+            try:
+                conn, idle_since = self._idle.get(timeout=remaining)
+            except Empty:
+                continue
+            self._idle.put((conn, idle_since))
+
+    def release(self, conn):
+        # Never hand a connection with an open transaction to the next request
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._idle.put((conn, time.monotonic()))
+
+    def close_all(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except Empty:
+                break
+            self._discard(conn)
+
+    def stats(self):
+        return {"path": self.path, "size": self.size, "opened": self._opened, "idle": self._idle.qsize()}
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path):
+    """Returns the pool for `path`, creating it on first use in this process."""
+    pool = _pools.get(path)
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _pools_lock:
+        pool = _pools.get(path)
+        # Connections must not cross a fork (gunicorn workers), start fresh instead
+        if pool is None or pool.pid != os.getpid():
+            pool = ConnectionPool(path)
+            _pools[path] = pool
+        return pool
+
+
+@metrics.gauge_source
+def pool_gauges():
+    gauges = []
+    for pool in list(_pools.values()):
+        if pool.pid != os.getpid():
+            continue
+        stats = pool.stats()
+        database = os.path.basename(pool.path)
+        gauges.append(("db_pool_connections", {"database": database, "state": "open"}, stats["opened"]))
+        gauges.append(("db_pool_connections", {"database": database, "state": "idle"}, stats["idle"]))
+    return gauges
+
+
+@contextmanager
+def connection(path):
+    """Checks a pooled connection out for the duration of a `with` block."""
+    pool = get_pool(path)
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+
+def get_db():
+    """Request-scoped connection shared by Flask routes and Gemini tools."""
+    if "db" not in g:
+        g.db = get_pool(current_app.config["DATABASE"]).acquire()
+    return g.db
+
+
+def close_db(exc=None):
+    db = g.pop("db", None) if has_app_context() else None
+    if db is not None:
+        get_pool(current_app.config["DATABASE"]).release(db)
+
+
+def begin_immediate(conn):
+    """
+    Starts a write transaction holding SQLite's write lock from the first
+    statement. Raises RuntimeError when the caller already has a transaction
+    open, instead of committing work that is not ours to commit.
+    """
+    if conn.in_transaction:
+        raise RuntimeError("A transaction is already open on this connection; commit or roll it back first")
+    conn.execute("BEGIN IMMEDIATE")
+
+
+def checkpoint(path, mode="PASSIVE"):
+    """Runs a WAL checkpoint and returns (busy, wal_pages, checkpointed_pages)."""
+    with connection(path) as conn:
+        return tuple(conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone())
+
+
+_checkpointers = {}
+
+
+def start_checkpointer(path, interval=DB_CHECKPOINT_INTERVAL):
+    """
+    Starts a daemon thread that checkpoints the WAL every `interval` seconds,
+    so the log does not grow unbounded between SQLite's automatic checkpoints.
+    Safe to call repeatedly; one thread runs per database per process.
+    """
+    if interval <= 0:
+        return None
+    key = (path, os.getpid())
+    if key in _checkpointers:
+        return _checkpointers[key]
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                busy, wal_pages, done = checkpoint(path)
+                if busy:
+                    logger.info(f"[DB] WAL checkpoint busy ({done}/{wal_pages} pages)")
+            except Exception as e:
+                logger.error(f"[DB] WAL checkpoint failed: {e}")
+
+    thread = threading.Thread(target=run, name="wal-checkpoint", daemon=True)
+    thread.start()
+    _checkpointers[key] = thread
+    return thread
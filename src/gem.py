@@ -1,23 +1,43 @@
 import os
-import sqlite3
 import re
 import json
-from flask import current_app, jsonify, session
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import jsonify, session, copy_current_request_context, Response, stream_with_context, current_app
 from dotenv import load_dotenv
-from google.generativeai.protos import Part, FunctionResponse
 from datetime import datetime
 from src.logg import logger
 from src.prompt import sys_prompt
-
-try:
-    import google.generativeai as genai
-except ImportError:
-    genai = None
+from src.db import get_db, close_db
+from src.concurrency import llm_slot, offload, LLMBusy, LLM_QUEUE_TIMEOUT
+from src import booking, search, availability, tools, knowledge, chat_memory, response_cache, llm_backends, metrics
 
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME")
 
+# google.generativeai is by far the slowest import in the app, so it is only
+# loaded with the model, on the first chat (see get_model()).
+genai = None
+_genai_lock = threading.Lock()
+
+
+def load_genai():
+    """Imports google.generativeai once; None when the package is missing."""
+    global genai
+    if genai is None:
+        with _genai_lock:
+            if genai is None:
+                start = time.perf_counter()
+                try:
+                    import google.generativeai as sdk
+                except ImportError:
+                    return None
+                genai = sdk
+                logger.info(f"[Gemini] SDK imported in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return genai
+
 
 def load_tools_config():
     # Loading tool definitions from the JSON file.
@@ -32,54 +52,105 @@ def load_tools_config():
         return []
 
 
-def load_policy_document():
-    try:
-        base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        policy_path = os.path.join(base_path, "clinic_policies.txt")
-        
-        with open(policy_path, "r") as f:
-            return f.read()
-    except Exception as e:
-        logger.warning(f"Could not load policy document: {e}")
-        return ""
-    
+# Static, so it is sent once as the system instruction instead of with every
+# user turn. Policy text comes per turn from the knowledge base (src/knowledge.py).
+SYSTEM_INSTRUCTION = f"""{sys_prompt}
+
+### KNOWLEDGE BASE (Clinic Policies)
+Each user message may include CLINIC POLICY EXCERPTS retrieved for that question.
+Use them to answer questions about refunds, hours, or insurance.
+If the answer is found there, you do NOT need to call a tool."""
+
+
+# Loaded once; shared by the model declaration and the dispatch registry
+TOOL_DECLARATIONS = load_tools_config()
 
 gemini_model = None
+_model_ready = False
+_model_lock = threading.Lock()
+
+
+def create_model():
+    """Builds the configured chat backend (CHAT_BACKEND), or None when Gemini is not configured."""
+    if llm_backends.CHAT_BACKEND == "replay":
+        # Offline stand-in for benchmarks and CI (src/llm_backends.py)
+        return llm_backends.ReplayModel.from_path(llm_backends.CHAT_REPLAY_PATH)
 
-if GEMINI_API_KEY and genai:
+    sdk = load_genai() if GEMINI_API_KEY else None
+    if sdk is None:
+        logger.warning("Gemini not configured. API key or package missing.")
+        return None
     try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        
-        tool_functions = load_tools_config()
-        
-        gemini_model = genai.GenerativeModel(
+        sdk.configure(api_key=GEMINI_API_KEY)
+
+        model = sdk.GenerativeModel(
             model_name=GEMINI_MODEL_NAME,
             # wrapping the loaded list in the structure Gemini expects
             tools=[{
-                "function_declarations": tool_functions
-            }]
+                "function_declarations": TOOL_DECLARATIONS
+            }],
+            system_instruction=SYSTEM_INSTRUCTION,
         )
+        if llm_backends.CHAT_RECORD_PATH:
+            model = llm_backends.RecordingModel(model, llm_backends.CHAT_RECORD_PATH)
+        if os.getenv("CHAT_SUMMARIZER", "extractive") == "model":
+            chat_memory.set_summarizer(summarize_with_model)
         logger.info("[Gemini] Model loaded with tools from JSON.")
+        return model
     except Exception as exc:
         logger.exception("[Gemini] Failed to configure model: %s", exc)
-else:
-    logger.warning("Gemini not configured. API key or package missing.")
+        return None
+
+
+def get_model():
+    """The chat model, created on first use so workers that never chat skip the SDK import."""
+    global gemini_model, _model_ready
+    if not _model_ready:
+        with _model_lock:
+            if not _model_ready:
+                gemini_model = create_model()
+                _model_ready = True
+    return gemini_model
+
+
+def preload_model():
+    """Builds the model on a background thread (CHAT_PRELOAD=1), so the first chat does not wait for it."""
+    threading.Thread(target=get_model, name="gemini-preload", daemon=True).start()
+
+
+def set_model(model):
+    """Swaps the chat backend at runtime, e.g. a llm_backends.ReplayModel in benchmarks."""
+    global gemini_model, _model_ready
+    with _model_lock:
+        gemini_model = model
+        _model_ready = True
+
+
+def summarize_with_model(summary, messages):
+    """Chat memory summarizer backed by the model (CHAT_SUMMARIZER=model)."""
+    transcript = "\n".join(f"{role}: {message}" for role, message in messages)
+    prompt = (
+        "Update this running summary of a ClinicBook chat with the new messages. "
+        "Keep names, dates and every [ID: n] tag that may be referred to later. "
+        f"Reply with the summary only, at most {chat_memory.CHAT_SUMMARY_CHARS} characters.\n\n"
+        f"SUMMARY:\n{summary or '(empty)'}\n\nNEW MESSAGES:\n{transcript}"
+    )
+    with llm_slot():
+        response = load_genai().GenerativeModel(GEMINI_MODEL_NAME).generate_content(prompt)
+    return response.text.strip()[:chat_memory.CHAT_SUMMARY_CHARS]
 
 
 # DB Helpers
 def get_db_connection():
-    db_path = current_app.config["DATABASE"]
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+    # Shares the pooled, request-scoped connection with the Flask routes.
+    # It is released on app-context teardown, so callers must not close it.
+    return get_db()
 
 def run_query(query, args=()):
     # Runs SQL SELECT statements and returns rows as dicts.
     try:
         conn = get_db_connection()
-        cur = conn.cursor()
-        rows = cur.execute(query, args).fetchall()
-        conn.close()
+        rows = conn.execute(query, args).fetchall()
         return [dict(r) for r in rows]
     except Exception as e:
         logger.error(f"SQL Error: {e}")
@@ -87,130 +158,114 @@ def run_query(query, args=()):
 
 def write_query(query, args=()):
     # Runs SQL INSERT/UPDATE/DELETE statements and COMMITS changes.
+    conn = None
     try:
         conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute(query, args)
+        cur = conn.execute(query, args)
         if cur.rowcount == 0:
             msg = "No records were updated. Check if the ID is correct."
         else:
             msg = "Success"
         conn.commit()
-        conn.close()
         return msg
     except Exception as e:
+        if conn is not None:
+            conn.rollback()
         logger.error(f"SQL Write Error: {e}")
         return f"Database error: {e}"
 
 def save_chat_log(user_id, user_type, role, message):
-    # Saves a message to the chat_history table.
-    conn = get_db_connection()
-    conn.execute(
-        "INSERT INTO chat_history (user_id, user_type, role, message) VALUES (?, ?, ?, ?)",
-        (user_id, user_type, role, message)
-    )
-    conn.commit()
-    conn.close()
+    # Adds a message to the user's history window; it reaches the chat_history
+    # table with the next write-behind batch (src/chat_memory.py).
+    chat_memory.append(current_app.config["DATABASE"], user_id, user_type, [(role, message)])
 
 
 def get_chat_history_for_gemini(user_id, user_type, limit=10):
-    # Fetches last N messages and formats them for Gemini history.
-    conn = get_db_connection()
-    rows = conn.execute(
-        "SELECT role, message FROM chat_history WHERE user_id=? AND user_type=? ORDER BY id DESC LIMIT ?",
-        (user_id, user_type, limit)
-    ).fetchall()
-    conn.close()
-
-    # Flip to chronological order (oldest -> newest)
-    rows = rows[::-1] 
-
-    history = []
-    for r in rows:
-        history.append({
-            "role": r["role"],
-            "parts": [r["message"]]
-        })
-    return history
+    # Rolling summary + last N messages (oldest -> newest), from the window cache.
+    return chat_memory.history(current_app.config["DATABASE"], user_id, user_type, limit)
 
 
 # Tool Functions
+def run_search(search_fn, columns, **filters):
+    # Runs an FTS5 search (src/search.py) and returns rows as dicts.
+    try:
+        rows = search_fn(get_db_connection(), columns=columns, limit=tools.TOOL_FETCH_ROWS, **filters)
+        return [dict(r) for r in rows]
+    except Exception as e:
+        logger.error(f"Search Error: {e}")
+        return []
+
 def search_doctor_by_specialization(specialization: str):
-    return run_query(
-        # Added 'id' to the SELECT list
-        "SELECT id, name, specialization, fees, phone, email FROM doctors WHERE specialization LIKE ?",
-        (f"%{specialization}%",)
+    return run_search(
+        search.search_doctors,
+        "d.id, d.name, d.specialization, d.fees, d.phone, d.email",
+        specialization=specialization
     )
 
 def get_available_slots(doctor_id):
-    """Fetches unbooked slots for a specific doctor."""
+    """Fetches unbooked upcoming slots for a specific doctor."""
+    # Only visits days the availability index reports as having free seats
     return run_query(
         """
         SELECT id, date, time 
         FROM slots 
-        WHERE doctor_id = ? AND booked_count < capacity 
+        WHERE doctor_id = ? AND booked_count < capacity
+          AND date IN (
+              SELECT date FROM doctor_availability
+              WHERE doctor_id = ? AND date >= ? AND free_capacity > 0
+          )
         ORDER BY date ASC, time ASC
+        LIMIT ?
         """,
-        (doctor_id,)
+        (doctor_id, doctor_id, datetime.now().date().isoformat(), tools.TOOL_FETCH_ROWS)
     )
 
+def search_available_doctors(specialization: str = "", city: str = "", date: str = "", date_to: str = ""):
+    """Finds doctors with a free seat on a date (range), e.g. cardiologists in Mumbai tomorrow."""
+    try:
+        rows = availability.find_available_doctors(
+            get_db_connection(), date=date, date_to=date_to,
+            specialization=specialization, city=city, limit=tools.TOOL_FETCH_ROWS
+        )
+        return [dict(r) for r in rows]
+    except Exception as e:
+        logger.error(f"Availability Error: {e}")
+        return []
+
 
 def book_appointment_by_patient(slot_id):
     user_id = session.get('patient_id')
     if not user_id:
         return "Error: Login required."
 
-    conn = get_db_connection()
-    
-    # Fetching Slot & Doctor Details
-    slot = conn.execute("""
-        SELECT s.id, s.date, s.time, s.doctor_id, d.name as doc_name 
-        FROM slots s 
-        JOIN doctors d ON s.doctor_id = d.id 
-        WHERE s.id = ?
-    """, (slot_id,)).fetchone()
-    
-    # patient = conn.execute("SELECT email FROM patients WHERE id = ?", (user_id,)).fetchone()
-    
-    if not slot:
-        conn.close()
-        return "Error: Slot not found."
-
-    # Performing Booking (Database Write)
+    # Same atomic booking path as the /book route
     try:
-        cur = conn.cursor()
-        
-        cur.execute(
-            """
-            INSERT INTO appointments (patient_id, doctor_id, slot_id, date, status) 
-            VALUES (?, ?, ?, ?, 'booked')
-            """,
-            (user_id, slot['doctor_id'], slot_id, slot['date'])
-        )
-        
-        # Increment 'booked_count'
-        cur.execute("UPDATE slots SET booked_count = booked_count + 1 WHERE id = ?", (slot_id,))
-        
-        conn.commit()
+        result = booking.book_slot(get_db_connection(), user_id, slot_id)
     except Exception as e:
-        conn.close()
         logger.error(f"Booking Failed: {e}")
         return f"Database Error: {e}"
 
-    conn.close()
+    if result.status == booking.NOT_FOUND:
+        return "Error: Slot not found."
+    if result.status == booking.FULL:
+        return "Error: This slot is fully booked. Please choose another slot."
+    if result.status == booking.DUPLICATE:
+        return "Error: You have already booked this slot."
 
     return "Success: Appointment booked."
 
 def search_doctor_by_name(name: str):
-    return run_query(
-        "SELECT name, specialization, fees, phone, email FROM doctors WHERE name LIKE ?",
-        (f"%{name}%",)
+    return run_search(
+        search.search_doctors,
+        "d.id, d.name, d.specialization, d.fees, d.phone, d.email",
+        q=name
     )
 
 def search_clinic_by_city(city: str):
-    return run_query(
-        "SELECT name, address, phone, average_rating FROM clinics WHERE city LIKE ?",
-        (f"%{city}%",)
+    return run_search(
+        search.search_clinics,
+        "c.id, c.name, c.address, c.phone, c.average_rating",
+        city=city
     )
 
 def search_appointments_by_patient():
@@ -222,7 +277,6 @@ def search_appointments_by_patient():
     # Fetching the email from the database using the ID
     conn = get_db_connection()
     user_row = conn.execute("SELECT email FROM patients WHERE id = ?", (user_id,)).fetchone()
-    conn.close()
 
     if not user_row:
         return "Error: patient profile not found."
@@ -238,8 +292,9 @@ def search_appointments_by_patient():
         JOIN doctors d ON a.doctor_id = d.id
         WHERE p.email LIKE ? AND status LIKE 'booked'
         ORDER BY s.date DESC
+        LIMIT ?
         """,
-        (f"%{email}%",)
+        (f"%{email}%", tools.TOOL_FETCH_ROWS)
     )
 
 
@@ -266,8 +321,9 @@ def get_doctor_schedule():
         JOIN slots s ON a.slot_id = s.id
         WHERE a.doctor_id = ? AND a.status LIKE 'booked'
         ORDER BY s.date DESC, s.time ASC
+        LIMIT ?
         """,
-        (doctor_id,)
+        (doctor_id, tools.TOOL_FETCH_ROWS)
     )
 
 def cancel_appointment_by_patient(appointment_id):
@@ -276,16 +332,16 @@ def cancel_appointment_by_patient(appointment_id):
     if not user_id:
         return "Error: You must be logged in as a patient to cancel appointments."
 
-    # Use write_query to ensure COMMIT happens.
-    # verify 'patient_id' in the WHERE clause for security (prevent deleting others' data)
-    return write_query(
-        """
-        UPDATE appointments
-        SET status = 'cancelled'
-        WHERE id = ? AND patient_id = ?
-        """,
-        (appointment_id, user_id)
-    )
+    # Scoped to this patient (prevents cancelling others' data); frees the slot seat too
+    try:
+        status = booking.cancel_appointment(get_db_connection(), appointment_id, patient_id=user_id)
+    except Exception as e:
+        logger.error(f"SQL Write Error: {e}")
+        return f"Database error: {e}"
+
+    if status == booking.CANCELLED:
+        return "Success"
+    return "No records were updated. Check if the ID is correct."
 
 def complete_appointment_by_doctor(appointment_id):
     user_id = session.get('doctor_id')
@@ -310,6 +366,9 @@ def generate_slots_by_doctor(date, time, n_slots):
     if not user_id:
         return "Error: You must be logged in as a doctor to generate slots."
 
+    # Store ISO dates like the web form does, so slots sort and index correctly
+    date = availability.normalize_date(date) or date
+
     return write_query(
         """
         INSERT INTO slots (doctor_id, date, time, capacity)
@@ -319,28 +378,136 @@ def generate_slots_by_doctor(date, time, n_slots):
     )
 
 
+# Only these functions are callable by the model (see src/tools.py)
+TOOL_REGISTRY = tools.build_registry(TOOL_DECLARATIONS, {
+    "search_doctor_by_specialization": search_doctor_by_specialization,
+    "search_doctor_by_name": search_doctor_by_name,
+    "search_clinic_by_city": search_clinic_by_city,
+    "search_appointments_by_patient": search_appointments_by_patient,
+    "get_doctor_schedule": get_doctor_schedule,
+    "cancel_appointment_by_patient": cancel_appointment_by_patient,
+    "complete_appointment_by_doctor": complete_appointment_by_doctor,
+    "generate_slots_by_doctor": generate_slots_by_doctor,
+    "book_appointment_by_patient": book_appointment_by_patient,
+    "get_available_slots": get_available_slots,
+    "search_available_doctors": search_available_doctors,
+})
+
+
+# Shared pool for running several tool calls from one model turn in parallel
+CHAT_TOOL_WORKERS = int(os.getenv("CHAT_TOOL_WORKERS", "3"))
+_tool_executor = ThreadPoolExecutor(max_workers=CHAT_TOOL_WORKERS, thread_name_prefix="gemini-tool")
+
+
+def _run_function_call(function_call):
+    fname = function_call.name
+    args = dict(function_call.args)
+    logger.info(f"Gemini Tool request --> {fname}({args})")
+    # Compact, size-capped text is what the model gets (tools.format_result)
+    result = tools.format_result(offload(tools.call_tool, TOOL_REGISTRY, fname, args))
+    logger.info(f"Tool Result: {result}")
+    return fname, result
+
+
+def execute_function_calls(function_calls):
+    """
+    Runs the model's function calls and returns [(name, result), ...] in call order.
+    Multiple calls run on the tool pool; each worker gets a copy of the request
+    context, so session checks work and it checks out its own pooled connection.
+    """
+    if len(function_calls) == 1:
+        return [_run_function_call(function_calls[0])]
+
+    futures = [
+        _tool_executor.submit(copy_current_request_context(_run_function_call), fc)
+        for fc in function_calls
+    ]
+    return [f.result() for f in futures]
+
+
+# Bounds on one chat turn: model round trips spent on tools, and wall time
+CHAT_MAX_TOOL_ROUNDS = int(os.getenv("CHAT_MAX_TOOL_ROUNDS", "4"))
+CHAT_TIME_BUDGET = float(os.getenv("CHAT_TIME_BUDGET", "30"))
+BUDGET_NOTICE = "Error: No more tool calls for this message. Answer with the information you already have."
+BUDGET_REPLY = "Sorry, that needed more lookups than I can do at once. Could you narrow it down?"
+
+
+class ModelTimeout(TimeoutError):
+    """A model call did not finish within the chat turn's time budget."""
+
+
+def _is_timeout(exc):
+    if isinstance(exc, TimeoutError):
+        return True
+    try:
+        from google.api_core import exceptions
+    except ImportError:
+        return False
+    return isinstance(exc, (exceptions.DeadlineExceeded, exceptions.RetryError))
+
+
+class ToolBudget:
+    """
+    Caps the tool loop of one chat turn at CHAT_MAX_TOOL_ROUNDS rounds and
+    CHAT_TIME_BUDGET seconds. Once either is spent the model's calls are not
+    run but answered with BUDGET_NOTICE, so it gets one last turn to reply
+    with what it has; if it asks for tools again the loop stops. Model calls
+    get the time left as their request timeout (request_options()).
+    """
+
+    def __init__(self, max_rounds=None, seconds=None):
+        self.max_rounds = CHAT_MAX_TOOL_ROUNDS if max_rounds is None else max_rounds
+        self.deadline = time.monotonic() + (CHAT_TIME_BUDGET if seconds is None else seconds)
+        self.rounds = 0
+        self.exhausted = False
+
+    def queue_timeout(self):
+        # Waiting for a model slot may not outlast the turn's deadline
+        return max(0.0, min(LLM_QUEUE_TIMEOUT, self.deadline - time.monotonic()))
+
+    def request_options(self):
+        """Timeout for the next model call; ModelTimeout when no time is left."""
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise ModelTimeout()
+        return {"timeout": remaining}
+
+    def expire(self):
+        # A model call hit the deadline: the turn ends with BUDGET_REPLY
+        self.exhausted = True
+        logger.warning(f"[Gemini] Model call stopped by the chat time budget after {self.rounds} tool rounds")
+
+    def run(self, function_calls):
+        """[(name, result), ...] for this round, or None when the loop must stop."""
+        if self.exhausted:
+            return None
+        if self.rounds >= self.max_rounds or time.monotonic() >= self.deadline:
+            self.exhausted = True
+            logger.warning(f"[Gemini] Tool budget spent after {self.rounds} rounds; {len(function_calls)} call(s) refused")
+            return [(fc.name, BUDGET_NOTICE) for fc in function_calls]
+        self.rounds += 1
+        return execute_function_calls(function_calls)
+
+
 # TEXT PROCESSING HELPERS
+def parts_text(parts):
+    """
+    Reply text of a response's parts. A stream only sees pieces of parts, which
+    it concatenates, so parts are concatenated here too: /chat_with_gemini and
+    its /stream variant then store and cache the same text for the same reply.
+    """
+    return "".join(p.text for p in parts if getattr(p, "text", None))
+
+
 def get_response_text(resp):
     """Safely extracts the raw text from the Gemini response object."""
     try:
-        if hasattr(resp, 'text'):
-            return resp.text
-        else:
-            result = resp._result
-            parts = result.candidates[0].content.parts
-            return "\n".join([p.text for p in parts if hasattr(p, "text")])
+        return parts_text(resp.candidates[0].content.parts)
     except Exception as e:
         logger.error(f"Text extraction failed: {e}")
         return ""
 
-def clean_text_for_display(text):
-    """
-    Removes [ID: 123] tags and cleans Markdown for the frontend.
-    This hides the technical IDs from the user while keeping them in the DB history.
-    """
-    if not text:
-        return "I couldn't generate a response."
-
+def _clean_markup(text):
     # Remove the "Invisible Ink" IDs (e.g., [ID: 5])
     # This regex finds [ID: number] and replaces it with an empty string
     text = re.sub(r'\s*\[ID: \d+\]', '', text)
@@ -353,128 +520,392 @@ def clean_text_for_display(text):
     
     # Remove generic header Markdown (#)
     text = text.replace("##", "").replace("###", "")
+
+    return text
+
+
+def clean_text_for_display(text):
+    """
+    Removes [ID: 123] tags and cleans Markdown for the frontend.
+    This hides the technical IDs from the user while keeping them in the DB history.
+    """
+    if not text:
+        return "I couldn't generate a response."
+
+    return _clean_markup(text).strip()
+
+
+# Tail of a chunk that may be the start of something _clean_markup rewrites:
+# an unclosed "[ID: ..." tag (with its leading spaces) or a run of spaces, * and #
+_PENDING_MARKUP = re.compile(r'(\s*\[[^\]\n]{0,20}|[\s*#]+)$')
+
+
+class StreamCleaner:
+    """
+    Incremental clean_text_for_display for streamed chunks. Text that could
+    still turn into a tag or marker is held back until the next chunk, so the
+    concatenated output matches cleaning the whole reply at once.
+    """
+
+    def __init__(self):
+        self.pending = ""
+        self.started = False
+
+    def _emit(self, text):
+        text = _clean_markup(text)
+        if not self.started:
+            text = text.lstrip()
+            self.started = bool(text)
+        return text
+
+    def feed(self, chunk):
+        self.pending += chunk
+        match = _PENDING_MARKUP.search(self.pending)
+        cut = match.start() if match else len(self.pending)
+        ready, self.pending = self.pending[:cut], self.pending[cut:]
+        return self._emit(ready) if ready else ""
+
+    def flush(self):
+        text, self.pending = self.pending, ""
+        return self._emit(text).rstrip()
+
+
+# Chat helpers shared by the JSON and streaming endpoints
+def identify_user():
+    if 'patient_id' in session:
+        return session['patient_id'], 'patient'
+    if 'doctor_id' in session:
+        return session['doctor_id'], 'doctor'
+    return 0, 'guest'
+
+
+def build_prompt(user_msg, user_id, user_type):
+    # Only the per-turn context; the static prompt is the system instruction
+    excerpts = offload(knowledge.retrieve, user_msg)
+    today_str = datetime.now().strftime("%A, %d-%m-%Y")
+
+    context_header = f"CURRENT USER ROLE: {user_type.upper()}"
+    if user_id != 0:
+        context_header += f" (ID: {user_id})"
     
-    return text.strip()
+    context_header += f"\nCURRENT SYSTEM DATE: {today_str}" 
+    
+    prompt = ""
+    if excerpts:
+        prompt = f"### CLINIC POLICY EXCERPTS\n{knowledge.format_excerpts(excerpts)}\n\n"
+
+    return f"""{prompt}{context_header}
+User Query: {user_msg}"""
+
+
+def start_chat(model, user_id, user_type):
+    db_history = []
+    if user_id != 0:
+        db_history = offload(get_chat_history_for_gemini, user_id, user_type, limit=10)
+    return model.start_chat(history=db_history)
+
+
+def release_db():
+    # Hand the pooled connection back before waiting on the model; the next
+    # query checks one out again, so chats in flight never starve /book.
+    close_db()
+
+
+def send_message(chat, message, budget=None, **kwargs):
+    """chat.send_message under the LLM concurrency limit (src/concurrency.py)."""
+    release_db()
+    with llm_slot(budget.queue_timeout() if budget else LLM_QUEUE_TIMEOUT):
+        start = time.perf_counter()
+        try:
+            if budget:
+                kwargs["request_options"] = budget.request_options()
+            response = chat.send_message(message, **kwargs)
+        except Exception as e:
+            if budget and _is_timeout(e):
+                budget.expire()
+                raise ModelTimeout() from e
+            raise
+        record_usage(response, (time.perf_counter() - start) * 1000)
+        return response
+
+
+# Token usage per model call, summed for this worker
+_usage = {"calls": 0, "prompt_tokens": 0, "output_tokens": 0, "cached_tokens": 0, "total_ms": 0.0}
+_usage_lock = threading.Lock()
+
+
+def record_usage(response, elapsed_ms):
+    meta = getattr(response, "usage_metadata", None)
+    prompt = getattr(meta, "prompt_token_count", 0) or 0
+    output = getattr(meta, "candidates_token_count", 0) or 0
+    cached = getattr(meta, "cached_content_token_count", 0) or 0
+    with _usage_lock:
+        _usage["calls"] += 1
+        _usage["prompt_tokens"] += prompt
+        _usage["output_tokens"] += output
+        _usage["cached_tokens"] += cached
+        _usage["total_ms"] += elapsed_ms
+    metrics.observe("llm_call_duration_seconds", elapsed_ms / 1000)
+    metrics.inc("llm_tokens_total", prompt, kind="prompt")
+    metrics.inc("llm_tokens_total", output, kind="output")
+    metrics.inc("llm_tokens_total", cached, kind="cached")
+    logger.info(f"[Gemini] {prompt} prompt + {output} output tokens ({cached} cached) in {elapsed_ms:.0f} ms")
+
+
+def usage_stats():
+    with _usage_lock:
+        calls = _usage["calls"]
+        return dict(
+            _usage,
+            avg_prompt_tokens=round(_usage["prompt_tokens"] / calls, 1) if calls else 0.0,
+            avg_ms=round(_usage["total_ms"] / calls, 1) if calls else 0.0,
+        )
+
+
+def collect_function_calls(response):
+    # Collect every function call in the response (the model may ask for several)
+    function_calls = []
+    try:
+        for part in response.candidates[0].content.parts:
+            if part.function_call and part.function_call.name:
+                function_calls.append(part.function_call)
+    except (AttributeError, IndexError):
+        pass
+    return function_calls
+
+
+def function_response_parts(results):
+    # Plain dicts: the SDK converts them to protos Parts, and gem.py never has
+    # to import the protos module itself
+    return [
+        {
+            "function_response": {
+                "name": fname,
+                "response": {'result': result}
+            }
+        }
+        for fname, result in results
+    ]
+
+
+def chunk_text(chunk):
+    try:
+        return parts_text(chunk.candidates[0].content.parts)
+    except (AttributeError, IndexError):
+        return ""
+
+
+def save_exchange(user_id, user_type, user_msg, final_text):
+    if user_id != 0:
+        # Both messages go out in the same batch.
+        # Save the RAW text (with [ID: 123]) to history so memory works
+        chat_memory.append(
+            current_app.config["DATABASE"], user_id, user_type,
+            [("user", user_msg), ("model", final_text)]
+        )
+
+
+def cached_reply(user_type, user_msg):
+    # Only guest replies are shared; they carry no personal data
+    if user_type != 'guest':
+        return None
+    return offload(response_cache.get, user_type, user_msg)
+
+
+def cache_reply(user_type, user_msg, final_text, display_reply, tool_results):
+    if user_type == 'guest' and final_text not in (FALLBACK_REPLY, BUDGET_REPLY):
+        offload(response_cache.put, user_type, user_msg, display_reply, tool_results)
+
+
+FALLBACK_REPLY = "I have processed your request. Is there anything else you need?"
+BUSY_REPLY = "The assistant is busy right now, please try again in a moment."
+GENERATION_CONFIG = {"candidate_count": 1, "temperature": 0.5}
 
 
 # main function
 def gemini_chat(request):
     """Handles a chat request with memory and tools."""
 
-    if gemini_model is None:
+    model = get_model()
+    if model is None:
         return jsonify({"error": "Gemini model unavailable"}), 500
 
     user_msg = request.json.get("message", "").strip()
     if not user_msg:
         return jsonify({"reply": "Say something…"}), 200
 
-    # Identify User
-    if 'patient_id' in session:
-        user_id = session['patient_id']
-        user_type = 'patient'
-    elif 'doctor_id' in session:
-        user_id = session['doctor_id']
-        user_type = 'doctor'
-    else:
-        user_id = 0
-        user_type = 'guest'
+    user_id, user_type = identify_user()
 
     try:
-        # Load History
-        db_history = []
-        if user_id != 0:
-            db_history = get_chat_history_for_gemini(user_id, user_type, limit=10)
-
-        chat = gemini_model.start_chat(history=db_history)
-        policy_text = load_policy_document()
-        today_str = datetime.now().strftime("%A, %d-%m-%Y")
-
-        context_header = f"CURRENT USER ROLE: {user_type.upper()}"
-        if user_id != 0:
-            context_header += f" (ID: {user_id})"
-        
-        context_header += f"\nCURRENT SYSTEM DATE: {today_str}" 
-        
-        full_prompt = f"""{sys_prompt}
+        cached = cached_reply(user_type, user_msg)
+        if cached is not None:
+            return jsonify({"reply": cached})
 
-        ### KNOWLEDGE BASE (Clinic Policies)
-        Use the following information to answer questions about refunds, hours, or insurance.
-        If the answer is found here, you do NOT need to call a tool.
-        {policy_text}
-
-        {context_header}
-        User Query: {user_msg}"""
+        chat = start_chat(model, user_id, user_type)
+        full_prompt = build_prompt(user_msg, user_id, user_type)
         
-        response = chat.send_message(
-            full_prompt,
-            generation_config={"candidate_count": 1, "temperature": 0.5}
-        )
+        budget = ToolBudget()
+        tool_results = []
+        try:
+            response = send_message(chat, full_prompt, budget, generation_config=GENERATION_CONFIG)
 
-        # loop as long as the model wants to call a function.
-        while True:
-            # Checking if the response contains a function call
-            function_call = None
-            try:
-                # Iterate through all parts to find a function call
-                for part in response.candidates[0].content.parts:
-                    if part.function_call and part.function_call.name:
-                        function_call = part.function_call
-                        break
-            except (AttributeError, IndexError):
-                pass
+            # loop as long as the model wants to call a function (within the budget).
+            while True:
+                function_calls = collect_function_calls(response)
 
-            # If no function call found, Break the loop to show text.
-            if not function_call:
-                break
+                # If no function call found, Break the loop to show text.
+                if not function_calls:
+                    break
 
-            # Executing the tool
-            fname = function_call.name
-            args = dict(function_call.args)
-            logger.info(f"Gemini Tool request --> {fname}({args})")
+                # Executing the tools (concurrently when there is more than one)
+                results = budget.run(function_calls)
+                if results is None:
+                    break
+                tool_results += results
 
-            result = "Error: Tool function not found."
-            if fname in globals():
-                try:
-                    result = globals()[fname](**args)
-                except Exception as e:
-                    result = f"Tool Execution Error: {e}"
-
-            # Send tool result back to Gemini
-            logger.info(f"Tool Result: {result}")
-            response = chat.send_message(
-                Part(
-                    function_response=FunctionResponse(
-                        name=fname,
-                        response={'result': str(result)} 
-                    )
-                )
-            )
+                # Send all tool results back to Gemini in a single message
+                response = send_message(chat, function_response_parts(results), budget)
+        except ModelTimeout:
+            # Out of time: answered with BUDGET_REPLY below
+            response = None
 
         # Extract Final Text (Robust Method)
         final_text = ""
         try:
-            if response.candidates:
-                # Join all text parts (sometimes the model splits thoughts and answers)
-                parts = response.candidates[0].content.parts
-                final_text = "\n".join([p.text for p in parts if p.text])
+            if response is not None and response.candidates:
+                # All text parts (sometimes the model splits thoughts and answers)
+                final_text = parts_text(response.candidates[0].content.parts)
         except Exception as e:
             logger.error(f"Text Extraction Error: {e}")
             final_text = ""
 
         # Fallback if the model returns nothing (rare, but handles the 'Action Completed' case)
         if not final_text.strip():
-            final_text = "I have processed your request. Is there anything else you need?"
+            final_text = BUDGET_REPLY if budget.exhausted else FALLBACK_REPLY
 
         # Clean & Save
         display_reply = clean_text_for_display(final_text)
-
-        if user_id != 0:
-            save_chat_log(user_id, user_type, "user", user_msg)
-            # Save the RAW text (with [ID: 123]) to history so memory works
-            save_chat_log(user_id, user_type, "model", final_text)
+        save_exchange(user_id, user_type, user_msg, final_text)
+        cache_reply(user_type, user_msg, final_text, display_reply, tool_results)
 
         return jsonify({"reply": display_reply})
 
+    except LLMBusy:
+        return jsonify({"error": BUSY_REPLY}), 503
     except Exception as exc:
         logger.exception("Chat failure: %s", exc)
-        return jsonify({"error": "Chat failed"}), 500
\ No newline at end of file
+        return jsonify({"error": "Chat failed"}), 500
+
+
+def sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+def gemini_chat_stream(request):
+    """
+    Streaming variant of gemini_chat as Server-Sent Events:
+      tool  {"name", "status": "running"|"done"}  around each tool call
+      delta {"text"}                               cleaned reply text as it is generated
+      done  {"reply"}                              the full cleaned reply
+      error {"error"}
+    The exchange is saved to chat_history once the reply is complete.
+    """
+
+    model = get_model()
+    if model is None:
+        return jsonify({"error": "Gemini model unavailable"}), 500
+
+    user_msg = request.json.get("message", "").strip()
+    if not user_msg:
+        return jsonify({"reply": "Say something…"}), 200
+
+    user_id, user_type = identify_user()
+
+    def generate():
+        try:
+            cached = cached_reply(user_type, user_msg)
+            if cached is not None:
+                yield sse("delta", {"text": cached})
+                yield sse("done", {"reply": cached})
+                return
+
+            chat = start_chat(model, user_id, user_type)
+            message = build_prompt(user_msg, user_id, user_type)
+            cleaner = StreamCleaner()
+            tool_results = []
+            budget = ToolBudget()
+
+            while True:
+                function_calls = []
+                # Like gemini_chat, only the final round's text is the reply;
+                # text sent alongside tool calls is shown but not kept
+                raw = []
+                release_db()
+                # The slot covers the whole stream, since reading the chunks is the slow part
+                with llm_slot(budget.queue_timeout()):
+                    start = time.perf_counter()
+                    chunk = None
+                    try:
+                        stream = chat.send_message(
+                            message, generation_config=GENERATION_CONFIG, stream=True,
+                            request_options=budget.request_options(),
+                        )
+                        for chunk in stream:
+                            function_calls += collect_function_calls(chunk)
+                            text = chunk_text(chunk)
+                            if text:
+                                raw.append(text)
+                                delta = cleaner.feed(text)
+                                if delta:
+                                    yield sse("delta", {"text": delta})
+                    except Exception as e:
+                        if not _is_timeout(e):
+                            raise
+                        # Out of time: answered with BUDGET_REPLY below
+                        budget.expire()
+                        raw = []
+                        break
+                    # The last chunk carries the usage totals for the turn
+                    record_usage(chunk, (time.perf_counter() - start) * 1000)
+
+                if not function_calls:
+                    break
+
+                if budget.exhausted:
+                    # Already told to stop calling tools
+                    break
+                for fc in function_calls:
+                    yield sse("tool", {"name": fc.name, "status": "running"})
+                results = budget.run(function_calls)
+                tool_results += results
+                for fname, _ in results:
+                    yield sse("tool", {"name": fname, "status": "done"})
+                message = function_response_parts(results)
+
+            tail = cleaner.flush()
+            if tail:
+                yield sse("delta", {"text": tail})
+
+            final_text = "".join(raw)
+            if not final_text.strip():
+                final_text = BUDGET_REPLY if budget.exhausted else FALLBACK_REPLY
+                yield sse("delta", {"text": clean_text_for_display(final_text)})
+
+            # Same text, history and cache entry as gemini_chat for the same reply
+            display_reply = clean_text_for_display(final_text)
+            save_exchange(user_id, user_type, user_msg, final_text)
+            cache_reply(user_type, user_msg, final_text, display_reply, tool_results)
+            yield sse("done", {"reply": display_reply})
+
+        except LLMBusy:
+            yield sse("error", {"error": BUSY_REPLY})
+        except Exception as exc:
+            logger.exception("Chat stream failure: %s", exc)
+            yield sse("error", {"error": "Chat failed"})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        # No proxy buffering, or the events arrive all at once
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
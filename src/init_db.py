@@ -1,5 +1,7 @@
 import sqlite3, os
 from .logg import logger
+from .db import apply_storage_profile
+from .migrations import migrate
 
 BASE = os.path.dirname(__file__)
 DB = os.path.join('./data', 'clinicBook.db')
@@ -7,100 +9,15 @@ DB = os.path.join('./data', 'clinicBook.db')
 def setup():
     os.makedirs(os.path.join('./data'), exist_ok=True)
     conn = sqlite3.connect(DB)
+    # WAL + tuned PRAGMAs (DB_PROFILE) so readers never wait on booking commits
+    apply_storage_profile(conn)
     cur = conn.cursor()
     # Enable foreign key support
     cur.execute('PRAGMA foreign_keys = ON;')
-    
-    # Create tables
-    cur.executescript('''
-    CREATE TABLE IF NOT EXISTS patients (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        email TEXT UNIQUE NOT NULL,
-        age INTEGER,
-        gender TEXT,
-        phone TEXT,
-        city TEXT,
-        password_hash TEXT
-    );
-                      
-    CREATE TABLE IF NOT EXISTS clinics (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        city TEXT,
-        address TEXT,
-        phone TEXT,
-        average_rating REAL DEFAULT 0.0
-    );
-                      
-    CREATE TABLE IF NOT EXISTS doctors (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        clinic_id INTEGER,
-        name TEXT NOT NULL,
-        specialization TEXT,
-        fees INTEGER,
-        email TEXT UNIQUE NOT NULL,
-        password_hash TEXT,
-        phone TEXT,
-        about TEXT,
-        average_rating REAL DEFAULT 0.0,
-        FOREIGN KEY (clinic_id) REFERENCES clinics(id) ON DELETE SET NULL
-    );
 
-    CREATE TABLE IF NOT EXISTS slots (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        doctor_id INTEGER,
-        date TEXT,
-        time TEXT,
-        capacity INTEGER DEFAULT 1,
-        booked_count INTEGER DEFAULT 0,
-        FOREIGN KEY (doctor_id) REFERENCES doctors(id) ON DELETE CASCADE
-    );
+    # Create/upgrade tables and indexes (see src/migrations.py)
+    migrate(conn)
 
-    CREATE TABLE IF NOT EXISTS appointments (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        patient_id INTEGER,
-        doctor_id INTEGER,
-        slot_id INTEGER,
-        patient_name TEXT,
-        patient_phone TEXT,
-        symptoms TEXT,
-        date TEXT NOT NULL,
-        status TEXT DEFAULT 'booked',
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (patient_id) REFERENCES patients(id) ON DELETE CASCADE,
-        FOREIGN KEY (doctor_id) REFERENCES doctors(id) ON DELETE CASCADE,
-        FOREIGN KEY (slot_id) REFERENCES slots(id) ON DELETE CASCADE
-    );
-    
-    CREATE TABLE IF NOT EXISTS reviews (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        patient_id INTEGER NOT NULL,
-        doctor_id INTEGER,
-        clinic_id INTEGER,
-        rating INTEGER CHECK(rating >= 1 AND rating <= 5),
-        comment TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (patient_id) REFERENCES patients(id) ON DELETE CASCADE,
-        FOREIGN KEY (doctor_id) REFERENCES doctors(id) ON DELETE CASCADE,
-        FOREIGN KEY (clinic_id) REFERENCES clinics(id) ON DELETE CASCADE,
-        CHECK (
-            (doctor_id IS NOT NULL AND clinic_id IS NULL) OR
-            (doctor_id IS NULL AND clinic_id IS NOT NULL)
-        )
-    );
-
-    CREATE TABLE IF NOT EXISTS chat_history (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        user_type TEXT, -- 'patient' or 'doctor'
-        role TEXT,      -- 'user' or 'model'
-        message TEXT,
-        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-    );
-    ''')
-
-    conn.commit()
     conn.close()
     logger.info(f'DB schema ready at {DB}')
 
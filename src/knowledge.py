@@ -0,0 +1,195 @@
+import os
+import re
+import sqlite3
+
+from .logg import logger
+from .db import connection, begin_immediate
+
+# Clinic policy knowledge base. clinic_policies.txt is split into small
+# chunks and indexed with FTS5 in a file next to clinicBook.db; each chat
+# turn gets only the top-k BM25 matches for the user's question, so the
+# prompt stays the same size however long the policy document grows.
+
+POLICY_PATH = os.getenv(
+    "POLICY_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "clinic_policies.txt")
+)
+KB_PATH = os.getenv("KB_PATH", os.path.join("./data", "knowledge.db"))
+KB_TOP_K = int(os.getenv("KB_TOP_K", "4"))
+KB_CHUNK_WORDS = int(os.getenv("KB_CHUNK_WORDS", "120"))
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS kb_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    ) WITHOUT ROWID;
+    CREATE VIRTUAL TABLE IF NOT EXISTS kb_chunks USING fts5(
+        heading, body, tokenize = 'porter unicode61'
+    );
+'''
+
+# Words that match nearly every chunk and only dilute the ranking
+STOPWORDS = frozenset('''
+    a an and are as at be by can could do does did for from has have how i if in is it
+    me my of on or our please should so that the their there this to us was we what
+    when where which who will with would you your
+'''.split())
+
+_HEADING = re.compile(r'^\s*(#+\s*.+|[A-Z][A-Z0-9 &/\-]{2,}:?|.{1,60}:)\s*$')
+
+
+def _is_heading(paragraph):
+    return "\n" not in paragraph.strip() and bool(_HEADING.match(paragraph))
+
+
+def chunk_text(text, max_words=KB_CHUNK_WORDS):
+    """
+    Splits the policy text into [(heading, body), ...]. Paragraphs are packed
+    into chunks of at most `max_words` words under their nearest heading;
+    longer paragraphs are split on sentence boundaries.
+    """
+    chunks = []
+    heading, body, words = "", [], 0
+
+    def flush():
+        nonlocal body, words
+        if body:
+            chunks.append((heading, "\n\n".join(body)))
+        body, words = [], 0
+
+    for paragraph in re.split(r'\n\s*\n', text or ""):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if _is_heading(paragraph):
+            flush()
+            heading = paragraph.strip("#: ").strip()
+            continue
+
+        pieces = [paragraph]
+        if len(paragraph.split()) > max_words:
+            pieces, current = [], []
+            for sentence in re.split(r'(?<=[.!?])\s+', paragraph):
+                if current and len(" ".join(current + [sentence]).split()) > max_words:
+                    pieces.append(" ".join(current))
+                    current = []
+                current.append(sentence)
+            if current:
+                pieces.append(" ".join(current))
+
+        for piece in pieces:
+            n = len(piece.split())
+            if body and words + n > max_words:
+                flush()
+            body.append(piece)
+            words += n
+    flush()
+    return chunks
+
+
+def _source_version(path):
+    st = os.stat(path)
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
+def _meta(conn, key):
+    row = conn.execute("SELECT value FROM kb_meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def build_index(conn, text, version=""):
+    """Replaces the indexed chunks with those of `text` in one transaction."""
+    chunks = chunk_text(text)
+    begin_immediate(conn)
+    try:
+        conn.execute("DELETE FROM kb_chunks")
+        conn.executemany("INSERT INTO kb_chunks (heading, body) VALUES (?, ?)", chunks)
+        conn.execute("INSERT OR REPLACE INTO kb_meta (key, value) VALUES ('source_version', ?)", (version,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    logger.info(f"[Knowledge] Indexed {len(chunks)} policy chunks.")
+    return len(chunks)
+
+
+_ready_pid = None
+_checked_version = None
+
+
+def ensure_index(path=None):
+    """
+    Rebuilds the index when the policy file has changed since it was built
+    (by this or any other worker). Cheap when nothing changed: one stat().
+    Returns False when there is no policy document.
+    """
+    global _ready_pid, _checked_version
+    path = path or POLICY_PATH
+    try:
+        version = _source_version(path)
+    except OSError:
+        return False
+    if _ready_pid == os.getpid() and version == _checked_version:
+        return True
+
+    os.makedirs(os.path.dirname(KB_PATH) or ".", exist_ok=True)
+    with connection(KB_PATH) as conn:
+        conn.executescript(SCHEMA)
+        if _meta(conn, "source_version") != version:
+            with open(path, "r") as f:
+                text = f.read()
+            build_index(conn, text, version)
+    _ready_pid, _checked_version = os.getpid(), version
+    return True
+
+
+def version():
+    """Version of the indexed policy document ('' when there is none)."""
+    return _checked_version if ensure_index() else ""
+
+
+def build_match(query):
+    words = [w for w in re.findall(r"\w+", (query or "").lower()) if len(w) > 1 and w not in STOPWORDS]
+    if not words:
+        return None
+    return " OR ".join('"' + w + '"' for w in dict.fromkeys(words))
+
+
+def retrieve(query, k=KB_TOP_K):
+    """Top-k policy chunks for `query` as [(heading, body), ...], best first."""
+    try:
+        if not ensure_index():
+            return []
+        match = build_match(query)
+        if match is None:
+            return []
+        with connection(KB_PATH) as conn:
+            rows = conn.execute(
+                '''SELECT heading, body FROM kb_chunks WHERE kb_chunks MATCH ?
+                ORDER BY bm25(kb_chunks, 2.0, 1.0) LIMIT ?''',
+                (match, k)
+            ).fetchall()
+        return [(r["heading"], r["body"]) for r in rows]
+    except Exception as e:
+        # A broken index must not take the chat down
+        logger.error(f"[Knowledge] Retrieval failed: {e}")
+        return []
+
+
+def format_excerpts(chunks):
+    return "\n\n".join(f"[{heading}]\n{body}" if heading else body for heading, body in chunks)
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] != "--rebuild":
+        for heading, body in retrieve(" ".join(sys.argv[1:])):
+            print(f"--- {heading}\n{body}\n")
+    else:
+        os.makedirs(os.path.dirname(KB_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(KB_PATH)
+        conn.executescript(SCHEMA)
+        with open(POLICY_PATH, "r") as f:
+            n = build_index(conn, f.read(), _source_version(POLICY_PATH))
+        conn.close()
+        print(f"Indexed {n} chunks.")
@@ -0,0 +1,225 @@
+import json
+import os
+import re
+import threading
+import time
+
+from .logg import logger
+
+# Model backends for the chat pipeline in src/gem.py. A backend is anything
+# with start_chat(history) returning a chat whose send_message(message,
+# generation_config=None, stream=False, request_options=None) answers with
+# Gemini-shaped responses: response.candidates[0].content.parts, each part
+# having .text or .function_call (.name, .args), plus response.usage_metadata.
+# request_options={"timeout": seconds} bounds the call (TimeoutError).
+#
+#   CHAT_BACKEND=gemini   the real model (default)
+#   CHAT_BACKEND=replay   scripted conversations from CHAT_REPLAY_PATH, no network
+#
+# With CHAT_RECORD_PATH set, real Gemini conversations are appended to that
+# file in the replay format, so production traffic can be replayed offline.
+#
+# Replay file: one JSON conversation per line,
+#   {"match": "dermatologist", "turns": [
+#       {"function_calls": [{"name": "search_doctor_by_specialization",
+#                            "args": {"specialization": "Dermatologist"}}],
+#        "latency_ms": 400},
+#       {"text": "Here are the dermatologists ... [ID: 4]"}]}
+# The first conversation whose `match` regex is found in the user's message is
+# played back one turn per send_message; turns without latency_ms use
+# CHAT_REPLAY_LATENCY_MS.
+
+CHAT_BACKEND = os.getenv("CHAT_BACKEND", "gemini")
+CHAT_REPLAY_PATH = os.getenv("CHAT_REPLAY_PATH", "")
+CHAT_REPLAY_LATENCY_MS = float(os.getenv("CHAT_REPLAY_LATENCY_MS", "300"))
+# Streamed replay text arrives in chunks of this many words
+CHAT_REPLAY_CHUNK_WORDS = int(os.getenv("CHAT_REPLAY_CHUNK_WORDS", "8"))
+CHAT_RECORD_PATH = os.getenv("CHAT_RECORD_PATH", "")
+
+DEFAULT_CONVERSATION = {"match": "", "turns": [{"text": "This is a replayed reply. No script matched your message."}]}
+
+
+class _Obj:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+def _estimate_tokens(value):
+    return max(1, len(str(value)) // 4)
+
+
+def make_response(text="", function_calls=(), prompt=""):
+    """A Gemini-shaped response with the given text and/or function calls."""
+    parts = [
+        _Obj(text="", function_call=_Obj(name=fc["name"], args=dict(fc.get("args") or {})))
+        for fc in function_calls
+    ]
+    if text:
+        parts.append(_Obj(text=text, function_call=None))
+    return _Obj(
+        candidates=[_Obj(content=_Obj(parts=parts))],
+        usage_metadata=_Obj(
+            prompt_token_count=_estimate_tokens(prompt),
+            candidates_token_count=_estimate_tokens(text) if text else len(function_calls) * 10,
+            cached_content_token_count=0,
+        ),
+    )
+
+
+def _message_text(message):
+    if isinstance(message, str):
+        return message
+    # Function responses sent back to the model
+    return json.dumps([str(part) for part in message])
+
+
+def load_script(path):
+    conversations = []
+    with open(path, "r") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                conv = json.loads(line)
+                conv["pattern"] = re.compile(conv.get("match") or "", re.IGNORECASE)
+                conversations.append(conv)
+            except (ValueError, re.error) as e:
+                logger.warning(f"[Replay] Skipping line {n} of {path}: {e}")
+    return conversations
+
+
+class ReplayChat:
+    def __init__(self, model, history):
+        self.model = model
+        self.history = list(history or [])
+        self.turns = None
+
+    def _next_turn(self, message):
+        if self.turns is None:
+            self.turns = iter(self.model.pick(_message_text(message))["turns"])
+        # A script that runs out of turns ends with an empty text reply
+        return next(self.turns, {"text": ""})
+
+    def send_message(self, message, generation_config=None, stream=False, request_options=None):
+        turn = self._next_turn(message)
+        latency = turn.get("latency_ms", self.model.latency_ms) / 1000
+        text = turn.get("text", "")
+        calls = turn.get("function_calls", [])
+        prompt = _message_text(message)
+        timeout = (request_options or {}).get("timeout")
+        if timeout is not None and latency > timeout:
+            # Like a model call that hits its deadline
+            time.sleep(timeout)
+            raise TimeoutError(f"Replay turn takes {latency:.2f}s, timeout {timeout:.2f}s")
+        if not stream:
+            time.sleep(latency)
+            return make_response(text, calls, prompt)
+        return self._stream(text, calls, prompt, latency)
+
+    def _stream(self, text, calls, prompt, latency):
+        words = re.findall(r"\S+\s*", text)
+        size = max(1, CHAT_REPLAY_CHUNK_WORDS)
+        chunks = ["".join(words[i:i + size]) for i in range(0, len(words), size)] or [""]
+        # Latency is spread over the chunks; the first one carries half of it
+        time.sleep(latency / 2)
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(latency / 2 / max(1, len(chunks) - 1))
+            last = i == len(chunks) - 1
+            yield make_response(chunk, calls if last else (), prompt)
+
+
+class ReplayModel:
+    """Plays scripted conversations; see the module comment for the file format."""
+
+    def __init__(self, conversations=(), latency_ms=CHAT_REPLAY_LATENCY_MS):
+        self.conversations = list(conversations)
+        self.latency_ms = latency_ms
+
+    @classmethod
+    def from_path(cls, path, latency_ms=CHAT_REPLAY_LATENCY_MS):
+        conversations = load_script(path) if path else []
+        logger.info(f"[Replay] Loaded {len(conversations)} scripted conversations from {path or '(none)'}.")
+        return cls(conversations, latency_ms)
+
+    def pick(self, message):
+        # Match against the user's own words when the prompt has the usual header
+        query = message.rsplit("User Query:", 1)[-1]
+        for conv in self.conversations:
+            if conv["pattern"].search(query):
+                return conv
+        return DEFAULT_CONVERSATION
+
+    def start_chat(self, history=None):
+        return ReplayChat(self, history)
+
+
+class RecordingChat:
+    def __init__(self, chat, model):
+        self.chat = chat
+        self.model = model
+        self.query = None
+        self.turns = []
+
+    def send_message(self, message, generation_config=None, stream=False, request_options=None):
+        if self.query is None and isinstance(message, str):
+            self.query = message.rsplit("User Query:", 1)[-1].strip()
+        start = time.perf_counter()
+        kwargs = {"stream": True} if stream else {}
+        if generation_config is not None:
+            kwargs["generation_config"] = generation_config
+        if request_options is not None:
+            kwargs["request_options"] = request_options
+        response = self.chat.send_message(message, **kwargs)
+        if stream:
+            return self._record_stream(response, start)
+        self._record([response], start)
+        return response
+
+    def _record_stream(self, response, start):
+        chunks = []
+        for chunk in response:
+            chunks.append(chunk)
+            yield chunk
+        self._record(chunks, start)
+
+    def _record(self, responses, start):
+        text, calls = "", []
+        for response in responses:
+            try:
+                for part in response.candidates[0].content.parts:
+                    if part.function_call and part.function_call.name:
+                        calls.append({"name": part.function_call.name, "args": dict(part.function_call.args)})
+                    elif part.text:
+                        text += part.text
+            except (AttributeError, IndexError):
+                continue
+        turn = {"latency_ms": round((time.perf_counter() - start) * 1000)}
+        if calls:
+            turn["function_calls"] = calls
+        if text:
+            turn["text"] = text
+        self.turns.append(turn)
+        if not calls:
+            self.model.save(self.query or "", self.turns)
+
+
+class RecordingModel:
+    """Wraps a real model and appends every finished conversation to a replay file."""
+
+    def __init__(self, model, path):
+        self.model = model
+        self.path = path
+        self._lock = threading.Lock()
+
+    def start_chat(self, history=None):
+        return RecordingChat(self.model.start_chat(history=history), self)
+
+    def save(self, query, turns):
+        line = json.dumps({"match": re.escape(query), "turns": turns}, default=str)
+        try:
+            with self._lock, open(self.path, "a") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            logger.error(f"[Replay] Could not record conversation: {e}")
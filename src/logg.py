@@ -1,19 +1,190 @@
+import atexit
+import json
 import logging
 import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+
+from flask import has_request_context, request
+
+# Logging never touches the disk on the request path: `logger` only puts
+# records on an in-memory queue (QueueHandler) and a listener thread writes
+# them out in batches, flushing when the queue runs dry, every LOG_BATCH
+# records, or right away for warnings and errors.
+#
+#   LOG_FORMAT=text|json     json: one object per line with the request id
+#   LOG_PER_WORKER=1         one file per process (gunicorn.conf.py sets it), so
+#                            several workers never rotate the same file: app.worker<N>.log
+#                            under gunicorn, where N is a slot reused by replacement
+#                            workers (LOG_WORKER_ID), app.<pid>.log otherwise
+#   LOG_MAX_BYTES / LOG_BACKUPS   size rotation (default)
+#   LOG_ROTATE_WHEN=midnight      time rotation instead (any TimedRotatingFileHandler `when`)
+#   LOG_ASYNC=0              write synchronously, e.g. when debugging a crash
+
+LOG_DIR = os.getenv("LOG_DIR", "./logs")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_PER_WORKER = os.getenv("LOG_PER_WORKER", "0") == "1"
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "5"))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "")
+LOG_BATCH = int(os.getenv("LOG_BATCH", "100"))
+LOG_ASYNC = os.getenv("LOG_ASYNC", "1") == "1"
 
-LOG_DIR = './logs'
 if not os.path.exists(LOG_DIR):
-    os.makedirs(LOG_DIR)
+    os.makedirs(LOG_DIR, exist_ok=True)
+
+# Set by app.py for every request (X-Request-ID, or a generated one)
+REQUEST_ID_KEY = "clinicbook.request_id"
+
+
+class RequestIdFilter(logging.Filter):
+    """Tags records with the current request's id; runs in the calling thread."""
+
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            # request.environ is shared with copy_current_request_context, so tool threads get it too
+            record.request_id = request.environ.get(REQUEST_ID_KEY, "-") if has_request_context() else "-"
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "thread": record.threadName,
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _Batched:
+    """File handler mixin: emit() leaves the data in the file buffer until flush_batch()."""
+
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        logging.StreamHandler.flush(self)
+
+
+class BatchedRotatingFileHandler(_Batched, RotatingFileHandler):
+    pass
+
+
+class BatchedTimedRotatingFileHandler(_Batched, TimedRotatingFileHandler):
+    pass
+
+
+class BatchListener(QueueListener):
+    def __init__(self, log_queue, *handlers):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.unflushed = 0
+
+    def flush(self):
+        for handler in self.handlers:
+            getattr(handler, "flush_batch", handler.flush)()
+        self.unflushed = 0
+
+    def dequeue(self, block):
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            # Queue drained: write out the batch before waiting for more
+            if self.unflushed:
+                self.flush()
+            return self.queue.get(block)
+
+    def handle(self, record):
+        super().handle(record)
+        self.unflushed += 1
+        if self.unflushed >= LOG_BATCH or record.levelno >= logging.WARNING:
+            self.flush()
+
+
+def log_path():
+    if not LOG_PER_WORKER:
+        name = "app.log"
+    elif os.getenv("LOG_WORKER_ID"):
+        # Set by gunicorn.conf.py in the master right before the fork, so read it now
+        name = f"app.worker{os.environ['LOG_WORKER_ID']}.log"
+    else:
+        name = f"app.{os.getpid()}.log"
+    return os.path.join(LOG_DIR, name)
+
+
+def _file_handler(path, batched=True):
+    if LOG_ROTATE_WHEN:
+        cls = BatchedTimedRotatingFileHandler if batched else TimedRotatingFileHandler
+        handler = cls(path, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUPS)
+    else:
+        cls = BatchedRotatingFileHandler if batched else RotatingFileHandler
+        handler = cls(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS)
+    handler.setLevel(logging.INFO)
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    return handler
+
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-# formatter
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+_listener = None
+
+
+def configure():
+    """Attaches the handlers for this process (again, after a fork)."""
+    global _listener
+    if _listener is not None:
+        shutdown()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    file_handler = _file_handler(log_path(), batched=LOG_ASYNC)
+    if not LOG_ASYNC:
+        file_handler.addFilter(RequestIdFilter())
+        logger.addHandler(file_handler)
+        return
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+    logger.addHandler(queue_handler)
+    _listener = BatchListener(log_queue, file_handler)
+    _listener.start()
+
+
+def shutdown():
+    """Drains the queue and flushes the file; runs at exit."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener.flush()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def _before_fork():
+    # An unflushed batch would otherwise be written by the parent and the child
+    if _listener is not None:
+        _listener.flush()
+
+
+def _after_fork_in_child():
+    # The parent's listener thread does not exist here (gunicorn --preload)
+    global _listener
+    _listener = None
+    configure()
 
-# file handler
-fh = logging.FileHandler(os.path.join(LOG_DIR, 'app.log'))
-fh.setLevel(logging.INFO)
-fh.setFormatter(formatter)
 
-logger.addHandler(fh)
\ No newline at end of file
+configure()
+atexit.register(shutdown)
+os.register_at_fork(before=_before_fork, after_in_child=_after_fork_in_child)
@@ -0,0 +1,246 @@
+import json
+import os
+import re
+import threading
+import time
+
+# Prometheus metrics for all gunicorn workers of one instance.
+#
+# Each worker keeps its counters and histograms in memory and writes them to
+# METRICS_DIR/<pid>.json every METRICS_FLUSH_INTERVAL seconds. /metrics
+# merges the files of every worker. Counters of workers that have exited are
+# kept, so totals only reset with the server; gauges come from live workers
+# only. gunicorn.conf.py empties the directory when the server starts.
+
+# Off by default: it profiles every SQL statement (ProfiledConnection in src/db.py)
+METRICS = os.getenv("METRICS", "0") == "1"
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join("./data", "metrics"))
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+# Distinct normalized statements tracked per worker; the rest count as "other"
+METRICS_MAX_STATEMENTS = int(os.getenv("METRICS_MAX_STATEMENTS", "200"))
+
+PREFIX = "clinicbook_"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+LLM_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+
+# name -> (type, help, buckets)
+DEFINITIONS = {
+    "http_request_duration_seconds": ("histogram", "Time to the response, by route", LATENCY_BUCKETS),
+    "http_requests_total": ("counter", "Requests by route and status", None),
+    "db_query_duration_seconds": ("histogram", "SQL statement time including fetching, by normalized statement", SQL_BUCKETS),
+    "db_query_rows_total": ("counter", "Rows returned (or changed) by normalized statement", None),
+    "db_pool_connections": ("gauge", "Pooled SQLite connections by database and state", None),
+    "template_render_seconds": ("histogram", "Template render time", LATENCY_BUCKETS),
+    "llm_call_duration_seconds": ("histogram", "Model call time", LLM_BUCKETS),
+    "llm_tokens_total": ("counter", "Model tokens by kind", None),
+    "tool_call_duration_seconds": ("histogram", "Chat tool call time", LATENCY_BUCKETS),
+    "tool_errors_total": ("counter", "Chat tool calls that failed", None),
+}
+
+_counters = {}      # (name, labels) -> value
+_histograms = {}    # (name, labels) -> [bucket counts..., sum, count]
+_gauge_sources = []
+_lock = threading.Lock()
+_writer_pid = None
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    if not METRICS:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+    _start_writer()
+
+
+def observe(name, seconds, **labels):
+    if not METRICS:
+        return
+    buckets = DEFINITIONS[name][2]
+    key = _key(name, labels)
+    with _lock:
+        values = _histograms.get(key)
+        if values is None:
+            values = _histograms[key] = [0] * len(buckets) + [0.0, 0]
+        for i, bound in enumerate(buckets):
+            if seconds <= bound:
+                values[i] += 1
+                break
+        values[-2] += seconds
+        values[-1] += 1
+    _start_writer()
+
+
+def gauge_source(func):
+    """Registers func() -> [(name, labels, value), ...], read at snapshot time."""
+    _gauge_sources.append(func)
+    return func
+
+
+# String and number literals, but not numbered parameters (?1) or digits in names
+_SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|(?<![\w?:@$.])\d+(?:\.\d+)?\b")
+_SQL_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_statements = {}    # SQL text -> label
+_known = set()
+
+
+def normalize_sql(sql):
+    """One label per statement shape: literals become ?, IN lists collapse, whitespace folds."""
+    label = _statements.get(sql)
+    if label is None:
+        label = " ".join(sql.split())
+        label = _SQL_LISTS.sub("(?)", _SQL_LITERALS.sub("?", label))[:200]
+        if label not in _known:
+            if len(_known) >= METRICS_MAX_STATEMENTS:
+                label = "other"
+            else:
+                _known.add(label)
+        if len(_statements) < 10 * METRICS_MAX_STATEMENTS:
+            _statements[sql] = label
+    return label
+
+
+def observe_sql(sql, seconds, rows):
+    statement = normalize_sql(sql)
+    observe("db_query_duration_seconds", seconds, statement=statement)
+    if rows > 0:
+        inc("db_query_rows_total", rows, statement=statement)
+
+
+# Per-worker snapshots
+def _snapshot():
+    with _lock:
+        counters = [[name, dict(labels), value] for (name, labels), value in _counters.items()]
+        histograms = [[name, dict(labels), list(values)] for (name, labels), values in _histograms.items()]
+    gauges = []
+    for source in _gauge_sources:
+        try:
+            gauges += [[name, labels, value] for name, labels, value in source()]
+        except Exception:
+            continue
+    return {"pid": os.getpid(), "time": time.time(), "counters": counters, "histograms": histograms, "gauges": gauges}
+
+
+def write_snapshot():
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(_snapshot(), f)
+    os.replace(tmp, path)
+
+
+def _start_writer():
+    global _writer_pid
+    if _writer_pid == os.getpid():
+        return
+    with _lock:
+        if _writer_pid == os.getpid():
+            return
+        _writer_pid = os.getpid()
+
+    def run():
+        while True:
+            time.sleep(METRICS_FLUSH_INTERVAL)
+            try:
+                write_snapshot()
+            except OSError:
+                pass
+
+    threading.Thread(target=run, name="metrics-writer", daemon=True).start()
+
+
+def reset_dir():
+    """Removes every worker snapshot; call once when the server starts."""
+    if not os.path.isdir(METRICS_DIR):
+        return
+    for name in os.listdir(METRICS_DIR):
+        if name.endswith(".json") or name.endswith(".tmp"):
+            try:
+                os.remove(os.path.join(METRICS_DIR, name))
+            except OSError:
+                pass
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def _read_snapshots():
+    snapshots = []
+    for name in os.listdir(METRICS_DIR):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, name)) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def collect():
+    """Merged counters, histograms and gauges of every worker (this one is written first)."""
+    write_snapshot()
+    counters, histograms, gauges = {}, {}, {}
+    for snap in _read_snapshots():
+        for name, labels, value in snap["counters"]:
+            key = _key(name, labels)
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in snap["histograms"]:
+            key = _key(name, labels)
+            merged = histograms.get(key)
+            histograms[key] = values if merged is None else [a + b for a, b in zip(merged, values)]
+        if _alive(snap["pid"]):
+            for name, labels, value in snap["gauges"]:
+                key = _key(name, labels)
+                gauges[key] = gauges.get(key, 0) + value
+    return counters, histograms, gauges
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def _labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def render():
+    """All workers' metrics in the Prometheus text exposition format."""
+    counters, histograms, gauges = collect()
+    lines = []
+    for name, (kind, help_text, buckets) in DEFINITIONS.items():
+        source = {"counter": counters, "gauge": gauges, "histogram": histograms}[kind]
+        series = sorted((labels, value) for (n, labels), value in source.items() if n == name)
+        if not series:
+            continue
+        full = PREFIX + name
+        lines.append(f"# HELP {full} {help_text}")
+        lines.append(f"# TYPE {full} {kind}")
+        for labels, value in series:
+            if kind != "histogram":
+                lines.append(f"{full}{_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, value):
+                cumulative += count
+                lines.append(f"{full}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{full}_bucket{_labels(labels, [('le', '+Inf')])} {value[-1]}")
+            lines.append(f"{full}_sum{_labels(labels)} {round(value[-2], 6)}")
+            lines.append(f"{full}_count{_labels(labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,496 @@
+import sqlite3
+from .logg import logger
+from .db import begin_immediate
+
+# Versioned schema migrations, tracked in PRAGMA user_version.
+# Append new (version, name, sql) entries; never edit one that has shipped.
+
+SCHEMA_V1 = '''
+    CREATE TABLE IF NOT EXISTS patients (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        age INTEGER,
+        gender TEXT,
+        phone TEXT,
+        city TEXT,
+        password_hash TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS clinics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        city TEXT,
+        address TEXT,
+        phone TEXT,
+        average_rating REAL DEFAULT 0.0
+    );
+
+    CREATE TABLE IF NOT EXISTS doctors (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        clinic_id INTEGER,
+        name TEXT NOT NULL,
+        specialization TEXT,
+        fees INTEGER,
+        email TEXT UNIQUE NOT NULL,
+        password_hash TEXT,
+        phone TEXT,
+        about TEXT,
+        average_rating REAL DEFAULT 0.0,
+        FOREIGN KEY (clinic_id) REFERENCES clinics(id) ON DELETE SET NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS slots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        doctor_id INTEGER,
+        date TEXT,
+        time TEXT,
+        capacity INTEGER DEFAULT 1,
+        booked_count INTEGER DEFAULT 0,
+        FOREIGN KEY (doctor_id) REFERENCES doctors(id) ON DELETE CASCADE
+    );
+
+    CREATE TABLE IF NOT EXISTS appointments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER,
+        doctor_id INTEGER,
+        slot_id INTEGER,
+        patient_name TEXT,
+        patient_phone TEXT,
+        symptoms TEXT,
+        date TEXT NOT NULL,
+        status TEXT DEFAULT 'booked',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (patient_id) REFERENCES patients(id) ON DELETE CASCADE,
+        FOREIGN KEY (doctor_id) REFERENCES doctors(id) ON DELETE CASCADE,
+        FOREIGN KEY (slot_id) REFERENCES slots(id) ON DELETE CASCADE
+    );
+
+    CREATE TABLE IF NOT EXISTS reviews (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER NOT NULL,
+        doctor_id INTEGER,
+        clinic_id INTEGER,
+        rating INTEGER CHECK(rating >= 1 AND rating <= 5),
+        comment TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (patient_id) REFERENCES patients(id) ON DELETE CASCADE,
+        FOREIGN KEY (doctor_id) REFERENCES doctors(id) ON DELETE CASCADE,
+        FOREIGN KEY (clinic_id) REFERENCES clinics(id) ON DELETE CASCADE,
+        CHECK (
+            (doctor_id IS NOT NULL AND clinic_id IS NULL) OR
+            (doctor_id IS NULL AND clinic_id IS NOT NULL)
+        )
+    );
+
+    CREATE TABLE IF NOT EXISTS chat_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        user_type TEXT, -- 'patient' or 'doctor'
+        role TEXT,      -- 'user' or 'model'
+        message TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+'''
+
+# Secondary indexes for the hot query paths (dashboards, slot lists, reviews, chat memory)
+INDEXES_V2 = '''
+    -- doctor_detail / get_available_slots / doctor_slots (covering)
+    CREATE INDEX IF NOT EXISTS idx_slots_doctor_date_time
+        ON slots(doctor_id, date, time, capacity, booked_count);
+
+    -- patient dashboard, search_appointments_by_patient
+    CREATE INDEX IF NOT EXISTS idx_appointments_patient
+        ON appointments(patient_id, date);
+
+    -- doctor dashboard, get_doctor_schedule, /patients (covering)
+    CREATE INDEX IF NOT EXISTS idx_appointments_doctor_date
+        ON appointments(doctor_id, date, status, patient_id);
+
+    CREATE INDEX IF NOT EXISTS idx_appointments_slot
+        ON appointments(slot_id);
+
+    -- review lists and rating averages
+    CREATE INDEX IF NOT EXISTS idx_reviews_doctor_created
+        ON reviews(doctor_id, created_at, rating);
+
+    CREATE INDEX IF NOT EXISTS idx_reviews_clinic_created
+        ON reviews(clinic_id, created_at, rating);
+
+    CREATE INDEX IF NOT EXISTS idx_reviews_patient_created
+        ON reviews(patient_id, created_at);
+
+    -- get_chat_history_for_gemini
+    CREATE INDEX IF NOT EXISTS idx_chat_history_user
+        ON chat_history(user_id, user_type, id);
+
+    -- /doctors join and register_doctor clinic lookup
+    CREATE INDEX IF NOT EXISTS idx_doctors_clinic
+        ON doctors(clinic_id);
+
+    CREATE INDEX IF NOT EXISTS idx_clinics_name_city
+        ON clinics(name, city);
+'''
+
+# Trigram full-text index over doctors and clinics, kept in sync by triggers.
+# Only the searchable columns fire the UPDATE triggers, so rating updates stay cheap.
+SEARCH_V3 = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS doctors_fts USING fts5(
+        name, specialization, clinic, city, tokenize = 'trigram'
+    );
+
+    CREATE VIRTUAL TABLE IF NOT EXISTS clinics_fts USING fts5(
+        name, city, address, tokenize = 'trigram'
+    );
+
+    INSERT INTO doctors_fts (rowid, name, specialization, clinic, city)
+        SELECT d.id, d.name, d.specialization, c.name, c.city
+        FROM doctors d LEFT JOIN clinics c ON d.clinic_id = c.id;
+
+    INSERT INTO clinics_fts (rowid, name, city, address)
+        SELECT id, name, city, address FROM clinics;
+
+    CREATE TRIGGER IF NOT EXISTS doctors_fts_ai AFTER INSERT ON doctors BEGIN
+        INSERT INTO doctors_fts (rowid, name, specialization, clinic, city)
+        VALUES (
+            new.id, new.name, new.specialization,
+            (SELECT name FROM clinics WHERE id = new.clinic_id),
+            (SELECT city FROM clinics WHERE id = new.clinic_id)
+        );
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS doctors_fts_au AFTER UPDATE OF name, specialization, clinic_id ON doctors BEGIN
+        DELETE FROM doctors_fts WHERE rowid = old.id;
+        INSERT INTO doctors_fts (rowid, name, specialization, clinic, city)
+        VALUES (
+            new.id, new.name, new.specialization,
+            (SELECT name FROM clinics WHERE id = new.clinic_id),
+            (SELECT city FROM clinics WHERE id = new.clinic_id)
+        );
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS doctors_fts_ad AFTER DELETE ON doctors BEGIN
+        DELETE FROM doctors_fts WHERE rowid = old.id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS clinics_fts_ai AFTER INSERT ON clinics BEGIN
+        INSERT INTO clinics_fts (rowid, name, city, address) VALUES (new.id, new.name, new.city, new.address);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS clinics_fts_au AFTER UPDATE OF name, city, address ON clinics BEGIN
+        DELETE FROM clinics_fts WHERE rowid = old.id;
+        INSERT INTO clinics_fts (rowid, name, city, address) VALUES (new.id, new.name, new.city, new.address);
+        UPDATE doctors_fts SET clinic = new.name, city = new.city
+        WHERE rowid IN (SELECT id FROM doctors WHERE clinic_id = new.id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS clinics_fts_ad AFTER DELETE ON clinics BEGIN
+        DELETE FROM clinics_fts WHERE rowid = old.id;
+        UPDATE doctors_fts SET clinic = NULL, city = NULL
+        WHERE rowid IN (SELECT id FROM doctors WHERE clinic_id = old.id);
+    END;
+'''
+
+# Incremental rating aggregates: review_count/rating_sum on doctors and clinics plus
+# a per-entity histogram, maintained by triggers so a new review is O(1).
+RATINGS_V4 = '''
+    ALTER TABLE doctors ADD COLUMN review_count INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE doctors ADD COLUMN rating_sum INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE clinics ADD COLUMN review_count INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE clinics ADD COLUMN rating_sum INTEGER NOT NULL DEFAULT 0;
+
+    CREATE TABLE IF NOT EXISTS rating_histogram (
+        entity_type TEXT NOT NULL,  -- 'doctor' or 'clinic'
+        entity_id INTEGER NOT NULL,
+        rating INTEGER NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (entity_type, entity_id, rating)
+    ) WITHOUT ROWID;
+
+    UPDATE doctors SET
+        review_count = (SELECT COUNT(*) FROM reviews WHERE doctor_id = doctors.id),
+        rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM reviews WHERE doctor_id = doctors.id);
+    UPDATE doctors SET average_rating = CASE WHEN review_count > 0
+        THEN CAST(rating_sum AS REAL) / review_count ELSE 0 END;
+
+    UPDATE clinics SET
+        review_count = (SELECT COUNT(*) FROM reviews WHERE clinic_id = clinics.id),
+        rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM reviews WHERE clinic_id = clinics.id);
+    UPDATE clinics SET average_rating = CASE WHEN review_count > 0
+        THEN CAST(rating_sum AS REAL) / review_count ELSE 0 END;
+
+    INSERT INTO rating_histogram (entity_type, entity_id, rating, count)
+        SELECT 'doctor', doctor_id, rating, COUNT(*) FROM reviews
+        WHERE doctor_id IS NOT NULL GROUP BY doctor_id, rating;
+    INSERT INTO rating_histogram (entity_type, entity_id, rating, count)
+        SELECT 'clinic', clinic_id, rating, COUNT(*) FROM reviews
+        WHERE clinic_id IS NOT NULL GROUP BY clinic_id, rating;
+
+    CREATE TRIGGER IF NOT EXISTS reviews_doctor_ai AFTER INSERT ON reviews WHEN new.doctor_id IS NOT NULL BEGIN
+        UPDATE doctors SET
+            review_count = review_count + 1,
+            rating_sum = rating_sum + new.rating,
+            average_rating = CAST(rating_sum + new.rating AS REAL) / (review_count + 1)
+        WHERE id = new.doctor_id;
+        INSERT INTO rating_histogram (entity_type, entity_id, rating, count)
+        VALUES ('doctor', new.doctor_id, new.rating, 1)
+        ON CONFLICT (entity_type, entity_id, rating) DO UPDATE SET count = count + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS reviews_doctor_ad AFTER DELETE ON reviews WHEN old.doctor_id IS NOT NULL BEGIN
+        UPDATE doctors SET
+            review_count = review_count - 1,
+            rating_sum = rating_sum - old.rating,
+            average_rating = CASE WHEN review_count > 1
+                THEN CAST(rating_sum - old.rating AS REAL) / (review_count - 1) ELSE 0 END
+        WHERE id = old.doctor_id;
+        UPDATE rating_histogram SET count = count - 1
+        WHERE entity_type = 'doctor' AND entity_id = old.doctor_id AND rating = old.rating;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS reviews_clinic_ai AFTER INSERT ON reviews WHEN new.clinic_id IS NOT NULL BEGIN
+        UPDATE clinics SET
+            review_count = review_count + 1,
+            rating_sum = rating_sum + new.rating,
+            average_rating = CAST(rating_sum + new.rating AS REAL) / (review_count + 1)
+        WHERE id = new.clinic_id;
+        INSERT INTO rating_histogram (entity_type, entity_id, rating, count)
+        VALUES ('clinic', new.clinic_id, new.rating, 1)
+        ON CONFLICT (entity_type, entity_id, rating) DO UPDATE SET count = count + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS reviews_clinic_ad AFTER DELETE ON reviews WHEN old.clinic_id IS NOT NULL BEGIN
+        UPDATE clinics SET
+            review_count = review_count - 1,
+            rating_sum = rating_sum - old.rating,
+            average_rating = CASE WHEN review_count > 1
+                THEN CAST(rating_sum - old.rating AS REAL) / (review_count - 1) ELSE 0 END
+        WHERE id = old.clinic_id;
+        UPDATE rating_histogram SET count = count - 1
+        WHERE entity_type = 'clinic' AND entity_id = old.clinic_id AND rating = old.rating;
+    END;
+
+    -- Edits move a review between entities/ratings: undo the old row, apply the new one
+    CREATE TRIGGER IF NOT EXISTS reviews_au AFTER UPDATE OF rating, doctor_id, clinic_id ON reviews BEGIN
+        UPDATE doctors SET
+            review_count = review_count - 1,
+            rating_sum = rating_sum - old.rating,
+            average_rating = CASE WHEN review_count > 1
+                THEN CAST(rating_sum - old.rating AS REAL) / (review_count - 1) ELSE 0 END
+        WHERE id = old.doctor_id;
+        UPDATE clinics SET
+            review_count = review_count - 1,
+            rating_sum = rating_sum - old.rating,
+            average_rating = CASE WHEN review_count > 1
+                THEN CAST(rating_sum - old.rating AS REAL) / (review_count - 1) ELSE 0 END
+        WHERE id = old.clinic_id;
+        UPDATE rating_histogram SET count = count - 1
+        WHERE rating = old.rating AND (
+            (entity_type = 'doctor' AND entity_id = old.doctor_id) OR
+            (entity_type = 'clinic' AND entity_id = old.clinic_id));
+
+        UPDATE doctors SET
+            review_count = review_count + 1,
+            rating_sum = rating_sum + new.rating,
+            average_rating = CAST(rating_sum + new.rating AS REAL) / (review_count + 1)
+        WHERE id = new.doctor_id;
+        UPDATE clinics SET
+            review_count = review_count + 1,
+            rating_sum = rating_sum + new.rating,
+            average_rating = CAST(rating_sum + new.rating AS REAL) / (review_count + 1)
+        WHERE id = new.clinic_id;
+        INSERT INTO rating_histogram (entity_type, entity_id, rating, count)
+        SELECT 'doctor', new.doctor_id, new.rating, 1 WHERE new.doctor_id IS NOT NULL
+        ON CONFLICT (entity_type, entity_id, rating) DO UPDATE SET count = count + 1;
+        INSERT INTO rating_histogram (entity_type, entity_id, rating, count)
+        SELECT 'clinic', new.clinic_id, new.rating, 1 WHERE new.clinic_id IS NOT NULL
+        ON CONFLICT (entity_type, entity_id, rating) DO UPDATE SET count = count + 1;
+    END;
+'''
+
+# Keyset pagination of the doctor directory on (name, id); id is the rowid,
+# so an index on name is already ordered by (name, id).
+DIRECTORY_V5 = '''
+    CREATE INDEX IF NOT EXISTS idx_doctors_name ON doctors(name);
+'''
+
+# Per-doctor, per-day free capacity maintained by slot triggers, for "next
+# available" and "who is free on <date>" without scanning slots.
+AVAILABILITY_V6 = '''
+    CREATE TABLE IF NOT EXISTS doctor_availability (
+        doctor_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        free_capacity INTEGER NOT NULL DEFAULT 0,
+        slot_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (doctor_id, date)
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS idx_availability_free_date
+        ON doctor_availability(date, doctor_id) WHERE free_capacity > 0;
+
+    INSERT INTO doctor_availability (doctor_id, date, free_capacity, slot_count)
+        SELECT doctor_id, date, SUM(MAX(COALESCE(capacity, 0) - COALESCE(booked_count, 0), 0)), COUNT(*)
+        FROM slots WHERE doctor_id IS NOT NULL AND date IS NOT NULL
+        GROUP BY doctor_id, date;
+
+    CREATE TRIGGER IF NOT EXISTS slots_availability_ai AFTER INSERT ON slots
+    WHEN new.doctor_id IS NOT NULL AND new.date IS NOT NULL BEGIN
+        INSERT INTO doctor_availability (doctor_id, date, free_capacity, slot_count)
+        VALUES (new.doctor_id, new.date, MAX(COALESCE(new.capacity, 0) - COALESCE(new.booked_count, 0), 0), 1)
+        ON CONFLICT (doctor_id, date) DO UPDATE SET
+            free_capacity = free_capacity + excluded.free_capacity,
+            slot_count = slot_count + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS slots_availability_ad AFTER DELETE ON slots
+    WHEN old.doctor_id IS NOT NULL AND old.date IS NOT NULL BEGIN
+        UPDATE doctor_availability SET
+            free_capacity = free_capacity - MAX(COALESCE(old.capacity, 0) - COALESCE(old.booked_count, 0), 0),
+            slot_count = slot_count - 1
+        WHERE doctor_id = old.doctor_id AND date = old.date;
+        DELETE FROM doctor_availability
+        WHERE doctor_id = old.doctor_id AND date = old.date AND slot_count <= 0;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS slots_availability_au
+    AFTER UPDATE OF doctor_id, date, capacity, booked_count ON slots BEGIN
+        UPDATE doctor_availability SET
+            free_capacity = free_capacity - MAX(COALESCE(old.capacity, 0) - COALESCE(old.booked_count, 0), 0),
+            slot_count = slot_count - 1
+        WHERE doctor_id = old.doctor_id AND date = old.date;
+        DELETE FROM doctor_availability
+        WHERE doctor_id = old.doctor_id AND date = old.date AND slot_count <= 0;
+        INSERT INTO doctor_availability (doctor_id, date, free_capacity, slot_count)
+        SELECT new.doctor_id, new.date, MAX(COALESCE(new.capacity, 0) - COALESCE(new.booked_count, 0), 0), 1
+        WHERE new.doctor_id IS NOT NULL AND new.date IS NOT NULL
+        ON CONFLICT (doctor_id, date) DO UPDATE SET
+            free_capacity = free_capacity + excluded.free_capacity,
+            slot_count = slot_count + 1;
+    END;
+'''
+
+# Weekly recurring schedules (weekday 0 = Monday) and one-off days off, expanded
+# into slots by src/schedules.py.
+SCHEDULES_V7 = '''
+    CREATE TABLE IF NOT EXISTS schedule_templates (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        doctor_id INTEGER NOT NULL,
+        weekdays TEXT NOT NULL,         -- comma separated, e.g. '0,1,2,3,4'
+        start_time TEXT NOT NULL,       -- HH:MM
+        end_time TEXT NOT NULL,         -- HH:MM, last slot must end by then
+        slot_minutes INTEGER NOT NULL DEFAULT 30,
+        capacity INTEGER NOT NULL DEFAULT 5,
+        valid_from TEXT,
+        valid_until TEXT,
+        materialized_until TEXT,        -- last date already expanded into slots
+        active INTEGER NOT NULL DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (doctor_id) REFERENCES doctors(id) ON DELETE CASCADE
+    );
+
+    CREATE TABLE IF NOT EXISTS schedule_exceptions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        doctor_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        start_time TEXT,                -- NULL start/end = whole day off
+        end_time TEXT,
+        reason TEXT,
+        FOREIGN KEY (doctor_id) REFERENCES doctors(id) ON DELETE CASCADE
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_schedule_templates_doctor
+        ON schedule_templates(doctor_id, active);
+
+    CREATE INDEX IF NOT EXISTS idx_schedule_exceptions_doctor_date
+        ON schedule_exceptions(doctor_id, date);
+'''
+
+# Rolling summary of chat turns that have left the history window
+# (src/chat_memory.py), one row per user.
+CHAT_MEMORY_V8 = '''
+    CREATE TABLE IF NOT EXISTS chat_memory (
+        user_id INTEGER NOT NULL,
+        user_type TEXT NOT NULL,
+        summary TEXT NOT NULL DEFAULT '',
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, user_type)
+    ) WITHOUT ROWID;
+'''
+
+# Background materialization reads every active template (src/schedules.py);
+# idx_schedule_templates_doctor leads with doctor_id and cannot serve that.
+SCHEDULES_ACTIVE_V9 = '''
+    CREATE INDEX IF NOT EXISTS idx_schedule_templates_active
+        ON schedule_templates(active, doctor_id);
+'''
+
+MIGRATIONS = [
+    (1, "base schema", SCHEMA_V1),
+    (2, "hot path indexes", INDEXES_V2),
+    (3, "doctor/clinic full-text search", SEARCH_V3),
+    (4, "incremental rating aggregates", RATINGS_V4),
+    (5, "doctor directory index", DIRECTORY_V5),
+    (6, "doctor availability index", AVAILABILITY_V6),
+    (7, "recurring schedule templates", SCHEDULES_V7),
+    (8, "chat memory summaries", CHAT_MEMORY_V8),
+    (9, "active schedule templates index", SCHEDULES_ACTIVE_V9),
+]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _statements(script):
+    """Splits a migration script into single statements; trigger bodies stay whole."""
+    statements, current = [], ""
+    for piece in script.split(";"):
+        current += piece + ";"
+        if sqlite3.complete_statement(current):
+            if current.strip(" \n;"):
+                statements.append(current.strip())
+            current = ""
+    return statements
+
+
+def migrate(conn):
+    """
+    Applies pending migrations in order, each in its own transaction.
+    Several workers may start on the same file at once: each migration takes
+    the write lock first (BEGIN IMMEDIATE) and re-reads user_version under it,
+    so a migration another process has just applied is skipped, not re-run.
+    """
+    applied = []
+    for version, name, sql in MIGRATIONS:
+        if version <= schema_version(conn):
+            continue
+        try:
+            begin_immediate(conn)
+            if version <= schema_version(conn):
+                conn.rollback()
+                continue
+            for statement in _statements(sql):
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.rollback()
+            logger.exception(f"[DB] Migration {version} ({name}) failed")
+            raise
+        logger.info(f"[DB] Applied migration {version}: {name}")
+        applied.append(version)
+
+    if applied:
+        # Refresh planner statistics for the new indexes
+        conn.execute("PRAGMA optimize")
+    return applied
+
+
+if __name__ == '__main__':
+    import sys
+    from .init_db import DB
+    conn = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else DB)
+    migrate(conn)
+    print(f"Schema version: {schema_version(conn)}")
+    conn.close()
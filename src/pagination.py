@@ -0,0 +1,102 @@
+import base64
+import json
+import os
+import sqlite3
+
+from .availability import NEXT_AVAILABLE_SQL
+
+# Keyset (cursor) pagination for the doctor directory. Pages are addressed by the
+# (name, id) of their boundary rows, so every page is one index range scan no
+# matter how deep the user goes.
+
+DOCTORS_PAGE_SIZE = int(os.getenv("DOCTORS_PAGE_SIZE", "24"))
+MAX_PAGE_SIZE = 100
+
+DIRECTORY_SQL = f'''
+    SELECT d.*, c.name as clinic_name, c.city as clinic_city, c.address as address,
+           {NEXT_AVAILABLE_SQL}
+    FROM doctors d
+    LEFT JOIN clinics c ON d.clinic_id = c.id
+'''
+
+
+def encode_cursor(row):
+    raw = json.dumps([row["name"], row["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Returns (name, id) from a cursor token, or None if it is missing or malformed."""
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        name, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return str(name), int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def page_size_arg(value, default=DOCTORS_PAGE_SIZE):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def estimate_count(conn, table):
+    """
+    Approximate row count without scanning: the planner statistics from
+    ANALYZE / PRAGMA optimize when present, otherwise the highest rowid.
+    """
+    try:
+        row = conn.execute(
+            "SELECT stat FROM sqlite_stat1 WHERE tbl = ? LIMIT 1", (table,)
+        ).fetchone()
+        if row and row[0]:
+            return int(row[0].split()[0])
+    except sqlite3.OperationalError:
+        pass  # no statistics yet
+    return conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {table}").fetchone()[0]
+
+
+def doctors_page(conn, after=None, before=None, page_size=DOCTORS_PAGE_SIZE):
+    """
+    Returns one page of the directory ordered by (name, id) as a dict with
+    `rows`, `next` and `prev` cursors (None at either end) and an
+    approximate `total`.
+    """
+    after, before = decode_cursor(after), decode_cursor(before)
+    # One extra row tells us whether there is another page in that direction
+    if before:
+        rows = conn.execute(
+            DIRECTORY_SQL + " WHERE (d.name, d.id) < (?, ?) ORDER BY d.name DESC, d.id DESC LIMIT ?",
+            (before[0], before[1], page_size + 1)
+        ).fetchall()
+        has_more = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        has_prev, has_next = has_more, True
+    elif after:
+        rows = conn.execute(
+            DIRECTORY_SQL + " WHERE (d.name, d.id) > (?, ?) ORDER BY d.name, d.id LIMIT ?",
+            (after[0], after[1], page_size + 1)
+        ).fetchall()
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        has_prev = True
+    else:
+        rows = conn.execute(
+            DIRECTORY_SQL + " ORDER BY d.name, d.id LIMIT ?", (page_size + 1,)
+        ).fetchall()
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        has_prev = False
+
+    return {
+        "rows": rows,
+        "next": encode_cursor(rows[-1]) if rows and has_next else None,
+        "prev": encode_cursor(rows[0]) if rows and has_prev else None,
+        "total": estimate_count(conn, "doctors"),
+        "size": page_size,
+    }
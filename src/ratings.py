@@ -0,0 +1,57 @@
+import sqlite3
+from .logg import logger
+from . import cache
+
+# review_count, rating_sum, average_rating and rating_histogram are kept current
+# by the reviews triggers (RATINGS_V4 in src/migrations.py). This module reads
+# them and can rebuild them from scratch if they ever drift.
+
+RECONCILE_SQL = '''
+    UPDATE doctors SET
+        review_count = (SELECT COUNT(*) FROM reviews WHERE doctor_id = doctors.id),
+        rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM reviews WHERE doctor_id = doctors.id);
+    UPDATE doctors SET average_rating = CASE WHEN review_count > 0
+        THEN CAST(rating_sum AS REAL) / review_count ELSE 0 END;
+
+    UPDATE clinics SET
+        review_count = (SELECT COUNT(*) FROM reviews WHERE clinic_id = clinics.id),
+        rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM reviews WHERE clinic_id = clinics.id);
+    UPDATE clinics SET average_rating = CASE WHEN review_count > 0
+        THEN CAST(rating_sum AS REAL) / review_count ELSE 0 END;
+
+    DELETE FROM rating_histogram;
+    INSERT INTO rating_histogram (entity_type, entity_id, rating, count)
+        SELECT 'doctor', doctor_id, rating, COUNT(*) FROM reviews
+        WHERE doctor_id IS NOT NULL GROUP BY doctor_id, rating;
+    INSERT INTO rating_histogram (entity_type, entity_id, rating, count)
+        SELECT 'clinic', clinic_id, rating, COUNT(*) FROM reviews
+        WHERE clinic_id IS NOT NULL GROUP BY clinic_id, rating;
+'''
+
+
+def rating_histogram(conn, entity_type, entity_id):
+    """Returns {rating: count} for ratings 5..1 of a 'doctor' or 'clinic'."""
+    rows = conn.execute(
+        "SELECT rating, count FROM rating_histogram WHERE entity_type=? AND entity_id=?",
+        (entity_type, entity_id)
+    ).fetchall()
+    counts = {r[0]: r[1] for r in rows}
+    return {rating: counts.get(rating, 0) for rating in range(5, 0, -1)}
+
+
+def reconcile(conn):
+    """Recomputes every rating aggregate from the reviews table in one transaction."""
+    conn.executescript(f"BEGIN;\n{RECONCILE_SQL}\nCOMMIT;")
+    # Averages changed underneath every cached clinic page
+    clinics = [f"clinic:{r[0]}" for r in conn.execute("SELECT id FROM clinics")]
+    cache.invalidate('clinics', 'doctors', *clinics)
+    logger.info("[Ratings] Aggregates reconciled with reviews.")
+
+
+if __name__ == '__main__':
+    import sys
+    from .init_db import DB
+    conn = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else DB)
+    reconcile(conn)
+    conn.close()
+    print("Rating aggregates reconciled.")
@@ -0,0 +1,117 @@
+import datetime
+import os
+import re
+import threading
+from collections import deque
+
+from . import cache, knowledge
+
+# Answers to repeated guest chat questions ("what are your refund rules",
+# "find a dermatologist in Delhi") served from src/cache.py without calling
+# the model.
+#
+# Keys are the normalized question (lowercased, punctuation and extra
+# whitespace dropped; word order and question words kept, since "who can
+# I see" and "can I see who" differ) scoped by role, today's date (replies
+# may say "tomorrow") and the policy document version. Entries depend on the "doctors" and "clinics"
+# namespaces, which the routes invalidate when that data changes; the "chat"
+# namespace drops every cached reply at once.
+#
+# With CHAT_CACHE_SIMILARITY > 0 a question that shares at least that share
+# of its words (Jaccard) with a recently cached one reuses its reply.
+
+CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", "3600"))
+CHAT_CACHE_SIMILARITY = float(os.getenv("CHAT_CACHE_SIMILARITY", "0"))
+CHAT_CACHE_RECENT = 500
+
+NAMESPACES = ("doctors", "clinics", "chat")
+
+# Replies built only from these tools are safe to share; slot and
+# availability answers go stale with every booking.
+CACHEABLE_TOOLS = frozenset({
+    "search_doctor_by_specialization",
+    "search_doctor_by_name",
+    "search_clinic_by_city",
+})
+
+_recent = {}    # scope -> deque of normalized questions cached by this worker
+_lock = threading.Lock()
+_counters = {"hits": 0, "similar_hits": 0, "misses": 0, "stored": 0, "skipped": 0}
+
+
+def normalize(text):
+    return " ".join(re.findall(r"\w+", (text or "").lower()))
+
+
+def _scope(role):
+    return f"{role}|{datetime.date.today().isoformat()}|{knowledge.version()}"
+
+
+def _similar(scope, question):
+    words = set(question.split())
+    best, best_score = None, 0.0
+    with _lock:
+        candidates = list(_recent.get(scope, ()))
+    for other in candidates:
+        other_words = set(other.split())
+        score = len(words & other_words) / len(words | other_words)
+        if score > best_score:
+            best, best_score = other, score
+    return best if best_score >= CHAT_CACHE_SIMILARITY else None
+
+
+def _count(name):
+    with _lock:
+        _counters[name] += 1
+
+
+def get(role, query):
+    """Cached reply for this role's question, or None."""
+    question = normalize(query)
+    if not question:
+        return None
+    scope = _scope(role)
+    reply = cache.lookup(f"chat:{scope}:{question}", NAMESPACES)
+    if reply is not None:
+        _count("hits")
+        return reply
+
+    if CHAT_CACHE_SIMILARITY > 0:
+        other = _similar(scope, question)
+        if other is not None and other != question:
+            reply = cache.lookup(f"chat:{scope}:{other}", NAMESPACES)
+            if reply is not None:
+                _count("similar_hits")
+                return reply
+    _count("misses")
+    return None
+
+
+def cacheable(tool_results):
+    """True when every tool call of the turn was a successful, shareable lookup."""
+    for name, result in tool_results:
+        if name not in CACHEABLE_TOOLS:
+            return False
+        if isinstance(result, str) and ("Error" in result[:30] or result.startswith("No records")):
+            return False
+    return True
+
+
+def put(role, query, reply, tool_results=()):
+    question = normalize(query)
+    if not question or not cacheable(tool_results):
+        _count("skipped")
+        return False
+    scope = _scope(role)
+    cache.store(f"chat:{scope}:{question}", NAMESPACES, reply, CHAT_CACHE_TTL)
+    with _lock:
+        _recent.setdefault(scope, deque(maxlen=CHAT_CACHE_RECENT)).append(question)
+        for old in [s for s in _recent if s != scope]:
+            del _recent[old]
+        _counters["stored"] += 1
+    return True
+
+
+def stats():
+    with _lock:
+        return dict(_counters)
@@ -0,0 +1,311 @@
+import datetime
+import os
+import sqlite3
+import threading
+import time
+
+from .logg import logger
+from .db import connection, begin_immediate
+
+# Weekly schedule templates (SCHEDULES_V7 in src/migrations.py) and the
+# materializer that expands them into slots over a rolling window.
+
+SCHEDULE_WINDOW_DAYS = int(os.getenv("SCHEDULE_WINDOW_DAYS", "28"))
+SCHEDULE_BATCH_SIZE = int(os.getenv("SCHEDULE_BATCH_SIZE", "5000"))
+# Seconds between background materializations, so long-running workers keep
+# the window rolling; 0 disables
+SCHEDULE_MATERIALIZE_INTERVAL = float(os.getenv("SCHEDULE_MATERIALIZE_INTERVAL", "3600"))
+
+WEEKDAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+# Idempotent: re-materializing a window never duplicates a (doctor, date, time) slot.
+# The NOT EXISTS probe is an index seek on idx_slots_doctor_date_time.
+INSERT_SLOT_SQL = '''
+    INSERT INTO slots (doctor_id, date, time, capacity, booked_count)
+    SELECT ?1, ?2, ?3, ?4, 0
+    WHERE NOT EXISTS (SELECT 1 FROM slots WHERE doctor_id = ?1 AND date = ?2 AND time = ?3)
+'''
+
+
+def _parse_date(value):
+    return datetime.date.fromisoformat(value) if value else None
+
+
+def _minutes(hhmm):
+    hours, minutes = hhmm.split(":")[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def _hhmm(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def parse_weekdays(values):
+    """Normalizes weekday input (ints, '0,2,4' or names like 'Mon') to '0,2,4'."""
+    if isinstance(values, str):
+        values = values.split(",")
+    days = set()
+    for value in values:
+        value = str(value).strip()
+        if not value:
+            continue
+        if value.isdigit() and 0 <= int(value) <= 6:
+            days.add(int(value))
+        elif value[:3].title() in WEEKDAY_NAMES:
+            days.add(WEEKDAY_NAMES.index(value[:3].title()))
+        else:
+            raise ValueError(f"Invalid weekday: {value}")
+    if not days:
+        raise ValueError("At least one weekday is required.")
+    return ",".join(str(d) for d in sorted(days))
+
+
+def slot_times(start_time, end_time, slot_minutes):
+    """All slot start times between start and end where the whole slot fits."""
+    start, end = _minutes(start_time), _minutes(end_time)
+    if slot_minutes <= 0 or end <= start:
+        raise ValueError("End time must be after start time and slot length positive.")
+    return [_hhmm(t) for t in range(start, end - slot_minutes + 1, slot_minutes)]
+
+
+def add_template(conn, doctor_id, weekdays, start_time, end_time, slot_minutes=30,
+                 capacity=5, valid_from=None, valid_until=None):
+    """Creates a weekly template; returns its id. Slots appear on the next materialize()."""
+    weekdays = parse_weekdays(weekdays)
+    slot_times(start_time, end_time, int(slot_minutes))  # validate
+    if int(capacity) < 1:
+        raise ValueError("Capacity must be at least 1.")
+    # materialize() parses these for every active template: reject bad dates here
+    try:
+        start, end = _parse_date(valid_from), _parse_date(valid_until)
+    except (TypeError, ValueError):
+        raise ValueError("Dates must be YYYY-MM-DD.")
+    if start and end and end < start:
+        raise ValueError("Valid until must not be before valid from.")
+    cur = conn.execute(
+        '''INSERT INTO schedule_templates
+        (doctor_id, weekdays, start_time, end_time, slot_minutes, capacity, valid_from, valid_until)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+        (doctor_id, weekdays, start_time, end_time, int(slot_minutes), int(capacity),
+         start.isoformat() if start else None, end.isoformat() if end else None)
+    )
+    conn.commit()
+    return cur.lastrowid
+
+
+def deactivate_template(conn, template_id, doctor_id):
+    """Stops future materialization. Existing slots (and bookings) are left alone."""
+    cur = conn.execute(
+        "UPDATE schedule_templates SET active = 0 WHERE id = ? AND doctor_id = ?",
+        (template_id, doctor_id)
+    )
+    conn.commit()
+    return cur.rowcount > 0
+
+
+def add_exception(conn, doctor_id, date, start_time=None, end_time=None, reason=""):
+    """
+    Marks a holiday (whole day when no times are given) or a blocked time range.
+    Unbooked slots already materialized in that range are removed.
+    """
+    try:
+        date = datetime.date.fromisoformat(date).isoformat()
+    except (TypeError, ValueError):
+        raise ValueError("Date must be YYYY-MM-DD.")
+    if bool(start_time) != bool(end_time):
+        raise ValueError("Give both a start and an end time, or neither for the whole day.")
+    if start_time:
+        try:
+            start, end = _minutes(start_time), _minutes(end_time)
+        except ValueError:
+            raise ValueError("Times must be HH:MM.")
+        if end <= start:
+            raise ValueError("End time must be after start time.")
+        # Stored like slot times, so the string comparisons below hold
+        start_time, end_time = _hhmm(start), _hhmm(end)
+    conn.execute(
+        '''INSERT INTO schedule_exceptions (doctor_id, date, start_time, end_time, reason)
+        VALUES (?, ?, ?, ?, ?)''',
+        (doctor_id, date, start_time or None, end_time or None, reason)
+    )
+    query = "DELETE FROM slots WHERE doctor_id = ? AND date = ? AND booked_count = 0"
+    params = [doctor_id, date]
+    if start_time and end_time:
+        query += " AND time >= ? AND time < ?"
+        params += [start_time, end_time]
+    removed = conn.execute(query, params).rowcount
+    conn.commit()
+    return removed
+
+
+def expand(template, start, end, exceptions=()):
+    """
+    Yields (doctor_id, date, time, capacity) rows for `template` between the
+    `start` and `end` dates (inclusive), skipping `exceptions`, which are
+    (date, start_time, end_time) tuples with None times for a full day off.
+    """
+    weekdays = {int(d) for d in template["weekdays"].split(",")}
+    times = slot_times(template["start_time"], template["end_time"], template["slot_minutes"])
+
+    blocked = {}
+    for date, block_start, block_end in exceptions:
+        if (block_start is None) != (block_end is None):
+            # Half-open range stored before add_exception() validated times
+            logger.warning(f"[Schedules] Ignoring time off on {date} without both times.")
+            continue
+        blocked.setdefault(date, []).append((block_start, block_end))
+
+    day = start
+    while day <= end:
+        if day.weekday() in weekdays:
+            iso = day.isoformat()
+            blocks = blocked.get(iso, [])
+            if not any(b_start is None for b_start, _ in blocks):
+                for t in times:
+                    if any(b_start <= t < b_end for b_start, b_end in blocks):
+                        continue
+                    yield (template["doctor_id"], iso, t, template["capacity"])
+        day += datetime.timedelta(days=1)
+
+
+def _materialize_doctor(conn, templates, today, horizon, exceptions, batch_size):
+    """Writes one doctor's slots; returns (slots created, templates advanced)."""
+    created = 0
+    batch, progress = [], []
+
+    def flush():
+        nonlocal created
+        if batch:
+            created += conn.executemany(INSERT_SLOT_SQL, batch).rowcount
+            batch.clear()
+
+    for tpl in templates:
+        try:
+            done, valid_from, valid_until = (
+                _parse_date(tpl["materialized_until"]), _parse_date(tpl["valid_from"]), _parse_date(tpl["valid_until"])
+            )
+        except ValueError:
+            # Stored before add_template() validated dates: skip it, not every doctor
+            logger.warning(f"[Schedules] Skipping template {tpl['id']} with an invalid date.")
+            continue
+        start = today
+        if done and done >= start:
+            start = done + datetime.timedelta(days=1)
+        if valid_from and valid_from > start:
+            start = valid_from
+        end = horizon
+        if valid_until and valid_until < end:
+            end = valid_until
+        if start > end:
+            continue
+
+        for row in expand(tpl, start, end, exceptions):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                flush()
+        progress.append((end.isoformat(), tpl["id"]))
+
+    flush()
+    conn.executemany("UPDATE schedule_templates SET materialized_until = ? WHERE id = ?", progress)
+    return created, len(progress)
+
+
+def materialize(conn, days=SCHEDULE_WINDOW_DAYS, doctor_id=None, today=None, batch_size=SCHEDULE_BATCH_SIZE):
+    """
+    Expands active templates into slots up to `days` ahead of today.
+    Each template resumes after its materialized_until date, rows are written
+    with one executemany per batch, and the whole run is a single transaction
+    with a savepoint per doctor: a doctor whose rows fail is rolled back and
+    logged, and everyone else's slots are still written.
+    Returns the number of slots created.
+    """
+    today = today or datetime.date.today()
+    horizon = today + datetime.timedelta(days=days - 1)
+
+    query = "SELECT * FROM schedule_templates WHERE active = 1"
+    params = []
+    if doctor_id is not None:
+        query += " AND doctor_id = ?"
+        params.append(doctor_id)
+    templates = conn.execute(query, params).fetchall()
+    if not templates:
+        return 0
+
+    query = "SELECT doctor_id, date, start_time, end_time FROM schedule_exceptions WHERE date BETWEEN ? AND ?"
+    params = [today.isoformat(), horizon.isoformat()]
+    if doctor_id is not None:
+        query += " AND doctor_id = ?"
+        params.append(doctor_id)
+    exceptions = {}
+    for row in conn.execute(query, params):
+        exceptions.setdefault(row[0], []).append((row[1], row[2], row[3]))
+
+    by_doctor = {}
+    for tpl in templates:
+        by_doctor.setdefault(tpl["doctor_id"], []).append(tpl)
+
+    created = advanced = 0
+    begin_immediate(conn)
+    try:
+        for doc_id, doctor_templates in by_doctor.items():
+            conn.execute("SAVEPOINT materialize_doctor")
+            try:
+                n, count = _materialize_doctor(
+                    conn, doctor_templates, today, horizon, exceptions.get(doc_id, ()), batch_size
+                )
+            except Exception as e:
+                conn.execute("ROLLBACK TO materialize_doctor")
+                conn.execute("RELEASE materialize_doctor")
+                logger.error(f"[Schedules] Skipping doctor {doc_id}: {e}")
+                continue
+            conn.execute("RELEASE materialize_doctor")
+            created += n
+            advanced += count
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    if created:
+        logger.info(f"[Schedules] Materialized {created} slots from {advanced} templates up to {horizon}.")
+    return created
+
+
+_materializers = {}
+
+
+def start_materializer(path, interval=SCHEDULE_MATERIALIZE_INTERVAL):
+    """
+    Starts a daemon thread that runs materialize() every `interval` seconds.
+    One thread per database per process; runs in several workers are harmless
+    because materializing is idempotent.
+    """
+    if interval <= 0:
+        return None
+    key = (path, os.getpid())
+    if key in _materializers:
+        return _materializers[key]
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                with connection(path) as conn:
+                    materialize(conn)
+            except Exception as e:
+                logger.error(f"[Schedules] Materialization failed: {e}")
+
+    thread = threading.Thread(target=run, name="schedule-materializer", daemon=True)
+    thread.start()
+    _materializers[key] = thread
+    return thread
+
+
+if __name__ == '__main__':
+    import sys
+    from .init_db import DB
+    conn = sqlite3.connect(DB)
+    conn.row_factory = sqlite3.Row
+    n = materialize(conn, days=int(sys.argv[1]) if len(sys.argv) > 1 else SCHEDULE_WINDOW_DAYS)
+    conn.close()
+    print(f"Created {n} slots.")
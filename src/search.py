@@ -0,0 +1,172 @@
+import os
+import re
+from difflib import SequenceMatcher
+
+from .logg import logger
+
+SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", "50"))
+# Minimum per-word similarity (0..1) for typo-tolerant matches
+FUZZY_THRESHOLD = float(os.getenv("SEARCH_FUZZY_THRESHOLD", "0.8"))
+FUZZY_CANDIDATES = 200
+
+# Trigram FTS5 tables (see SEARCH_V3 in src/migrations.py).
+# `like` maps each FTS column to the SQL column used for short (< 3 char) queries.
+INDEXES = {
+    "doctors": {
+        "fts": "doctors_fts",
+        "columns": ("name", "specialization", "clinic", "city"),
+        "weights": (10.0, 5.0, 2.0, 1.0),
+        "table": "doctors d",
+        "joins": "LEFT JOIN clinics c ON d.clinic_id = c.id",
+        "key": "d.id",
+        "order": "d.name, d.id",
+        "like": {"name": "d.name", "specialization": "d.specialization", "clinic": "c.name", "city": "c.city"},
+    },
+    "clinics": {
+        "fts": "clinics_fts",
+        "columns": ("name", "city", "address"),
+        "weights": (10.0, 5.0, 1.0),
+        "table": "clinics c",
+        "joins": "",
+        "key": "c.id",
+        "order": "c.name, c.id",
+        "like": {"name": "c.name", "city": "c.city", "address": "c.address"},
+    },
+}
+
+DOCTOR_COLUMNS = "d.*, c.name AS clinic_name, c.city AS clinic_city, c.address AS address"
+CLINIC_COLUMNS = "c.*"
+
+
+def _words(text):
+    return re.findall(r"\w+", (text or "").lower())
+
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _trigrams(word):
+    return sorted({word[i:i + 3] for i in range(len(word) - 2)})
+
+
+def build_match(filters, fuzzy=False):
+    """
+    Builds an FTS5 MATCH expression from {(column, ...): text} filters.
+    Exact mode ANDs every word (substring match via trigrams); fuzzy mode ORs
+    the trigrams of each word so a typo only loses a few of them.
+    Returns None when a filter has no word long enough for the trigram index.
+    """
+    clauses = []
+    for columns, text in filters.items():
+        words = [w for w in _words(text) if len(w) >= 3]
+        if not words:
+            return None
+        if fuzzy:
+            terms = " OR ".join(_quote(t) for w in words for t in _trigrams(w))
+        else:
+            terms = " AND ".join(_quote(w) for w in words)
+        clauses.append(f"{{{' '.join(columns)}}} : ({terms})")
+    return " AND ".join(clauses)
+
+
+def _similarity(word, tokens):
+    best = 0.0
+    for token in tokens:
+        if word in token:
+            return 1.0
+        best = max(best, SequenceMatcher(None, word, token).ratio())
+    return best
+
+
+def _fuzzy_ids(conn, index, filters, limit):
+    match = build_match(filters, fuzzy=True)
+    if match is None:
+        return []
+    fts = index["fts"]
+    cols = ", ".join(f"f.{c}" for c in index["columns"])
+    weights = ", ".join(str(w) for w in index["weights"])
+    candidates = conn.execute(
+        f"SELECT f.rowid AS id, {cols} FROM {fts} f WHERE {fts} MATCH ? "
+        f"ORDER BY bm25({fts}, {weights}) LIMIT ?",
+        (match, FUZZY_CANDIDATES)
+    ).fetchall()
+
+    # Re-rank the trigram candidates by how close every query word comes to a real word
+    scored = []
+    for row in candidates:
+        score = 1.0
+        for columns, text in filters.items():
+            tokens = _words(" ".join(str(row[c] or "") for c in columns))
+            for word in _words(text):
+                score = min(score, _similarity(word, tokens))
+        if score >= FUZZY_THRESHOLD:
+            scored.append((-score, row["id"]))
+    scored.sort()
+    return [rid for _, rid in scored[:limit]]
+
+
+def search(conn, kind, filters, columns, limit=SEARCH_LIMIT):
+    """
+    Searches doctors or clinics. `filters` maps a tuple of FTS column names to
+    the user's text, e.g. {("name", "specialization"): "cardio", ("city",): "mum"}.
+    Results are BM25-ranked; short queries fall back to a prefix LIKE and a
+    query with no exact hit falls back to typo-tolerant trigram matching.
+    """
+    index = INDEXES[kind]
+    filters = {cols: text.strip() for cols, text in filters.items() if text and text.strip()}
+    base = f"SELECT {columns} FROM {index['table']} {index['joins']}"
+    if not filters:
+        return conn.execute(f"{base} ORDER BY {index['order']} LIMIT ?", (limit,)).fetchall()
+
+    match = build_match(filters)
+    if match is None:
+        # Too short for trigrams: word-prefix match instead
+        clauses, params = [], []
+        for cols, text in filters.items():
+            ors = []
+            for col in cols:
+                ors.append(f"{index['like'][col]} LIKE ? OR {index['like'][col]} LIKE ?")
+                params += [f"{text}%", f"% {text}%"]
+            clauses.append("(" + " OR ".join(ors) + ")")
+        return conn.execute(
+            f"{base} WHERE {' AND '.join(clauses)} ORDER BY {index['order']} LIMIT ?",
+            params + [limit]
+        ).fetchall()
+
+    fts = index["fts"]
+    weights = ", ".join(str(w) for w in index["weights"])
+    rows = conn.execute(
+        f"SELECT {columns} FROM {fts} f JOIN {index['table']} ON {index['key']} = f.rowid {index['joins']} "
+        f"WHERE {fts} MATCH ? ORDER BY bm25({fts}, {weights}) LIMIT ?",
+        (match, limit)
+    ).fetchall()
+    if rows:
+        return rows
+
+    ids = _fuzzy_ids(conn, index, filters, limit)
+    if not ids:
+        return []
+    logger.info(f"[Search] No exact {kind} match for {filters}, using {len(ids)} fuzzy results")
+    placeholders = ", ".join("?" * len(ids))
+    found = conn.execute(
+        f"{base} WHERE {index['key']} IN ({placeholders})", ids
+    ).fetchall()
+    # Keep the similarity order
+    order = {rid: i for i, rid in enumerate(ids)}
+    return sorted(found, key=lambda r: order[r["id"]])
+
+
+def search_doctors(conn, q="", city="", specialization="", columns=DOCTOR_COLUMNS, limit=SEARCH_LIMIT):
+    return search(conn, "doctors", {
+        ("name", "specialization", "clinic"): q,
+        ("city",): city,
+        ("specialization",): specialization,
+    }, columns, limit)
+
+
+def search_clinics(conn, q="", city="", columns=CLINIC_COLUMNS, limit=SEARCH_LIMIT):
+    return search(conn, "clinics", {
+        ("name", "address"): q,
+        ("city",): city,
+    }, columns, limit)
@@ -2,7 +2,9 @@ import sqlite3, os
 
 from .doctors_data import doctors_data
 from .logg import logger
-import datetime
+from .db import apply_storage_profile
+from .migrations import migrate
+from .schedules import materialize
 
 BASE = os.path.dirname(__file__)
 DB = os.path.join('./data', 'clinicBook.db')
@@ -12,110 +14,37 @@ def ensure_schema(conn):
     # Enable foreign key support
     cur.execute('PRAGMA foreign_keys = ON;')
     
-    # Create tables if not exist
-    cur.executescript('''
-    CREATE TABLE IF NOT EXISTS clinics (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        city TEXT,
-        address TEXT,
-        phone TEXT,
-        average_rating REAL DEFAULT 0.0
-    );
-                      
-    CREATE TABLE IF NOT EXISTS doctors (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        clinic_id INTEGER,
-        name TEXT NOT NULL,
-        specialization TEXT,
-        fees INTEGER,
-        email TEXT UNIQUE NOT NULL,
-        password_hash TEXT,
-        phone TEXT,
-        about TEXT,
-        average_rating REAL DEFAULT 0.0,
-        FOREIGN KEY (clinic_id) REFERENCES clinics(id) ON DELETE SET NULL
-    );
-                      
-    CREATE TABLE IF NOT EXISTS slots (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        doctor_id INTEGER NOT NULL,
-        date TEXT NOT NULL,
-        time TEXT NOT NULL,
-        capacity INTEGER NOT NULL DEFAULT 5,
-        booked_count INTEGER DEFAULT 1,
-        FOREIGN KEY (doctor_id) REFERENCES doctors(id) ON DELETE CASCADE
-    );
-                      
-    CREATE TABLE IF NOT EXISTS patients (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        email TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL,
-        phone TEXT,
-        age INTEGER,
-        gender TEXT,
-        city TEXT
-    );
-
-    CREATE TABLE IF NOT EXISTS appointments (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        doctor_id INTEGER NOT NULL,
-        patient_id INTEGER NOT NULL,
-        slot_id INTEGER NOT NULL,
-        date TEXT NOT NULL,
-        status TEXT DEFAULT 'booked',
-        FOREIGN KEY (doctor_id) REFERENCES doctors(id) ON DELETE CASCADE,
-        FOREIGN KEY (patient_id) REFERENCES patients(id) ON DELETE CASCADE,
-        FOREIGN KEY (slot_id) REFERENCES slots(id) ON DELETE CASCADE
-    );
-
-    CREATE TABLE IF NOT EXISTS reviews (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        patient_id INTEGER NOT NULL,
-        doctor_id INTEGER,
-        clinic_id INTEGER,
-        rating INTEGER CHECK(rating >= 1 AND rating <= 5),
-        comment TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (patient_id) REFERENCES patients(id) ON DELETE CASCADE,
-        FOREIGN KEY (doctor_id) REFERENCES doctors(id) ON DELETE CASCADE,
-        FOREIGN KEY (clinic_id) REFERENCES clinics(id) ON DELETE CASCADE,
-        CHECK (
-            (doctor_id IS NOT NULL AND clinic_id IS NULL) OR
-            (doctor_id IS NULL AND clinic_id IS NOT NULL)
-        )
-    );
-    CREATE TABLE IF NOT EXISTS chat_history (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        user_type TEXT, -- 'patient' or 'doctor'
-        role TEXT,      -- 'user' or 'model'
-        message TEXT,
-        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-    );
-    
-    ''')
-    conn.commit()
+    # Same versioned schema as init_db.setup() (see src/migrations.py)
+    migrate(conn)
     logger.info(f"schema ensured in seeding.")
 
 
-def generate_slots(doctor_id, days=7):
-    """Generate slots for next N days."""
-    slots = []
-    today = datetime.date.today()
-    for i in range(days):
-        date = today + datetime.timedelta(days=i)
-        for time in ["10:00", "16:00"]:  # 2 slots per day
-            slots.append((doctor_id, date.isoformat(), time, 5))
-    logger.info(f"Slots generated for demo doctors.")
-    return slots
+# Weekly template for demo doctors: every day at 10:00 and 16:00, 5 patients each
+DEMO_SCHEDULE = [
+    {"weekdays": "0,1,2,3,4,5,6", "start_time": "10:00", "end_time": "10:30", "slot_minutes": 30, "capacity": 5},
+    {"weekdays": "0,1,2,3,4,5,6", "start_time": "16:00", "end_time": "16:30", "slot_minutes": 30, "capacity": 5},
+]
+
+
+def seed_schedule(cur, doctor_id):
+    """Adds the demo weekly schedule for a doctor that has no templates yet."""
+    cur.execute('SELECT COUNT(*) FROM schedule_templates WHERE doctor_id=?', (doctor_id,))
+    if cur.fetchone()[0]:
+        return
+    cur.executemany(
+        '''INSERT INTO schedule_templates (doctor_id, weekdays, start_time, end_time, slot_minutes, capacity)
+        VALUES (?, ?, ?, ?, ?, ?)''',
+        [(doctor_id, t["weekdays"], t["start_time"], t["end_time"], t["slot_minutes"], t["capacity"])
+         for t in DEMO_SCHEDULE]
+    )
 
 
 def seed():
     try:
         os.makedirs(os.path.join('./data'), exist_ok=True)
         conn = sqlite3.connect(DB)
+        conn.row_factory = sqlite3.Row
+        apply_storage_profile(conn)
         ensure_schema(conn)
         cur = conn.cursor()
     except Exception as e:
@@ -142,21 +71,17 @@ def seed():
             cur.execute('SELECT id FROM doctors WHERE email=?', (d['email'],))
             doctor_id = cur.fetchone()[0]
 
-            # Generate slots only if none exist yet
-            cur.execute('SELECT COUNT(*) FROM slots WHERE doctor_id=?', (doctor_id,))
-            if cur.fetchone()[0] == 0:
-                slots = generate_slots(doctor_id, days=7)
-                cur.executemany(
-                    '''INSERT INTO slots (doctor_id, date, time, capacity)
-                    VALUES (?, ?, ?, ?)''',
-                    slots
-                )
+            # Recurring schedule instead of hand-made slots
+            seed_schedule(cur, doctor_id)
 
         except Exception as e:
             print('Error', e)
             logger.error(e)
 
     conn.commit()
+
+    # Expand the templates into slots for the next week (idempotent)
+    materialize(conn, days=7)
     conn.close()
     logger.info(f'Seeding complete. DB at {DB}')
 
@@ -0,0 +1,222 @@
+import argparse
+import json
+import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+from flask import has_request_context, request
+
+from .logg import logger, REQUEST_ID_KEY
+from . import metrics
+
+# Opt-in slow-query log. With SLOW_QUERY_MS set (src/db.py), every statement
+# on a pooled connection (ProfiledCursor) that takes longer, executing plus
+# fetching, is written to SLOW_QUERY_LOG as one JSON line with its
+# parameters, the route it ran for and its EXPLAIN QUERY PLAN. The plan is
+# captured by a background thread on its own read-only connection, so the
+# request only pays for putting the entry on a queue.
+#
+#   SLOW_QUERY_MS=20 python app.py
+#   python -m src.slow_queries                 # worst statements, full scans flagged
+#   python -m src.slow_queries --fail-on-scan  # non-zero exit when a table is scanned (CI)
+
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", os.path.join("./logs", "slow_queries.jsonl"))
+# Parameters can be personal data (emails, names): keep them short
+SLOW_QUERY_PARAM_CHARS = int(os.getenv("SLOW_QUERY_PARAM_CHARS", "40"))
+
+_queue = queue.SimpleQueue()
+_worker_pid = None
+_worker_lock = threading.Lock()
+_plans = {}    # (path, sql) -> plan lines
+
+
+def _short(value):
+    text = repr(value)
+    return text if len(text) <= SLOW_QUERY_PARAM_CHARS else text[:SLOW_QUERY_PARAM_CHARS] + "..."
+
+
+def _params(params):
+    if isinstance(params, dict):
+        return {k: _short(v) for k, v in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [_short(v) for v in params]
+    return None
+
+
+def record(path, sql, params, elapsed, rows):
+    """Queues a statement that took `elapsed` seconds; called from the cursor, so it stays cheap."""
+    entry = {
+        "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "pid": os.getpid(),
+        "db": os.path.basename(path or ""),
+        "ms": round(elapsed * 1000, 2),
+        "rows": rows,
+        "statement": metrics.normalize_sql(sql),
+        "sql": " ".join(sql.split()),
+        "params": _params(params),
+    }
+    if has_request_context():
+        entry["request_id"] = request.environ.get(REQUEST_ID_KEY, "-")
+        entry["endpoint"] = request.endpoint or request.path
+    _queue.put((path, sql, params, entry))
+    _start_worker()
+
+
+def full_scans(plan):
+    """Tables read row by row: 'SCAN t', but not 'SCAN t USING (COVERING) INDEX' or a subquery/CTE."""
+    scans = []
+    for line in plan:
+        detail = line.strip()
+        # FTS5 lookups show up as "SCAN t VIRTUAL TABLE INDEX ..."
+        if detail.startswith("SCAN ") and " USING " not in detail and " VIRTUAL TABLE" not in detail:
+            table = detail.split()[1]
+            if not table.startswith(("(", "CONSTANT", "sqlite_")):
+                scans.append(table)
+    return scans
+
+
+def _null_params(sql):
+    # Placeholders for a statement logged without parameters (executemany)
+    names = re.findall(r"[:@$]([A-Za-z_]\w*)", sql)
+    if names:
+        return dict.fromkeys(names)
+    numbered = [int(n) for n in re.findall(r"\?(\d+)", sql)]
+    return [None] * (max(numbered) if numbered else sql.count("?"))
+
+
+def explain(conn, sql, params):
+    """EXPLAIN QUERY PLAN as indented lines, one per plan step."""
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", _null_params(sql) if params is None else params).fetchall()
+    depth = {0: -1}
+    lines = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node] + detail)
+    return lines
+
+
+def _connect(path, connections):
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        connections[path] = conn
+    return conn
+
+
+def _write(path, sql, params, entry, connections):
+    plan = _plans.get((path, sql))
+    if plan is None:
+        try:
+            plan = explain(_connect(path, connections), sql, params)
+        except sqlite3.Error as e:
+            plan = [f"(no plan: {e})"]
+        if len(_plans) < 1000:
+            _plans[(path, sql)] = plan
+    entry["plan"] = plan
+    entry["scans"] = full_scans(plan)
+    os.makedirs(os.path.dirname(SLOW_QUERY_LOG) or ".", exist_ok=True)
+    with open(SLOW_QUERY_LOG, "a") as f:
+        f.write(json.dumps(entry, default=str) + "\n")
+    scans = f" [SCAN {', '.join(entry['scans'])}]" if entry["scans"] else ""
+    logger.warning(f"[SlowQuery] {entry['ms']} ms, {entry['rows']} rows{scans}: {entry['statement'][:120]}")
+
+
+def _start_worker():
+    global _worker_pid
+    if _worker_pid == os.getpid():
+        return
+    with _worker_lock:
+        if _worker_pid == os.getpid():
+            return
+        _worker_pid = os.getpid()
+
+    def run():
+        connections = {}
+        while True:
+            path, sql, params, entry = _queue.get()
+            try:
+                _write(path, sql, params, entry, connections)
+            except Exception as e:
+                logger.error(f"[SlowQuery] Could not log a slow statement: {e}")
+
+    threading.Thread(target=run, name="slow-query-log", daemon=True).start()
+
+
+# Report
+def load(path):
+    entries = []
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    return entries
+
+
+def summarize(entries):
+    """Per statement: count, total/max ms, rows, endpoints, scanned tables and the latest plan; slowest total first."""
+    stats = {}
+    for e in entries:
+        s = stats.setdefault(e["statement"], {
+            "statement": e["statement"], "count": 0, "total_ms": 0.0, "max_ms": 0.0,
+            "rows": 0, "endpoints": set(), "scans": set(), "plan": [], "example": None,
+        })
+        s["count"] += 1
+        s["total_ms"] += e["ms"]
+        s["rows"] += e.get("rows") or 0
+        if e["ms"] >= s["max_ms"]:
+            s["max_ms"] = e["ms"]
+            s["example"] = {"sql": e.get("sql"), "params": e.get("params")}
+        if e.get("endpoint"):
+            s["endpoints"].add(e["endpoint"])
+        s["scans"].update(e.get("scans") or ())
+        s["plan"] = e.get("plan") or s["plan"]
+    return sorted(stats.values(), key=lambda s: -s["total_ms"])
+
+
+def report(entries, top=20):
+    summary = summarize(entries)
+    lines = [f"{len(entries)} slow statements, {len(summary)} distinct", ""]
+    lines.append(f"{'count':>6}{'total ms':>11}{'avg ms':>9}{'max ms':>9}{'avg rows':>10}  statement")
+    for s in summary[:top]:
+        flag = "  !! SCAN " + ", ".join(sorted(s["scans"])) if s["scans"] else ""
+        lines.append(
+            f"{s['count']:>6}{s['total_ms']:>11.1f}{s['total_ms'] / s['count']:>9.1f}{s['max_ms']:>9.1f}"
+            f"{s['rows'] / s['count']:>10.0f}  {s['statement'][:100]}{flag}"
+        )
+    for s in summary[:top]:
+        lines += ["", f"--- {s['statement'][:160]}"]
+        if s["endpoints"]:
+            lines.append(f"    endpoints: {', '.join(sorted(s['endpoints']))}")
+        if s["example"] and s["example"]["params"]:
+            lines.append(f"    slowest with params: {s['example']['params']}")
+        lines += [f"    {line}" for line in s["plan"]]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize the slow-query log (SLOW_QUERY_MS).")
+    parser.add_argument("--log", default=SLOW_QUERY_LOG, help="slow-query log (JSON lines)")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--fail-on-scan", action="store_true", help="exit 1 when any statement scans a whole table")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.log):
+        print(f"No slow-query log at {args.log} (run with SLOW_QUERY_MS set).")
+        return 0
+    entries = load(args.log)
+    print(report(entries, args.top))
+    scanning = [s for s in summarize(entries) if s["scans"]]
+    if args.fail_on_scan and scanning:
+        print(f"\n{len(scanning)} statement(s) scan whole tables.")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
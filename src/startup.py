@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+
+# Import-cost report for worker cold start:
+#
+#   python -m src.startup              # what `import app` costs, per package
+#   python -m src.startup src.gem 30   # any module, top 30 rows
+#
+# Runs the import in a fresh interpreter with `-X importtime` and sums the
+# self time of every module by top-level package.
+
+
+def measure(target="app"):
+    """Returns [(module, self_us, cumulative_us, depth), ...] for importing `target`."""
+    env = dict(os.environ)
+    env.setdefault("SECRET_KEY", "startup-report")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        capture_output=True, text=True, env=env,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        except ValueError:
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    if proc.returncode != 0 and not rows:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+    return rows
+
+
+def by_package(rows):
+    """{top-level package: (self_us, module_count)}, largest first."""
+    totals = {}
+    for name, self_us, _, _ in rows:
+        package = name.split(".")[0]
+        spent, count = totals.get(package, (0, 0))
+        totals[package] = (spent + self_us, count + 1)
+    return dict(sorted(totals.items(), key=lambda item: -item[1][0]))
+
+
+def report(target="app", top=20):
+    rows = measure(target)
+    total = sum(r[1] for r in rows)
+    lines = [f"import {target}: {total / 1000:.0f} ms over {len(rows)} modules", ""]
+    lines.append(f"{'package':<32}{'ms':>9}{'share':>8}{'modules':>9}")
+    for package, (spent, count) in list(by_package(rows).items())[:top]:
+        lines.append(f"{package:<32}{spent / 1000:>9.1f}{spent / total:>8.0%}{count:>9}")
+
+    # Project modules by cumulative time: shows which import pulls in what
+    own = {}
+    for name, _, cumulative, _ in rows:
+        if name == "app" or name == "src" or name.startswith("src."):
+            own[name] = max(own.get(name, 0), cumulative)
+    if own:
+        lines += ["", f"{'project module (cumulative)':<32}{'ms':>9}"]
+        for name, cumulative in sorted(own.items(), key=lambda item: -item[1])[:top]:
+            lines.append(f"{name:<32}{cumulative / 1000:>9.1f}")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    target = sys.argv[1] if len(sys.argv) > 1 else "app"
+    print(report(target, int(sys.argv[2]) if len(sys.argv) > 2 else 20))
@@ -0,0 +1,328 @@
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import sys
+import time
+
+from werkzeug.security import generate_password_hash
+
+from .doctors_data import doctors_data
+from .db import apply_storage_profile
+from .seed import ensure_schema
+from .schedules import expand
+from .availability import REBUILD_SQL
+from .ratings import RECONCILE_SQL
+
+# Synthetic databases for capacity planning and route benchmarks:
+#
+#   python -m src.synthetic --db ./data/bench.db --doctors 1000 --months 6
+#   python -m src.synthetic --db ./data/clinicBook.db --force   # replace the app's database
+#
+# Every doctor gets a weekly template (like src/seed.py) and its slots from
+# `--months` back to `--days-ahead` forward, expanded with
+# schedules.expand(). Past slots are booked to about `--fill`, with
+# completed or cancelled appointments; upcoming ones at half that. Rows are
+# written with executemany() in batches of BATCH rows, all in one
+# transaction, with the indexes and triggers of the big tables created only
+# afterwards (availability and rating aggregates are then computed in one
+# pass). The same --seed and --today always give the same database.
+#
+# Every patient and doctor can log in: patient<N>@example.com and
+# doctor<N>@example.com with --password.
+
+BATCH = 50000
+# Tables whose indexes and triggers are dropped while loading and recreated after
+BULK_TABLES = ("slots", "appointments", "reviews", "chat_history")
+
+FIRST_NAMES = [
+    "Aarav", "Aditi", "Akash", "Ananya", "Arjun", "Deepa", "Divya", "Farhan", "Gaurav", "Ishaan",
+    "Kavya", "Karan", "Meera", "Neha", "Nikhil", "Pooja", "Priya", "Rahul", "Riya", "Rohan",
+    "Sanjay", "Sara", "Shreya", "Sneha", "Suresh", "Tanvi", "Varun", "Vikram", "Yash", "Zoya",
+]
+LAST_NAMES = [
+    "Agarwal", "Bose", "Chopra", "Das", "Desai", "Gupta", "Iyer", "Jain", "Joshi", "Kapoor",
+    "Khan", "Kumar", "Menon", "Mehta", "Nair", "Patel", "Rao", "Reddy", "Shah", "Sharma",
+    "Singh", "Verma",
+]
+CLINIC_WORDS = ["City", "Care", "Life", "Sunrise", "Green", "Apollo", "Lotus", "Hope", "Metro", "Prime"]
+CLINIC_KINDS = ["Clinic", "Hospital", "Health Centre", "Medical Centre", "Polyclinic"]
+STREETS = ["MG Road", "Station Road", "Park Street", "Ring Road", "Main Bazaar", "Civil Lines", "Sector 12"]
+COMMENTS = [
+    "Very helpful and patient.", "Waited a long time.", "Clear explanation of the treatment.",
+    "Friendly staff.", "Would visit again.", "Expensive but good.", "Did not listen properly.",
+]
+CHAT_QUESTIONS = [
+    "Which doctor should I visit for chest pain?", "Show my appointments.", "Any dermatologist in Delhi tomorrow?",
+    "What is the refund policy?", "Book the first free slot.", "Cancel my appointment.",
+]
+
+SPECIALIZATIONS = sorted({d["specialization"] for d in doctors_data})
+CITIES = sorted({d["city"] for d in doctors_data})
+
+
+def _person(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def _phone(rng):
+    return f"+91-9{rng.randrange(10 ** 8, 10 ** 9)}"
+
+
+class Writer:
+    """executemany() in batches of BATCH rows per statement."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = {}
+        self.counts = {}
+
+    def batch(self, sql):
+        """The pending rows of `sql`, for appending to directly in hot loops."""
+        return self.rows.setdefault(sql, [])
+
+    def add(self, sql, row):
+        rows = self.batch(sql)
+        rows.append(row)
+        if len(rows) >= BATCH:
+            self.flush(sql)
+
+    def flush_full(self):
+        for sql, rows in list(self.rows.items()):
+            if len(rows) >= BATCH:
+                self.flush(sql)
+
+    def flush(self, sql=None):
+        for statement in [sql] if sql else list(self.rows):
+            rows = self.rows.pop(statement, [])
+            if rows:
+                self.conn.executemany(statement, rows)
+                table = statement.split()[2]
+                self.counts[table] = self.counts.get(table, 0) + len(rows)
+
+
+def generate(conn, clinics=100, doctors=1000, patients=20000, slots_per_day=8, capacity=1,
+             months=6, days_ahead=28, fill=0.7, reviews=50000, chats=20000,
+             seed=42, today=None, password="password"):
+    """Fills an empty, migrated database; returns {table: rows written}."""
+    rng = random.Random(seed)
+    today = today or datetime.date.today()
+    first_day = today - datetime.timedelta(days=months * 30)
+    last_day = today + datetime.timedelta(days=days_ahead - 1)
+    password_hash = generate_password_hash(password)
+    w = Writer(conn)
+
+    for i in range(1, clinics + 1):
+        w.add(
+            "INSERT INTO clinics (id, name, city, address, phone) VALUES (?, ?, ?, ?, ?)",
+            (i, f"{rng.choice(CLINIC_WORDS)} {rng.choice(CLINIC_KINDS)} {i}", rng.choice(CITIES),
+             f"{rng.randrange(1, 300)}, {rng.choice(STREETS)}", _phone(rng))
+        )
+    w.flush()
+
+    for i in range(1, doctors + 1):
+        specialization = rng.choice(SPECIALIZATIONS)
+        w.add(
+            '''INSERT INTO doctors (id, clinic_id, name, specialization, fees, email, password_hash, phone, about)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            (i, rng.randrange(1, clinics + 1), f"Dr. {_person(rng)}", specialization,
+             rng.randrange(300, 2050, 50), f"doctor{i}@example.com", password_hash, _phone(rng),
+             f"{specialization} with {rng.randrange(2, 35)} years of experience.")
+        )
+    w.flush()
+
+    for i in range(1, patients + 1):
+        w.add(
+            '''INSERT INTO patients (id, name, email, age, gender, phone, city, password_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+            (i, _person(rng), f"patient{i}@example.com", rng.randrange(1, 90), rng.choice("MF"),
+             _phone(rng), rng.choice(CITIES), password_hash)
+        )
+    w.flush()
+
+    # Same shape as the seed.py demo templates: one block of `slots_per_day`
+    # half-hour slots, Monday to Saturday. Every doctor has the same calendar,
+    # so it is expanded once.
+    end = (datetime.datetime(2000, 1, 1, 9, 0) + datetime.timedelta(minutes=30 * slots_per_day)).strftime("%H:%M")
+    template = {
+        "doctor_id": 0, "weekdays": "0,1,2,3,4,5", "start_time": "09:00",
+        "end_time": end, "slot_minutes": 30, "capacity": capacity,
+    }
+    today_iso = today.isoformat()
+    calendar = [
+        (date, slot_time, seats, fill if date < today_iso else fill / 2, date < today_iso)
+        for _, date, slot_time, seats in expand(template, first_day, last_day)
+    ]
+    slot_rows = w.batch("INSERT INTO slots (id, doctor_id, date, time, capacity, booked_count) VALUES (?, ?, ?, ?, ?, ?)")
+    appointment_rows = w.batch(
+        '''INSERT INTO appointments (patient_id, doctor_id, slot_id, date, status, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)'''
+    )
+    # random() is several times cheaper than randrange() in a loop this hot
+    random_share = rng.random
+    slot_id = 0
+    for doctor_id in range(1, doctors + 1):
+        w.add(
+            '''INSERT INTO schedule_templates
+            (doctor_id, weekdays, start_time, end_time, slot_minutes, capacity, materialized_until)
+            VALUES (?, ?, ?, ?, ?, ?, ?)''',
+            (doctor_id, template["weekdays"], "09:00", end, 30, capacity, last_day.isoformat())
+        )
+        for date, slot_time, seats, rate, past in calendar:
+            slot_id += 1
+            booked = 0
+            if seats == 1:
+                chosen = (1 + int(random_share() * patients),)
+            else:
+                chosen = rng.sample(range(1, patients + 1), seats)
+            for patient_id in chosen:
+                if random_share() >= rate:
+                    continue
+                status = ("cancelled" if random_share() < 0.1 else "completed") if past else "booked"
+                booked += status != "cancelled"
+                appointment_rows.append((patient_id, doctor_id, slot_id, date, status, f"{date} 08:00:00"))
+            slot_rows.append((slot_id, doctor_id, date, slot_time, seats, booked))
+        if len(slot_rows) >= BATCH or len(appointment_rows) >= BATCH:
+            w.flush_full()
+            slot_rows = w.batch("INSERT INTO slots (id, doctor_id, date, time, capacity, booked_count) VALUES (?, ?, ?, ?, ?, ?)")
+            appointment_rows = w.batch(
+                '''INSERT INTO appointments (patient_id, doctor_id, slot_id, date, status, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)'''
+            )
+    w.flush()
+
+    span = (today - first_day).days or 1
+    for _ in range(reviews):
+        on_doctor = rng.random() < 0.8
+        created = first_day + datetime.timedelta(days=rng.randrange(span))
+        w.add(
+            '''INSERT INTO reviews (patient_id, doctor_id, clinic_id, rating, comment, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)''',
+            (rng.randrange(1, patients + 1),
+             rng.randrange(1, doctors + 1) if on_doctor else None,
+             None if on_doctor else rng.randrange(1, clinics + 1),
+             rng.choices((1, 2, 3, 4, 5), (1, 1, 2, 4, 4))[0], rng.choice(COMMENTS),
+             f"{created.isoformat()} 12:00:00")
+        )
+    w.flush()
+
+    # Conversations of 2-10 messages until `chats` messages are written
+    written = 0
+    while written < chats:
+        user_id = rng.randrange(1, patients + 1)
+        day = first_day + datetime.timedelta(days=rng.randrange(span))
+        for turn in range(min(rng.randrange(1, 6), (chats - written + 1) // 2)):
+            stamp = f"{day.isoformat()} 10:{turn:02d}:00"
+            w.add(
+                "INSERT INTO chat_history (user_id, user_type, role, message, timestamp) VALUES (?, ?, ?, ?, ?)",
+                (user_id, "patient", "user", rng.choice(CHAT_QUESTIONS), stamp)
+            )
+            w.add(
+                "INSERT INTO chat_history (user_id, user_type, role, message, timestamp) VALUES (?, ?, ?, ?, ?)",
+                (user_id, "patient", "model", f"Here is what I found [ID: {rng.randrange(1, doctors + 1)}].", stamp)
+            )
+            written += 2
+    w.flush()
+    return w.counts
+
+
+def _remove(path):
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def build(path, force=False, **options):
+    if os.path.exists(path):
+        if not force:
+            raise FileExistsError(f"{path} exists; pass --force to replace it")
+        _remove(path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    conn = sqlite3.connect(path)
+    try:
+        counts = _build(conn, **options)
+    except BaseException:
+        # With journal_mode=OFF nothing can be rolled back, and the indexes and
+        # triggers may be gone: a half-built file is worse than none
+        conn.close()
+        _remove(path)
+        raise
+    conn.close()
+    return counts
+
+
+def _build(conn, **options):
+    conn.row_factory = sqlite3.Row
+    ensure_schema(conn)
+    # A throwaway file until the build finishes: no journal, no fsync
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-200000")
+    conn.execute("PRAGMA foreign_keys=OFF")
+    conn.commit()
+
+    # Building an index once is far cheaper than updating it row by row
+    deferred = conn.execute(
+        f'''SELECT type, name, sql FROM sqlite_master
+        WHERE type IN ('index', 'trigger') AND sql IS NOT NULL
+          AND tbl_name IN ({", ".join("?" * len(BULK_TABLES))})''',
+        BULK_TABLES
+    ).fetchall()
+    for kind, name, _ in deferred:
+        conn.execute(f"DROP {kind.upper()} {name}")
+
+    conn.execute("BEGIN")
+    counts = generate(conn, **options)
+    conn.commit()
+
+    for _, _, sql in deferred:
+        conn.execute(sql)
+    # What the dropped triggers would have maintained
+    conn.executescript(f"BEGIN;\n{REBUILD_SQL}\n{RECONCILE_SQL}\nCOMMIT;")
+    # Fresh statistics for the planner (sampled, like PRAGMA optimize), then
+    # the normal storage profile (WAL)
+    conn.execute("PRAGMA analysis_limit=1000")
+    conn.execute("ANALYZE")
+    conn.commit()
+    apply_storage_profile(conn)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a large synthetic ClinicBook database.")
+    parser.add_argument("--db", default=os.path.join("./data", "bench.db"))
+    parser.add_argument("--force", action="store_true", help="replace the database if it exists")
+    parser.add_argument("--clinics", type=int, default=100)
+    parser.add_argument("--doctors", type=int, default=1000)
+    parser.add_argument("--patients", type=int, default=20000)
+    parser.add_argument("--slots-per-day", type=int, default=8, help="half-hour slots per working day (Mon-Sat)")
+    parser.add_argument("--capacity", type=int, default=1, help="patients per slot")
+    parser.add_argument("--months", type=int, default=6, help="months of appointment history")
+    parser.add_argument("--days-ahead", type=int, default=28, help="days of upcoming slots")
+    parser.add_argument("--fill", type=float, default=0.7, help="share of past seats booked")
+    parser.add_argument("--reviews", type=int, default=50000)
+    parser.add_argument("--chats", type=int, default=20000, help="chat history messages")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--today", type=datetime.date.fromisoformat, default=None,
+                        help="YYYY-MM-DD the data is built around (default: today)")
+    parser.add_argument("--password", default="password", help="password of every generated user")
+    args = vars(parser.parse_args(argv))
+
+    path, force = args.pop("db"), args.pop("force")
+    started = time.perf_counter()
+    try:
+        counts = build(path, force=force, **{k.replace("-", "_"): v for k, v in args.items()})
+    except FileExistsError as e:
+        print(e)
+        return 1
+    elapsed = time.perf_counter() - started
+    for table, n in counts.items():
+        print(f"{table:<20}{n:>12,}")
+    print(f"Built {path} ({os.path.getsize(path) / 2 ** 20:.0f} MB) in {elapsed:.1f} s.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+from collections import namedtuple
+
+from .logg import logger
+from . import metrics
+
+# Typed dispatch table for the Gemini tool loop. Built once from
+# tools_config.json plus an explicit {name: function} map, so only declared
+# tools can ever be called and their arguments are checked before the call.
+
+Tool = namedtuple("Tool", ["name", "func", "params", "required"])
+
+# Tool results go back into the prompt, so their size is capped: tools fetch at
+# most TOOL_FETCH_ROWS rows, the model sees the first TOOL_MAX_ROWS of them in
+# a columnar text form, and any result is cut at TOOL_MAX_CHARS characters.
+TOOL_FETCH_ROWS = int(os.getenv("TOOL_FETCH_ROWS", "100"))
+TOOL_MAX_ROWS = int(os.getenv("TOOL_MAX_ROWS", "20"))
+TOOL_MAX_CHARS = int(os.getenv("TOOL_MAX_CHARS", "4000"))
+
+
+class ToolArgumentError(ValueError):
+    pass
+
+
+def _to_str(value):
+    if isinstance(value, (dict, list)):
+        raise ToolArgumentError("expected a string")
+    return str(value).strip()
+
+
+def _to_int(value):
+    # The model often sends integers as floats (5.0) or digit strings ("5")
+    if isinstance(value, bool):
+        raise ToolArgumentError("expected an integer")
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ToolArgumentError("expected an integer")
+        return int(value)
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        raise ToolArgumentError("expected an integer")
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ToolArgumentError("expected a number")
+
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    if str(value).strip().lower() in ("true", "1", "yes"):
+        return True
+    if str(value).strip().lower() in ("false", "0", "no"):
+        return False
+    raise ToolArgumentError("expected a boolean")
+
+
+COERCERS = {
+    "string": _to_str,
+    "integer": _to_int,
+    "number": _to_float,
+    "boolean": _to_bool,
+}
+
+
+def build_registry(declarations, functions):
+    """
+    Returns {name: Tool} for every declaration that has an implementation in
+    `functions`, with one precompiled coercer per parameter.
+    """
+    registry = {}
+    for decl in declarations:
+        name = decl.get("name")
+        func = functions.get(name)
+        if func is None:
+            logger.warning(f"[Tools] '{name}' is declared but has no implementation")
+            continue
+        schema = decl.get("parameters") or {}
+        params = {
+            param: COERCERS.get((spec or {}).get("type", "string"), _to_str)
+            for param, spec in (schema.get("properties") or {}).items()
+        }
+        registry[name] = Tool(name, func, params, tuple(schema.get("required") or ()))
+
+    for name in set(functions) - set(registry):
+        logger.warning(f"[Tools] '{name}' is implemented but not declared in tools_config.json")
+    return registry
+
+
+def validate_args(tool, args):
+    """Coerces `args` to the declared types; unknown arguments are dropped."""
+    missing = [p for p in tool.required if args.get(p) in (None, "")]
+    if missing:
+        raise ToolArgumentError(f"missing required argument(s): {', '.join(missing)}")
+    clean = {}
+    for param, coerce in tool.params.items():
+        if param in args and args[param] is not None:
+            try:
+                clean[param] = coerce(args[param])
+            except ToolArgumentError as e:
+                raise ToolArgumentError(f"{param}: {e}")
+    return clean
+
+
+# Per-tool call counters: calls, errors, total/max milliseconds
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _record(name, elapsed_ms, failed):
+    with _stats_lock:
+        s = _stats.setdefault(name, {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+        s["calls"] += 1
+        s["errors"] += int(failed)
+        s["total_ms"] += elapsed_ms
+        s["max_ms"] = max(s["max_ms"], elapsed_ms)
+    metrics.observe("tool_call_duration_seconds", elapsed_ms / 1000, tool=name)
+    if failed:
+        metrics.inc("tool_errors_total", tool=name)
+
+
+def call_tool(registry, name, args):
+    """Validates and runs one tool call; errors come back as text for the model."""
+    tool = registry.get(name)
+    if tool is None:
+        logger.warning(f"[Tools] Rejected call to unknown tool '{name}'")
+        return "Error: Tool function not found."
+
+    start = time.perf_counter()
+    failed = False
+    try:
+        result = tool.func(**validate_args(tool, args or {}))
+    except ToolArgumentError as e:
+        failed = True
+        result = f"Tool Argument Error: {e}"
+    except Exception as e:
+        failed = True
+        result = f"Tool Execution Error: {e}"
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    _record(name, elapsed_ms, failed)
+    logger.info(f"[Tools] {name} took {elapsed_ms:.1f} ms")
+    return result
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    return " ".join(str(value).split()).replace("|", "/")
+
+
+def format_result(result, max_rows=TOOL_MAX_ROWS, max_chars=TOOL_MAX_CHARS):
+    """
+    Compact text for a tool result. Rows (a list of dicts) become one header
+    line and one '|'-separated line per row instead of a repr of every dict:
+
+        3 rows; columns: id|name|fees
+        4|Dr. Rao|500
+        ...
+        (12 more rows not shown, ask the user to narrow the search)
+    """
+    if isinstance(result, dict):
+        result = [result]
+    if not isinstance(result, list):
+        text = str(result)
+    elif not result:
+        text = "No matching records."
+    elif not all(isinstance(row, dict) for row in result):
+        text = "\n".join(_cell(item) for item in result[:max_rows])
+    else:
+        columns = list(dict.fromkeys(key for row in result[:max_rows] for key in row))
+        # A full fetch means the query itself was cut off too
+        count = f"{len(result)}+ rows" if len(result) >= TOOL_FETCH_ROWS else f"{len(result)} row{'s' * (len(result) != 1)}"
+        lines = [f"{count}; columns: {'|'.join(columns)}"]
+        lines += ["|".join(_cell(row.get(c)) for c in columns) for row in result[:max_rows]]
+        text = "\n".join(lines)
+    if isinstance(result, list) and len(result) > max_rows:
+        more = len(result) - max_rows
+        more = f"{more}+" if len(result) >= TOOL_FETCH_ROWS else more
+        text += f"\n({more} more rows not shown, ask the user to narrow the search)"
+
+    if len(text) > max_chars:
+        cut = text.rfind("\n", 0, max_chars)
+        cut = cut if cut > 0 else max_chars
+        text = text[:cut] + f"\n(truncated, {len(text) - cut} more characters)"
+    return text
+
+
+def tool_stats():
+    with _stats_lock:
+        return {
+            name: dict(s, avg_ms=round(s["total_ms"] / s["calls"], 2) if s["calls"] else 0.0)
+            for name, s in _stats.items()
+        }